@@ -1,7 +1,40 @@
 #!/usr/bin/env python3
 
-from . import mcp3901_register
-from . import mcp3911_register
-from .backends import SPI_pigpio
-from .mcp3901 import MCP3901
-from .mcp3911 import MCP3911
+"""
+Drivers and backends are imported on first access, so importing register definitions or the
+simulated backend does not load pigpio, the spi_rpi extension or numpy.
+"""
+
+import importlib
+
+_SUBMODULES = frozenset(['mcp3901_register', 'mcp3911_register'])
+
+_ATTRIBUTES = {
+    'Boxcar': '.decimate',
+    'CIC': '.decimate',
+    'Calibration': '.calibration',
+    'FIR': '.decimate',
+    'MCP3901': '.mcp3901',
+    'MCP3911': '.mcp3911',
+    'MultiADC': '.multi',
+    'Recording': '.recording',
+    'RunningStats': '.running_stats',
+    'SPI_pigpio': '.backends',
+    'SPI_spidev': '.backends',
+}
+
+__all__ = sorted(_SUBMODULES) + sorted(_ATTRIBUTES)
+
+
+def __getattr__(name: str):
+    if name in _SUBMODULES:
+        return importlib.import_module('.' + name, __name__)
+    if name not in _ATTRIBUTES:
+        raise AttributeError('module {!r} has no attribute {!r}'.format(__name__, name))
+    value = getattr(importlib.import_module(_ATTRIBUTES[name], __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
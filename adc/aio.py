@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+
+"""
+asyncio interface
+
+Captures run on the backend's background capture and wake the event loop through
+Backend.capture_fileno(), so no thread is used per call. One lock per device is held by
+captures, streams and register writes, so a register write waits for an in-flight stream
+to be closed. Register reads are single SPI transfers and are not serialized.
+"""
+
+import asyncio
+
+from . import mcp3901_register
+from .backends.backend import Backend, new_buffer
+from .mcp3901 import MCP3901
+from .mcp3901_register import Config1Reg, Config2Reg
+from .mcp3911 import MCP3911
+from .mcp3911_register import ConfigReg, GainReg, StatusComReg
+
+
+async def _wait_capture(backend: Backend, min_samples: int, timeout: float = None) -> None:
+    """Wait until min_samples captured samples are available or the capture stops"""
+    loop = asyncio.get_running_loop()
+    fd = backend.capture_fileno()
+    ready = loop.create_future()
+
+    backend.arm_capture(min_samples)
+    loop.add_reader(fd, lambda: ready.done() or ready.set_result(None))
+    try:
+        await asyncio.wait_for(ready, timeout)
+    finally:
+        loop.remove_reader(fd)
+
+
+class AsyncStream(object):
+    """
+    Continuous acquisition as an async iterator of fixed-size sample blocks.
+    Holds the device lock from the first block until it is closed; use it with async with.
+    Blocks alternate between two buffers as in adc.stream.Stream.
+    """
+
+    def __init__(self, lock: asyncio.Lock, backend: Backend, addr: int, byte_width: int, block_size: int,
+                 capacity: int = None, timeout: float = None, correct=None):
+        """correct, a function correcting a block in place, is applied to each block"""
+        assert block_size > 0, 'block_size must be positive'
+
+        self.backend = backend
+        self.block_size = block_size
+        self.timeout = timeout
+        self.correct = correct
+        self._lock = lock
+        self._capture_args = (addr, byte_width, capacity or 8 * block_size)
+        self._buffers = [new_buffer(block_size, byte_width), new_buffer(block_size, byte_width)]
+        self._index = 0
+        self._started = False
+        self._closed = False
+
+    @property
+    def dropped(self) -> int:
+        """Number of samples dropped because the consumer fell behind"""
+        return self.backend.capture_dropped() if self._started else 0
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self._closed:
+            raise StopAsyncIteration
+
+        if not self._started:
+            await self._lock.acquire()
+            try:
+                self.backend.start_capture(*self._capture_args)
+            except BaseException:
+                self._lock.release()
+                raise
+            self._started = True
+
+        block = self._buffers[self._index]
+        await _wait_capture(self.backend, self.block_size, self.timeout)
+        # raises the error the capture stopped on once the samples before it were returned
+        n = self.backend.read_capture(block, self.block_size, 0)
+        if n < self.block_size:
+            # the capture stopped, the samples left make a last, shorter block
+            if n == 0:
+                raise StopAsyncIteration
+            block = memoryview(block)[:n]
+
+        if self.correct is not None:
+            self.correct(block)
+        self._index ^= 1
+        return block
+
+    async def aclose(self) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        if self._started:
+            try:
+                self.backend.stop_capture()
+            finally:
+                self._lock.release()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.aclose()
+
+
+class _AsyncADC(object):
+
+    def __init__(self, adc):
+        self.adc = adc
+        self.backend = adc.backend
+        self._lock = asyncio.Lock()
+
+    async def read_data_array(self, length: int, ch=0, width=None, out=None, timeout: float = None):
+        """Read length samples of a channel without blocking the event loop"""
+        addr, byte_width = self.adc.data_address(ch, width or self.adc.data_width(ch))
+        if out is None:
+            out = new_buffer(length, byte_width)
+
+        async with self._lock:
+            self.backend.start_capture(addr, byte_width, length, length)
+            try:
+                await _wait_capture(self.backend, length, timeout)
+                n = self.backend.read_capture(out, length, 0)
+                if n < length:
+                    # raises the error the capture stopped on
+                    self.backend.read_capture(memoryview(out)[n:], 1, 0)
+                    raise RuntimeError('the capture stopped after {} of {} samples'.format(n, length))
+            finally:
+                self.backend.stop_capture()
+
+        correct = self.adc._corrector(ch, 8 * byte_width)
+        if correct is not None:
+            correct(out)
+        return out
+
+    async def read_data(self, ch=0, width=None, timeout: float = None) -> int:
+        return (await self.read_data_array(1, ch, width, timeout=timeout))[0]
+
+    def stream(self, block_size: int, ch=0, width=None, capacity: int = None, timeout: float = None) -> AsyncStream:
+        """Acquire a channel continuously; iterate with async for inside async with"""
+        addr, byte_width = self.adc.data_address(ch, width or self.adc.data_width(ch))
+        return AsyncStream(self._lock, self.backend, addr, byte_width, block_size, capacity, timeout,
+                           self.adc._corrector(ch, 8 * byte_width))
+
+    async def _write(self, write, reg) -> None:
+        async with self._lock:
+            write(reg)
+
+    def close(self):
+        self.adc.close()
+
+
+class AsyncMCP3911(_AsyncADC):
+    """asyncio interface of MCP3911"""
+
+    def __init__(self, backend: Backend, cache: bool = False):
+        super().__init__(MCP3911(backend, cache))
+
+    async def read_reg_gain(self) -> GainReg:
+        return self.adc.read_reg_gain()
+
+    async def read_reg_status_com(self) -> StatusComReg:
+        return self.adc.read_reg_status_com()
+
+    async def read_reg_config(self) -> ConfigReg:
+        return self.adc.read_reg_config()
+
+    async def write_reg_gain(self, reg: GainReg) -> None:
+        await self._write(self.adc.write_reg_gain, reg)
+
+    async def write_reg_status_com(self, reg: StatusComReg) -> None:
+        await self._write(self.adc.write_reg_status_com, reg)
+
+    async def write_reg_config(self, reg: ConfigReg) -> None:
+        await self._write(self.adc.write_reg_config, reg)
+
+
+class AsyncMCP3901(_AsyncADC):
+    """asyncio interface of MCP3901"""
+
+    def __init__(self, backend: Backend, cache: bool = False):
+        super().__init__(MCP3901(backend, cache))
+
+    async def read_reg_gain(self) -> mcp3901_register.GainReg:
+        return self.adc.read_reg_gain()
+
+    async def read_reg_status_com(self) -> mcp3901_register.StatusComReg:
+        return self.adc.read_reg_status_com()
+
+    async def read_reg_config1(self) -> Config1Reg:
+        return self.adc.read_reg_config1()
+
+    async def read_reg_config2(self) -> Config2Reg:
+        return self.adc.read_reg_config2()
+
+    async def write_reg_gain(self, reg: mcp3901_register.GainReg) -> None:
+        await self._write(self.adc.write_reg_gain, reg)
+
+    async def write_reg_status_com(self, reg: mcp3901_register.StatusComReg) -> None:
+        await self._write(self.adc.write_reg_status_com, reg)
+
+    async def write_reg_config1(self, reg: Config1Reg) -> None:
+        await self._write(self.adc.write_reg_config1, reg)
+
+    async def write_reg_config2(self, reg: Config2Reg) -> None:
+        await self._write(self.adc.write_reg_config2, reg)
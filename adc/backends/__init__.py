@@ -1,3 +1,31 @@
 #!/usr/bin/env python3
 
-from .spi_pigpio import SPI_pigpio
+"""
+Backends are imported on first access; SPI_pigpio and SPI_pigpiod need pigpio installed.
+"""
+
+import importlib
+
+_ATTRIBUTES = {
+    'Backend': '.backend',
+    'Wait': '.backend',
+    'SimulatedBackend': '.simulated',
+    'ReplayBackend': '.replay',
+    'SPI_spidev': '.spi_spidev',
+    'SPI_pigpio': '.spi_pigpio',
+    'SPI_pigpiod': '.spi_pigpio',
+}
+
+__all__ = sorted(_ATTRIBUTES)
+
+
+def __getattr__(name: str):
+    if name not in _ATTRIBUTES:
+        raise AttributeError('module {!r} has no attribute {!r}'.format(__name__, name))
+    value = getattr(importlib.import_module(_ATTRIBUTES[name], __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
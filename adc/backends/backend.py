@@ -1,6 +1,186 @@
 #!/usr/bin/env python3
 
+import os
+import threading
 from abc import ABCMeta, abstractmethod
+from array import array
+from collections import namedtuple
+from enum import IntEnum
+
+# The extension and numpy are only imported on first use by _load_spi_rpi() and _load_numpy(),
+# so importing the package stays fast and touches no hardware library; None if unavailable
+_UNLOADED = object()
+spi_rpi = _UNLOADED
+numpy = _UNLOADED
+
+
+def _load_spi_rpi():
+    global spi_rpi
+    if spi_rpi is _UNLOADED:
+        try:
+            from .ext import spi_rpi as module
+        except ImportError:
+            module = None
+        spi_rpi = module
+    return spi_rpi
+
+
+def _load_numpy():
+    global numpy
+    if numpy is _UNLOADED:
+        try:
+            import numpy as module
+        except ImportError:
+            module = None
+        numpy = module
+    return numpy
+
+
+class Wait(IntEnum):
+    """Strategy for waiting on the data ready pin"""
+    spin = 0
+    """Busy-read the pin level; lowest latency, keeps one core at 100%"""
+    spin_poll = 1
+    """Busy-read up to a spin budget, then sleep a poll interval between reads"""
+    event = 2
+    """Sleep in poll() on falling edge events from the GPIO character device"""
+
+
+def new_buffer(length: int, byte_width: int = 3) -> array:
+    """Allocate a zero-filled sample buffer, int16 for 16-bit data and int32 for 24-bit data"""
+    if byte_width == 2:
+        return array('h', bytes(2 * length))
+    return array('i', bytes(4 * length))
+
+
+def new_float_buffer(length: int) -> array:
+    """Allocate a zero-filled float64 buffer for decimated samples"""
+    return array('d', bytes(8 * length))
+
+
+def new_timestamps(length: int) -> array:
+    """Allocate a zero-filled int64 buffer for data ready times in CLOCK_MONOTONIC nanoseconds"""
+    return array('q', bytes(8 * length))
+
+
+Gaps = namedtuple('Gaps', 'missed indices counts')
+Gaps.__doc__ = """
+Missed conversions in a run of samples: missed is their total, indices the positions of the
+samples that follow a gap, and counts the number of conversions missed before each of them.
+"""
+
+
+def find_gaps(timestamps, period_ns: float, tolerance: float = 0.5) -> Gaps:
+    """
+    Find conversions missed between consecutive samples from their data ready times.
+    An interval longer than period_ns * (1 + tolerance) is a gap of round(interval / period_ns) - 1
+    conversions, at least one.
+    """
+    limit = period_ns * (1 + tolerance)
+    np = _load_numpy()
+    if np is not None:
+        intervals = np.diff(np.frombuffer(timestamps, dtype=np.int64))
+        indices = np.flatnonzero(intervals > limit)
+        counts = np.maximum(np.rint(intervals[indices] / period_ns).astype(np.int64) - 1, 1)
+        return Gaps(int(counts.sum()), (indices + 1).tolist(), counts.tolist())
+
+    indices = []
+    counts = []
+    for i in range(1, len(timestamps)):
+        interval = timestamps[i] - timestamps[i - 1]
+        if interval > limit:
+            indices.append(i)
+            counts.append(max(round(interval / period_ns) - 1, 1))
+    return Gaps(sum(counts), indices, counts)
+
+
+class LatencyHistogram(object):
+    """
+    Log-linear histogram of the time from a data ready edge to the end of the SPI frame that
+    read its sample, as (low_ns, high_ns, count) buckets. Bucket width is 1/8 of the power of
+    two they fall in, so values are within 12.5%.
+    """
+
+    def __init__(self, buckets=()):
+        self.buckets = [tuple(b) for b in buckets]
+
+    @property
+    def count(self) -> int:
+        return sum(b[2] for b in self.buckets)
+
+    def percentile(self, p: float) -> int:
+        """Upper bound in ns of the bucket holding the p-th percentile, 0 if empty"""
+        assert 0 <= p <= 100, 'p must be between 0 and 100'
+        rank = p / 100 * self.count
+        seen = 0
+        for low, high, count in self.buckets:
+            seen += count
+            if seen >= rank:
+                return high
+        return 0
+
+    @property
+    def mean(self) -> float:
+        """Mean of the bucket midpoints, 0 if empty"""
+        count = self.count
+        return sum((low + high) / 2 * n for low, high, n in self.buckets) / count if count else 0.0
+
+    def __repr__(self):
+        return '<LatencyHistogram count={} p50={} p99={} max={}>'.format(
+            self.count, self.percentile(50), self.percentile(99), self.percentile(100))
+
+
+class Stats(namedtuple('Stats', 'transfers bytes samples spin_iterations wait_ns transfer_ns timeouts latency')):
+    """
+    Cumulative acquisition counters of a backend: SPI transfers and bytes, samples read, data
+    ready pin reads, nanoseconds spent waiting for data ready and in SPI transfers, waits that
+    timed out, and a LatencyHistogram. Time in a read beyond wait_ns and transfer_ns is host
+    overhead such as decoding and the Python call.
+    """
+
+    @classmethod
+    def from_dict(cls, counters: dict) -> 'Stats':
+        return cls(**dict(counters, latency=LatencyHistogram(counters['latency'])))
+
+
+def sign_extend(data, bits: int) -> None:
+    """
+    Sign-extend raw two's-complement codes of the given bit width in place.
+    data is a writable buffer of 2- or 4-byte items, as filled by a backend that reads raw codes.
+    """
+    if _load_spi_rpi() is not None:
+        spi_rpi.sign_extend(data, bits)
+    elif _load_numpy() is not None:
+        raw = numpy.frombuffer(data, dtype=numpy.uint32 if memoryview(data).itemsize == 4 else numpy.uint16)
+        sign = 1 << (bits - 1)
+        raw &= (sign << 1) - 1
+        raw ^= sign
+        raw -= sign
+    else:
+        sign = 1 << (bits - 1)
+        mask = (sign << 1) - 1
+        for i in range(len(data)):
+            data[i] = ((data[i] & mask) ^ sign) - sign
+
+
+def scale_codes(codes, factor: float, out=None):
+    """
+    Multiply codes, a buffer of int16, int32 or float64 items, by factor into out, a float32 or float64
+    buffer at least as long, and return out; a new float64 array if None. out may be codes itself
+    when both are float64.
+    """
+    if out is None:
+        out = new_float_buffer(len(codes))
+    if _load_spi_rpi() is not None and memoryview(codes).c_contiguous and memoryview(out).c_contiguous:
+        spi_rpi.scale(codes, factor, out)
+    elif _load_numpy() is not None:
+        src = numpy.asarray(memoryview(codes))
+        numpy.multiply(src, factor, out=numpy.asarray(memoryview(out))[:len(src)], casting='unsafe')
+    else:
+        assert len(out) >= len(codes), 'out is shorter than codes'
+        for i in range(len(codes)):
+            out[i] = codes[i] * factor
+    return out
 
 
 class Backend(object, metaclass=ABCMeta):
@@ -12,10 +192,308 @@ class Backend(object, metaclass=ABCMeta):
     def transfer(self, data: bytes) -> bytes:
         pass
 
+    def transfer_many(self, frames) -> list:
+        """
+        Transfer each frame in order, releasing chip select between them, and return the bytes
+        received for each. Native backends batch them into as few system calls as possible.
+        """
+        return [self.transfer(frame) for frame in frames]
+
     @abstractmethod
-    def get_data(self, addr: int, byte_width: int, sample_len: int) -> [int]:
+    def get_data(self, addr: int, byte_width: int, sample_len: int, out=None, timestamps=None) -> array:
+        """
+        Read sample_len signed samples into out and return it.
+        out is a writable buffer of int32 items, or int16 items for 16-bit data,
+        such as array.array or a numpy array. A new buffer is allocated with new_buffer() if out is None.
+        Backends that read raw codes can convert them with sign_extend().
+        timestamps, an int64 buffer of sample_len items such as new_timestamps(), receives the
+        CLOCK_MONOTONIC time in nanoseconds of each sample's data ready pulse if given.
+        """
+        pass
+
+    def get_data_both(self, addr: int, byte_widths: (int, int), sample_len: int, out=None, interleave=False,
+                      timestamps=None):
+        """
+        Read sample_len samples of both channels with one transfer per data ready pulse,
+        starting at addr and relying on the device's address loop for the second channel.
+        Returns a tuple of two buffers, or a single buffer of 2 * sample_len items
+        alternating ch0 and ch1 if interleave is set. out is the tuple or the single buffer to fill.
+        timestamps receives one data ready time per pulse as in get_data().
+        This default reads ch0 with get_data() and ch1, at addr + 3, with a transfer() right after
+        it, two frames per pulse; native backends read both in one frame.
+        """
+        w0, w1 = byte_widths
+        if out is None:
+            out = new_buffer(2 * sample_len, max(byte_widths)) if interleave else \
+                (new_buffer(sample_len, w0), new_buffer(sample_len, w1))
+
+        sample = new_buffer(1, w0)
+        ts = new_timestamps(1) if timestamps is not None else None
+        frame = bytes([(addr + 3) << 1 | 1]) + bytes(w1)
+        for i in range(sample_len):
+            self.get_data(addr, w0, 1, sample, ts)
+            if ts is not None:
+                timestamps[i] = ts[0]
+            ch1 = int.from_bytes(self.transfer(frame)[1:], 'big', signed=True)
+            if interleave:
+                out[2 * i], out[2 * i + 1] = sample[0], ch1
+            else:
+                out[0][i], out[1][i] = sample[0], ch1
+        return out
+
+    def get_data_decimated(self, addr: int, byte_width: int, sample_len: int, decimator, out=None):
+        """
+        Read samples through decimator, an adc.decimate filter, until sample_len outputs are
+        produced, and return out, a float64 buffer allocated with new_float_buffer() if None.
+        This default filters blocks read with get_data(); native backends filter as they read.
+        """
+        if out is None:
+            out = new_float_buffer(sample_len)
+        view = memoryview(out)
+        block = new_buffer(min(decimator.input_length(sample_len), _CaptureThread.CHUNK * decimator.factor),
+                           byte_width)
+        n = 0
+        while n < sample_len:
+            length = min(decimator.input_length(sample_len - n), len(block))
+            self.get_data(addr, byte_width, length, block)
+            n += len(decimator.filter(memoryview(block)[:length], view[n:]))
+        return out
+
+    def get_data_stats(self, addr: int, byte_width: int, sample_len: int, stats, out=None):
+        """
+        Read sample_len samples, accumulating them into stats, an adc.running_stats.RunningStats.
+        Returns out filled with them as get_data() does, or None without out, keeping nothing but
+        the statistics. This default updates stats per block; native backends per sample.
+        """
+        if out is not None:
+            self.get_data(addr, byte_width, sample_len, out)
+            stats.update(memoryview(out)[:sample_len], 8 * byte_width)
+            return out
+
+        block = new_buffer(min(sample_len, 4096), byte_width)
+        for start in range(0, sample_len, len(block)):
+            length = min(len(block), sample_len - start)
+            self.get_data(addr, byte_width, length, block)
+            stats.update(memoryview(block)[:length], 8 * byte_width)
+        return None
+
+    def start_capture(self, addr: int, byte_width: int, capacity: int, count: int = 0,
+                      timestamps: bool = False, decimator=None) -> None:
+        """
+        Start acquiring samples in the background into a ring buffer of capacity samples,
+        stopping after count samples unless count is 0.
+        Samples arriving while the ring is full are dropped and counted by capture_dropped().
+        With timestamps set, each sample's data ready time is kept for read_capture().
+        With decimator, an adc.decimate filter, the ring and count hold its float64 outputs instead,
+        read into float64 buffers; timestamps are not kept.
+        This default runs get_data() in chunks on a Python thread; native backends override it.
+        """
+        assert decimator is None or not timestamps, 'timestamps are not supported with a decimator'
+        capture = getattr(self, '_capture', None)
+        if capture is not None:
+            if capture.running:
+                raise RuntimeError('a capture is already running')
+            capture.close()
+        self._capture = _CaptureThread(self, addr, byte_width, capacity, count, timestamps, decimator)
+
+    def read_capture(self, out, min_samples: int = 0, timeout: float = None, timestamps=None) -> int:
+        """
+        Move up to len(out) captured samples into out and return how many were moved.
+        Waits until at least min_samples are available, timeout seconds pass or the capture stops.
+        Once the capture stopped on an error and no samples are left, a read of min_samples > 0
+        raises it, so the samples captured before the error are read first.
+        timestamps, an int64 buffer as long as out, receives the samples' data ready times if the
+        capture was started with timestamps.
+        """
+        return self._get_capture().read(out, min_samples, timeout, timestamps)
+
+    def capture_running(self) -> bool:
+        """True while the background capture acquires samples"""
+        capture = getattr(self, '_capture', None)
+        return capture is not None and capture.running
+
+    def capture_available(self) -> int:
+        """Number of captured samples waiting to be read"""
+        return self._get_capture().available
+
+    def capture_dropped(self) -> int:
+        """Number of samples dropped since the capture started"""
+        return self._get_capture().dropped
+
+    def stop_capture(self) -> None:
+        """Stop the background capture; samples left in the ring can still be read"""
+        self._get_capture().stop()
+
+    def capture_fileno(self) -> int:
+        """File descriptor that becomes readable when the condition set by arm_capture() is met"""
+        return self._get_capture().notify_r
+
+    def arm_capture(self, min_samples: int) -> None:
+        """Clear capture_fileno() and make it readable again once min_samples are available or the capture stops"""
+        self._get_capture().arm(min_samples)
+
+    def stats(self) -> Stats:
+        """
+        Acquisition counters collected while metrics are enabled, see Stats.
+        This default is for backends that keep none and reports zeros.
+        """
+        return Stats(0, 0, 0, 0, 0, 0, 0, LatencyHistogram())
+
+    def reset_stats(self) -> None:
+        """Zero the counters of stats()"""
         pass
 
+    def _get_capture(self):
+        capture = getattr(self, '_capture', None)
+        if capture is None:
+            raise RuntimeError('no capture was started')
+        return capture
+
     @abstractmethod
     def close(self):
         pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class _CaptureThread(object):
+    """Background capture for backends without a native one, reading chunks with get_data()"""
+
+    CHUNK = 256
+
+    def __init__(self, backend: Backend, addr: int, byte_width: int, capacity: int, count: int,
+                 timestamps: bool = False, decimator=None):
+        self.backend = backend
+        self.addr = addr
+        self.byte_width = byte_width
+        self.count = count
+        self.decimator = decimator
+        self.ring = new_buffer(capacity, byte_width) if decimator is None else new_float_buffer(capacity)
+        self.ring_ts = new_timestamps(capacity) if timestamps else None
+        self.head = 0
+        self.tail = 0
+        self.wake = 0
+        self.dropped = 0
+        self.error = None
+        self.running = True
+        self.cond = threading.Condition()
+        self.notify_r, self.notify_w = os.pipe()
+        os.set_blocking(self.notify_r, False)
+        os.set_blocking(self.notify_w, False)
+        self.thread = threading.Thread(target=self._run, name='adc-capture', daemon=True)
+        self.thread.start()
+
+    @property
+    def available(self) -> int:
+        return self.head - self.tail
+
+    def _run(self):
+        if self.decimator is None:
+            chunk = new_buffer(min(self.CHUNK, len(self.ring)), self.byte_width)
+        else:
+            chunk = new_buffer(self.CHUNK * self.decimator.factor, self.byte_width)
+            filtered = new_float_buffer(self.CHUNK)
+        chunk_ts = new_timestamps(len(chunk)) if self.ring_ts is not None else None
+        remaining = self.count or -1
+        try:
+            while self.running and remaining != 0:
+                if self.decimator is not None:
+                    length = len(chunk) if remaining < 0 else min(len(chunk), self.decimator.input_length(remaining))
+                    self.backend.get_data(self.addr, self.byte_width, length, chunk)
+                    n = len(self.decimator.filter(memoryview(chunk)[:length], filtered))
+                    self._push(filtered, None, n)
+                    remaining -= n
+                    continue
+
+                length = len(chunk) if remaining < 0 else min(len(chunk), remaining)
+                if chunk_ts is None:
+                    self.backend.get_data(self.addr, self.byte_width, length, chunk)
+                else:
+                    self.backend.get_data(self.addr, self.byte_width, length, chunk, chunk_ts)
+                self._push(chunk, chunk_ts, length)
+                remaining -= length
+        except Exception as e:
+            self.error = e
+        finally:
+            with self.cond:
+                self.running = False
+                self.cond.notify_all()
+                self._signal()
+
+    def _push(self, chunk, chunk_ts, length: int):
+        with self.cond:
+            n = min(length, len(self.ring) - (self.head - self.tail))
+            self.dropped += length - n
+            self._copy(chunk, 0, self.ring, self.head, n)
+            if chunk_ts is not None:
+                self._copy(chunk_ts, 0, self.ring_ts, self.head, n)
+            self.head += n
+            self.cond.notify_all()
+            if self.wake and self.head >= self.wake:
+                self.wake = 0
+                self._signal()
+
+    def _signal(self):
+        try:
+            os.write(self.notify_w, b'\x01')
+        except BlockingIOError:
+            pass
+
+    def arm(self, min_samples: int):
+        with self.cond:
+            try:
+                while os.read(self.notify_r, 4096):
+                    pass
+            except BlockingIOError:
+                pass
+            if self.head - self.tail >= min_samples or not self.running:
+                self._signal()
+            else:
+                self.wake = self.tail + min_samples
+
+    @staticmethod
+    def _copy(src, src_pos: int, dst, dst_pos: int, n: int):
+        """Copy n items, wrapping src_pos or dst_pos around whichever buffer is the ring"""
+        while n > 0:
+            i = src_pos % len(src)
+            j = dst_pos % len(dst)
+            m = min(n, len(src) - i, len(dst) - j)
+            try:
+                dst[j:j + m] = src[i:i + m]
+            except TypeError:
+                for k in range(m):
+                    dst[j + k] = src[i + k]
+            src_pos += m
+            dst_pos += m
+            n -= m
+
+    def read(self, out, min_samples: int, timeout: float, timestamps=None) -> int:
+        if timestamps is not None:
+            if self.ring_ts is None:
+                raise RuntimeError('the capture was started without timestamps')
+            assert len(timestamps) >= len(out), 'timestamps is shorter than out'
+
+        min_samples = min(min_samples, len(out))
+        with self.cond:
+            self.cond.wait_for(lambda: self.head - self.tail >= min_samples or not self.running, timeout)
+            n = min(self.head - self.tail, len(out))
+            self._copy(self.ring, self.tail, out, 0, n)
+            if timestamps is not None:
+                self._copy(self.ring_ts, self.tail, timestamps, 0, n)
+            self.tail += n
+            if n == 0 < min_samples and not self.running and self.error is not None:
+                raise self.error
+        return n
+
+    def stop(self):
+        self.running = False
+        self.thread.join()
+
+    def close(self):
+        self.stop()
+        os.close(self.notify_r)
+        os.close(self.notify_w)
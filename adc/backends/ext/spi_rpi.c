@@ -2,45 +2,93 @@
 #include <stdlib.h>
 #include <stdint.h>
 #include <string.h>
+#include <errno.h>
 #include <unistd.h>
-#include <getopt.h>
 #include <fcntl.h>
 #include <sys/ioctl.h>
 #include <sys/time.h>
 #include <sys/mman.h>
+#include <time.h>
+#include <poll.h>
+#include <pthread.h>
+#include <stdatomic.h>
 
 #ifdef __linux__
+#include <sys/eventfd.h>
 #include <linux/spi/spidev.h>
+#include <linux/gpio.h>
 #endif
 
+#define PY_SSIZE_T_CLEAN
 #include <Python.h>
+#include <structmember.h>
 
 #define BLOCK_SIZE  4096
 #define GPIO_LEVEL_OFFSET  13  // GPLEV0 Pin Level register
+#define MAX_FRAME_SIZE  16
+#define MAX_BATCH_SEGMENTS  32  // spi_ioc_transfer segments per SPI_IOC_MESSAGE ioctl
+#define MAX_BATCH_BYTES  4096  // spidev's default bufsiz, the most one ioctl may move
+#define GPIO_EVENT_SIZE  16  // sizeof(struct gpioevent_data)
 
-uint32_t *gpio_init() {
-    int fd = open("/dev/gpiomem", O_RDWR | O_SYNC);
+enum {
+    WAIT_SPIN = 0,  // busy-read the DR level until it goes low
+    WAIT_SPIN_POLL = 1,  // busy-read spin_budget times, then sleep poll_interval_us between reads
+    WAIT_EVENT = 2,  // block in poll() on a GPIO line event fd for the falling edge
+};
+
+#define WAIT_OK  0
+#define WAIT_ERROR  (-1)
+#define WAIT_TIMEOUT  (-2)
+#define WAIT_CANCELLED  (-3)
+
+#define LATENCY_SUB_BITS  3  // latency histogram buckets per power of two: 1 << LATENCY_SUB_BITS
+#define LATENCY_MAX_BITS  40  // latencies of 2^40 ns and more share the last bucket
+#define LATENCY_BUCKETS  ((LATENCY_MAX_BITS - LATENCY_SUB_BITS + 1) << LATENCY_SUB_BITS)
+
+#define MAX_CIC_ORDER  8
+#define MAX_CIC_GAIN_BITS  39  // order * log2(factor): 24-bit samples then stay within int64
+#define FILTER_CHUNK  256  // samples per pass of Decimator.filter()
+
+#define CANCEL_POLL_MS  50  // longest poll() before a capture thread rechecks its stop flag
+#define EVENT_CLOCK_SKEW_NS  1000000000LL  // event timestamps further than this from CLOCK_MONOTONIC are
+                                          // from an older kernel stamping CLOCK_REALTIME
+
+static inline int64_t monotonic_ns(void) {
+    struct timespec ts;
+    clock_gettime(CLOCK_MONOTONIC, &ts);
+    return (int64_t) ts.tv_sec * 1000000000 + ts.tv_nsec;
+}
+
+volatile uint32_t *gpio_init(const char *path) {
+    int fd = open(path, O_RDWR | O_SYNC);
     if (fd < 0) {
         return NULL;
     }
 
     void *gpio_mmap = mmap(NULL, BLOCK_SIZE, PROT_READ | PROT_WRITE, MAP_SHARED, fd, 0);
+    int err = errno;
+    close(fd);
+
     if (gpio_mmap == MAP_FAILED) {
+        errno = err;
         return NULL;
     }
 
-    close(fd);
-    return (uint32_t *) gpio_mmap;
+    return (volatile uint32_t *) gpio_mmap;
+}
+
+void gpio_release(volatile uint32_t *gpio_mmap) {
+    munmap((void *) gpio_mmap, BLOCK_SIZE);
 }
 
-void gpio_set_input(uint32_t *gpio_mmap, int pin_no) {
+void gpio_set_input(volatile uint32_t *gpio_mmap, int pin_no) {
     int block_addr = (pin_no / 10);
     long setting = ~(0x7 << ((pin_no % 10) * 3));
 
     *(gpio_mmap + block_addr) &= setting;
 }
 
-int gpio_read(const uint32_t *gpio_mmap, int pin_no) {
+int gpio_read(const volatile uint32_t *gpio_mmap, int pin_no) {
     int block_addr = GPIO_LEVEL_OFFSET + (pin_no / 32);
     long mask = (0x1 << (pin_no % 32));
     long reading = *(gpio_mmap + block_addr) & mask;
@@ -49,37 +97,28 @@ int gpio_read(const uint32_t *gpio_mmap, int pin_no) {
 
 #ifdef __linux__
 
-int spi_open(uint8_t ch, unsigned int baud) {
-    char mode = SPI_MODE_0;
-    char bits = 8;
-
-    char dev[32];
-    sprintf(dev, "/dev/spidev0.%d", ch);
+int spi_open(const char *path, unsigned int baud) {
+    uint8_t mode = SPI_MODE_0;
+    uint8_t bits = 8;
 
-    int fd = open(dev, O_RDWR);
+    int fd = open(path, O_RDWR);
     if (fd < 0) {
         return -1;
     }
 
-    if (ioctl(fd, SPI_IOC_WR_MODE, &mode) < 0) {
-        close(fd);
-        return -2;
-    }
-
-    if (ioctl(fd, SPI_IOC_WR_BITS_PER_WORD, &bits) < 0) {
-        close(fd);
-        return -3;
-    }
-
-    if (ioctl(fd, SPI_IOC_WR_MAX_SPEED_HZ, &baud) < 0) {
+    if (ioctl(fd, SPI_IOC_WR_MODE, &mode) < 0 ||
+        ioctl(fd, SPI_IOC_WR_BITS_PER_WORD, &bits) < 0 ||
+        ioctl(fd, SPI_IOC_WR_MAX_SPEED_HZ, &baud) < 0) {
+        int err = errno;
         close(fd);
-        return -4;
+        errno = err;
+        return -1;
     }
 
     return fd;
 }
 
-int spi_xfer(int fd, unsigned int baud, char *txbuf, char *rxbuf, unsigned int length) {
+int spi_xfer(int fd, unsigned int baud, const uint8_t *txbuf, uint8_t *rxbuf, unsigned int length) {
     struct spi_ioc_transfer spi;
     memset(&spi, 0, sizeof(spi));
 
@@ -94,114 +133,2671 @@ int spi_xfer(int fd, unsigned int baud, char *txbuf, char *rxbuf, unsigned int l
     return ioctl(fd, SPI_IOC_MESSAGE(1), &spi);
 }
 
+/*
+ * count frames of the given lengths, stored back to back in txbuf and rxbuf,
+ * in one ioctl; chip select is released between frames.
+ */
+int spi_xfer_many(int fd, unsigned int baud, const uint8_t *txbuf, uint8_t *rxbuf, const uint32_t *lengths,
+                  unsigned int count) {
+    struct spi_ioc_transfer spi[MAX_BATCH_SEGMENTS];
+    memset(spi, 0, sizeof(spi));
+
+    for (unsigned int i = 0; i < count; i++) {
+        spi[i].tx_buf = (unsigned long) txbuf;
+        spi[i].rx_buf = (unsigned long) rxbuf;
+        spi[i].len = lengths[i];
+        spi[i].speed_hz = baud;
+        spi[i].bits_per_word = 8;
+        spi[i].cs_change = i + 1 < count;
+        txbuf += lengths[i];
+        rxbuf += lengths[i];
+    }
+
+    return ioctl(fd, SPI_IOC_MESSAGE(count), spi);
+}
+
+#else
+
+int spi_open(const char *path, unsigned int baud) {
+    errno = ENOSYS;
+    return -1;
+}
+
+int spi_xfer(int fd, unsigned int baud, const uint8_t *txbuf, uint8_t *rxbuf, unsigned int length) {
+    errno = ENOSYS;
+    return -1;
+}
+
+int spi_xfer_many(int fd, unsigned int baud, const uint8_t *txbuf, uint8_t *rxbuf, const uint32_t *lengths,
+                  unsigned int count) {
+    errno = ENOSYS;
+    return -1;
+}
+
+#endif  // __linux__
+
+#ifdef __linux__
+
+int gpio_request_line_event(const char *chip_path, uint32_t pin, const char *consumer, int pull_up) {
+    int fd = open(chip_path, O_RDONLY);
+    if (fd < 0) {
+        return -1;
+    }
+
+    struct gpioevent_request req;
+    memset(&req, 0, sizeof(req));
+    req.lineoffset = pin;
+    req.handleflags = GPIOHANDLE_REQUEST_INPUT;
+    req.eventflags = GPIOEVENT_REQUEST_FALLING_EDGE;
+    strncpy(req.consumer_label, consumer, sizeof(req.consumer_label) - 1);
+
+    int rc = -1;
+#ifdef GPIOHANDLE_REQUEST_BIAS_PULL_UP
+    if (pull_up) {
+        req.handleflags |= GPIOHANDLE_REQUEST_BIAS_PULL_UP;
+        rc = ioctl(fd, GPIO_GET_LINEEVENT_IOCTL, &req);
+        // kernels before 5.5 reject bias flags; keep the pin's current pull
+        req.handleflags = GPIOHANDLE_REQUEST_INPUT;
+    }
+#endif
+    if (rc < 0) {
+        rc = ioctl(fd, GPIO_GET_LINEEVENT_IOCTL, &req);
+    }
+    int err = errno;
+    close(fd);
+
+    if (rc < 0) {
+        errno = err;
+        return -1;
+    }
+
+    return req.fd;
+}
+
+// Level of the line of a GPIO line handle or event fd, or -1 with errno set
+int gpio_read_line(int fd) {
+    struct gpiohandle_data data;
+    memset(&data, 0, sizeof(data));
+    if (ioctl(fd, GPIOHANDLE_GET_LINE_VALUES_IOCTL, &data) < 0) {
+        return -1;
+    }
+    return data.values[0] != 0;
+}
+
 #else
 
-int spi_open(uint8_t ch, unsigned int baud) {
+int gpio_request_line_event(const char *chip_path, uint32_t pin, const char *consumer, int pull_up) {
+    errno = ENOSYS;
     return -1;
 }
 
-int spi_xfer(int fd, unsigned int baud, char *txbuf, char *rxbuf, unsigned int length) {
+int gpio_read_line(int fd) {
+    errno = ENOSYS;
     return -1;
 }
 
 #endif  // __linux__
 
-int raw_get_data(uint8_t spi_ch, uint32_t spi_baud, uint8_t dr_pin, uint8_t addr, uint8_t byte_width,
-                 uint32_t sample_len, uint32_t *samples) {
-    uint32_t *gpio_mmap = gpio_init();
-    if (gpio_mmap == NULL) {
-        printf("Failed to open gpio\n");
-        return 1;
+/*
+ * Kernel timestamp of a struct gpioevent_data, or now if it is not on the
+ * CLOCK_MONOTONIC time base.
+ */
+static int64_t event_timestamp(const uint8_t *event, ssize_t len) {
+    int64_t now = monotonic_ns();
+    if (len < (ssize_t) sizeof(uint64_t)) {
+        return now;
     }
+    uint64_t ts;
+    memcpy(&ts, event, sizeof(ts));
+    int64_t skew = now - (int64_t) ts;
+    return skew >= 0 && skew < EVENT_CLOCK_SKEW_NS ? (int64_t) ts : now;
+}
 
-    gpio_set_input(gpio_mmap, dr_pin);
+/*
+ * Wait for one edge event on fd, up to deadline_ns (0 waits forever), or
+ * until *cancel is set if cancel is not NULL. Events already queued behind it
+ * are consumed too, since the device only holds the latest conversion, and
+ * *edge_ns is set to the time of the last one.
+ */
+static int wait_event(int fd, int64_t deadline_ns, atomic_int *cancel, int64_t *edge_ns) {
+    struct pollfd pfd = {.fd = fd, .events = POLLIN};
+    uint8_t event[GPIO_EVENT_SIZE];
 
-    int fd = spi_open(spi_ch, spi_baud);
-    if (fd < 0) {
-        printf("Failed to open spi\n");
-        return 1;
+    for (;;) {
+        int timeout_ms = -1;
+        if (deadline_ns) {
+            int64_t remaining = deadline_ns - monotonic_ns();
+            if (remaining < 0) {
+                remaining = 0;
+            }
+            timeout_ms = (int) ((remaining + 999999) / 1000000);
+        }
+        if (cancel != NULL && (timeout_ms < 0 || timeout_ms > CANCEL_POLL_MS)) {
+            timeout_ms = CANCEL_POLL_MS;
+        }
+
+        int rc = poll(&pfd, 1, timeout_ms);
+        if (rc < 0) {
+            if (errno == EINTR) {
+                continue;
+            }
+            return WAIT_ERROR;
+        }
+        if (rc == 0) {
+            if (cancel != NULL && atomic_load(cancel)) {
+                return WAIT_CANCELLED;
+            }
+            if (!deadline_ns || monotonic_ns() < deadline_ns) {
+                continue;
+            }
+            return WAIT_TIMEOUT;
+        }
+        ssize_t len = read(fd, event, sizeof(event));
+        if (len < 0) {
+            if (errno == EINTR || errno == EAGAIN) {
+                continue;
+            }
+            return WAIT_ERROR;
+        }
+        while (poll(&pfd, 1, 0) > 0) {
+            ssize_t queued = read(fd, event, sizeof(event));
+            if (queued <= 0) {
+                break;
+            }
+            len = queued;
+        }
+        *edge_ns = event_timestamp(event, len);
+        return WAIT_OK;
     }
+}
 
-    char txbuf[4];
-    char rxbuf[4];
-    txbuf[0] = (char) (addr << 1 | 1);
+/*
+ * Discard edge events queued before a capture starts.
+ */
+static void drain_events(int fd) {
+    struct pollfd pfd = {.fd = fd, .events = POLLIN};
+    uint8_t event[GPIO_EVENT_SIZE];
+
+    while (poll(&pfd, 1, 0) > 0 && read(fd, event, sizeof(event)) > 0) {}
+}
 
+static inline int32_t decode_sample(const uint8_t *buf, uint8_t byte_width) {
     if (byte_width == 2) {
-        for (uint32_t i = 0; i < sample_len; i++) {
-            while (gpio_read(gpio_mmap, dr_pin)) {}
-            spi_xfer(fd, spi_baud, txbuf, rxbuf, 3);
-            samples[i] = ((uint32_t) rxbuf[1] << 8) | rxbuf[2];
+        return (int16_t) (((uint16_t) buf[0] << 8) | buf[1]);
+    }
+    uint32_t raw = ((uint32_t) buf[0] << 16) | ((uint32_t) buf[1] << 8) | buf[2];
+    return (int32_t) (raw ^ 0x800000u) - 0x800000;
+}
+
+static inline void store_sample(void *samples, int itemsize, uint32_t i, int32_t value) {
+    if (itemsize == sizeof(int16_t)) {
+        ((int16_t *) samples)[i] = (int16_t) value;
+    } else {
+        ((int32_t *) samples)[i] = value;
+    }
+}
+
+enum {
+    FILTER_BOXCAR = 0,  // mean of each block of factor samples
+    FILTER_CIC = 1,  // cascaded integrator-comb of order stages, a sinc^order response
+    FILTER_FIR = 2,  // arbitrary taps, evaluated only when an output is due
+};
+
+/*
+ * Decimator: a filter and its state, kept across calls so consecutive blocks
+ * are filtered as one sequence. An output is produced after every factor
+ * inputs since the last reset(). CIC integrators wrap modulo 2^64, which the
+ * combs undo exactly as long as the output fits in 64 bits. busy is set while
+ * a loop running without the GIL owns the state.
+ */
+typedef struct {
+    PyObject_HEAD
+    int kind;
+    uint32_t factor;
+    uint32_t order;
+    uint32_t ntaps;
+    double *taps;  // taps[0] weighs the newest input
+    double *history;  // last ntaps inputs, the newest before history[pos]
+    uint32_t pos;
+    uint32_t phase;  // inputs since the last output
+    int64_t sum;
+    uint64_t integ[MAX_CIC_ORDER];
+    uint64_t comb[MAX_CIC_ORDER];
+    double gain;
+    int busy;
+} DecimatorObject;
+
+static PyTypeObject DecimatorType;
+
+static void decimator_reset(DecimatorObject *d) {
+    d->pos = 0;
+    d->phase = 0;
+    d->sum = 0;
+    memset(d->integ, 0, sizeof(d->integ));
+    memset(d->comb, 0, sizeof(d->comb));
+    if (d->history != NULL) {
+        memset(d->history, 0, sizeof(double) * d->ntaps);
+    }
+}
+
+// Run the CIC combs on the last integrator's value at an output
+static inline double cic_output(DecimatorObject *d, uint64_t v) {
+    for (uint32_t k = 0; k < d->order; k++) {
+        uint64_t delayed = d->comb[k];
+        d->comb[k] = v;
+        v -= delayed;
+    }
+    return (double) (int64_t) v * d->gain;
+}
+
+// Feed one input; returns 1 and sets *y when an output is due
+static inline int decimator_push(DecimatorObject *d, int32_t x, double *y) {
+    if (d->kind == FILTER_BOXCAR) {
+        d->sum += x;
+    } else if (d->kind == FILTER_CIC) {
+        uint64_t v = (uint64_t) (int64_t) x;
+        for (uint32_t k = 0; k < d->order; k++) {
+            v = d->integ[k] += v;
+        }
+    } else {
+        d->history[d->pos] = x;
+        d->pos = d->pos + 1 == d->ntaps ? 0 : d->pos + 1;
+    }
+
+    if (++d->phase < d->factor) {
+        return 0;
+    }
+    d->phase = 0;
+
+    if (d->kind == FILTER_BOXCAR) {
+        *y = (double) d->sum * d->gain;
+        d->sum = 0;
+    } else if (d->kind == FILTER_CIC) {
+        *y = cic_output(d, d->integ[d->order - 1]);
+    } else {
+        double acc = 0;
+        uint32_t i = d->pos;
+        for (uint32_t k = 0; k < d->ntaps; k++) {
+            i = i == 0 ? d->ntaps - 1 : i - 1;
+            acc += d->taps[k] * d->history[i];
+        }
+        *y = acc;
+    }
+    return 1;
+}
+
+/*
+ * Feed n inputs, at most FILTER_CHUNK, and return the number of outputs
+ * written to y. CIC integrators run stage by stage over the block, keeping
+ * each accumulator in a register instead of chaining through memory.
+ */
+static uint32_t decimator_push_block(DecimatorObject *d, const int32_t *x, uint32_t n, double *y) {
+    uint32_t produced = 0;
+    if (d->kind != FILTER_CIC) {
+        for (uint32_t i = 0; i < n; i++) {
+            produced += decimator_push(d, x[i], &y[produced]);
+        }
+        return produced;
+    }
+
+    uint64_t v[FILTER_CHUNK];
+    for (uint32_t i = 0; i < n; i++) {
+        v[i] = (uint64_t) (int64_t) x[i];
+    }
+    for (uint32_t k = 0; k < d->order; k++) {
+        uint64_t acc = d->integ[k];
+        for (uint32_t i = 0; i < n; i++) {
+            acc += v[i];
+            v[i] = acc;
+        }
+        d->integ[k] = acc;
+    }
+    for (uint32_t i = d->factor - 1 - d->phase; i < n; i += d->factor) {
+        y[produced++] = cic_output(d, v[i]);
+    }
+    d->phase = (uint32_t) ((d->phase + n) % d->factor);
+    return produced;
+}
+
+static int decimator_acquire(DecimatorObject *d) {
+    if (d->busy) {
+        PyErr_SetString(PyExc_RuntimeError, "the decimator is in use by another acquisition");
+        return -1;
+    }
+    d->busy = 1;
+    return 0;
+}
+
+/*
+ * Get a writable view of a float64 buffer of at least len items.
+ */
+static int get_float_buffer(PyObject *out, Py_buffer *view, uint64_t len) {
+    if (PyObject_GetBuffer(out, view, PyBUF_WRITABLE | PyBUF_C_CONTIGUOUS | PyBUF_FORMAT) < 0) {
+        return -1;
+    }
+
+    const char *format = view->format != NULL ? view->format : "B";
+    if (view->itemsize != sizeof(double) || format[strlen(format) - 1] != 'd') {
+        PyErr_SetString(PyExc_TypeError, "out must be a float64 buffer for decimated samples");
+        PyBuffer_Release(view);
+        return -1;
+    }
+
+    if ((uint64_t) (view->len / view->itemsize) < len) {
+        PyErr_SetString(PyExc_ValueError, "out is too short for the decimated samples");
+        PyBuffer_Release(view);
+        return -1;
+    }
+
+    return 0;
+}
+
+static PyObject *decimator_new(PyTypeObject *type, PyObject *args, PyObject *kwds) {
+    DecimatorObject *self = (DecimatorObject *) type->tp_alloc(type, 0);
+    if (self != NULL) {
+        self->factor = 1;
+        self->order = 1;
+        self->gain = 1;
+    }
+    return (PyObject *) self;
+}
+
+static int decimator_init(DecimatorObject *self, PyObject *args, PyObject *kwds) {
+    static char *kwlist[] = {"kind", "factor", "order", "taps", NULL};
+    int kind;
+    unsigned int factor;
+    unsigned int order = 3;
+    PyObject *taps = Py_None;
+
+    if (!PyArg_ParseTupleAndKeywords(args, kwds, "iI|IO", kwlist, &kind, &factor, &order, &taps)) {
+        return -1;
+    }
+
+    if (self->busy) {
+        PyErr_SetString(PyExc_RuntimeError, "the decimator is in use by another acquisition");
+        return -1;
+    }
+
+    if (factor == 0) {
+        PyErr_SetString(PyExc_ValueError, "factor must be positive");
+        return -1;
+    }
+
+    double *coef = NULL;
+    double *history = NULL;
+    uint32_t ntaps = 0;
+    double gain = 1;
+
+    if (kind == FILTER_BOXCAR) {
+        gain = 1.0 / factor;
+    } else if (kind == FILTER_CIC) {
+        if (order == 0 || order > MAX_CIC_ORDER) {
+            PyErr_Format(PyExc_ValueError, "order must be between 1 and %d", MAX_CIC_ORDER);
+            return -1;
+        }
+        double growth = 1;
+        for (unsigned int k = 0; k < order; k++) {
+            growth *= factor;
+        }
+        if (growth > (double) (1ULL << MAX_CIC_GAIN_BITS)) {
+            PyErr_SetString(PyExc_ValueError, "factor ** order is too large for 64-bit integrators");
+            return -1;
+        }
+        gain = 1.0 / growth;
+    } else if (kind == FILTER_FIR) {
+        PyObject *seq = taps == Py_None ? NULL : PySequence_Fast(taps, "taps must be a sequence of floats");
+        if (seq == NULL) {
+            if (!PyErr_Occurred()) {
+                PyErr_SetString(PyExc_TypeError, "an FIR decimator needs taps");
+            }
+            return -1;
+        }
+        Py_ssize_t n = PySequence_Fast_GET_SIZE(seq);
+        if (n == 0 || n > UINT32_MAX) {
+            Py_DECREF(seq);
+            PyErr_SetString(PyExc_ValueError, "taps must not be empty");
+            return -1;
         }
-    } else if (byte_width == 3) {
-        for (uint32_t i = 0; i < sample_len; i++) {
-            while (gpio_read(gpio_mmap, dr_pin)) {}
-            spi_xfer(fd, spi_baud, txbuf, rxbuf, 4);
-            samples[i] = ((uint32_t) rxbuf[1] << 16) | ((uint32_t) rxbuf[2] << 8) | rxbuf[3];
+        ntaps = (uint32_t) n;
+        coef = malloc(sizeof(double) * ntaps);
+        history = calloc(ntaps, sizeof(double));
+        if (coef == NULL || history == NULL) {
+            Py_DECREF(seq);
+            free(coef);
+            free(history);
+            PyErr_NoMemory();
+            return -1;
+        }
+        for (uint32_t k = 0; k < ntaps; k++) {
+            coef[k] = PyFloat_AsDouble(PySequence_Fast_GET_ITEM(seq, k));
+        }
+        Py_DECREF(seq);
+        if (PyErr_Occurred()) {
+            free(coef);
+            free(history);
+            return -1;
         }
     } else {
-        printf("Unsupported bytes width\n");
-        close(fd);
-        return 1;
+        PyErr_SetString(PyExc_ValueError, "kind must be FILTER_BOXCAR, FILTER_CIC or FILTER_FIR");
+        return -1;
     }
 
-    close(fd);
+    free(self->taps);
+    free(self->history);
+    self->kind = kind;
+    self->factor = factor;
+    self->order = kind == FILTER_CIC ? order : 1;
+    self->ntaps = ntaps;
+    self->taps = coef;
+    self->history = history;
+    self->gain = gain;
+    decimator_reset(self);
     return 0;
 }
 
-static PyObject *get_data(PyObject *self, PyObject *args) {
-    uint8_t spi_ch;
-    uint32_t spi_baud;
-    uint8_t dr_pin;
-    uint8_t addr;
-    uint8_t byte_width;
-    uint32_t sample_len;
+static void decimator_dealloc(DecimatorObject *self) {
+    free(self->taps);
+    free(self->history);
+    Py_TYPE(self)->tp_free((PyObject *) self);
+}
 
-    if (!PyArg_ParseTuple(args, "bIbbbI", &spi_ch, &spi_baud, &dr_pin, &addr, &byte_width, &sample_len)) {
+/*
+ * filter(samples, out) -> int
+ *
+ * Feed samples, a buffer of int16 or int32 items, and write the outputs that
+ * fall due to out, a float64 buffer, returning their number. out must have
+ * room for (phase + len(samples)) // factor items.
+ */
+static PyObject *decimator_filter(DecimatorObject *self, PyObject *args) {
+    PyObject *samples;
+    PyObject *out;
+    Py_buffer in_view;
+    Py_buffer out_view;
+
+    if (!PyArg_ParseTuple(args, "OO", &samples, &out)) {
         return NULL;
     }
 
-    PyObject *py_list = PyList_New(sample_len);
-    if (py_list == NULL) {
-        printf("PyList_New() failed.");
+    if (PyObject_GetBuffer(samples, &in_view, PyBUF_C_CONTIGUOUS | PyBUF_FORMAT) < 0) {
+        return NULL;
+    }
+    if (in_view.itemsize != sizeof(int32_t) && in_view.itemsize != sizeof(int16_t)) {
+        PyErr_SetString(PyExc_TypeError, "samples must have 2- or 4-byte items");
+        PyBuffer_Release(&in_view);
         return NULL;
     }
 
-    uint32_t *samples = malloc(sizeof(uint32_t) * sample_len);
-    if (samples == NULL) {
-        printf("malloc() failed.");
-        Py_DECREF(py_list);
+    uint64_t n = (uint64_t) (in_view.len / in_view.itemsize);
+    if (get_float_buffer(out, &out_view, (self->phase + n) / self->factor) < 0) {
+        PyBuffer_Release(&in_view);
+        return NULL;
+    }
+    if (decimator_acquire(self) < 0) {
+        PyBuffer_Release(&in_view);
+        PyBuffer_Release(&out_view);
         return NULL;
     }
 
-    if (raw_get_data(spi_ch, spi_baud, dr_pin, addr, byte_width, sample_len, samples)) {
-        printf("raw_get_data() failed.");
-        Py_DECREF(py_list);
-        free(samples);
+    uint64_t produced = 0;
+    double *y = out_view.buf;
+    Py_BEGIN_ALLOW_THREADS
+    int32_t chunk[FILTER_CHUNK];
+    for (uint64_t start = 0; start < n; start += FILTER_CHUNK) {
+        uint32_t m = n - start < FILTER_CHUNK ? (uint32_t) (n - start) : FILTER_CHUNK;
+        const int32_t *x = chunk;
+        if (in_view.itemsize == sizeof(int32_t)) {
+            x = (const int32_t *) in_view.buf + start;
+        } else {
+            for (uint32_t i = 0; i < m; i++) {
+                chunk[i] = ((const int16_t *) in_view.buf)[start + i];
+            }
+        }
+        produced += decimator_push_block(self, x, m, y + produced);
+    }
+    Py_END_ALLOW_THREADS
+    self->busy = 0;
+
+    PyBuffer_Release(&in_view);
+    PyBuffer_Release(&out_view);
+    return PyLong_FromUnsignedLongLong(produced);
+}
+
+/*
+ * reset()
+ *
+ * Clear the filter state, as if no sample had been fed.
+ */
+static PyObject *decimator_reset_method(DecimatorObject *self, PyObject *Py_UNUSED(ignored)) {
+    if (decimator_acquire(self) < 0) {
         return NULL;
     }
+    decimator_reset(self);
+    self->busy = 0;
+    Py_RETURN_NONE;
+}
 
-    for (uint32_t i = 0; i < sample_len; i++) {
-        PyList_SetItem(py_list, i, Py_BuildValue("I", samples[i]));
+static PyMethodDef decimator_methods[] = {
+        {"filter", (PyCFunction) decimator_filter, METH_VARARGS, "Filter and decimate a block of samples."},
+        {"reset", (PyCFunction) decimator_reset_method, METH_NOARGS, "Clear the filter state."},
+        {NULL, NULL, 0, NULL}
+};
+
+static PyMemberDef decimator_members[] = {
+        {"kind", T_INT, offsetof(DecimatorObject, kind), READONLY, NULL},
+        {"factor", T_UINT, offsetof(DecimatorObject, factor), READONLY, NULL},
+        {"order", T_UINT, offsetof(DecimatorObject, order), READONLY, NULL},
+        {"phase", T_UINT, offsetof(DecimatorObject, phase), READONLY, "Inputs fed since the last output."},
+        {NULL}
+};
+
+static PyTypeObject DecimatorType = {
+        PyVarObject_HEAD_INIT(NULL, 0)
+        .tp_name = "spi_rpi.Decimator",
+        .tp_doc = "Decimator(kind, factor, order=3, taps=None)\n\n"
+                  "Decimating filter for Session.get_data() and start_capture(): FILTER_BOXCAR averages blocks\n"
+                  "of factor samples, FILTER_CIC is a CIC decimator of order stages normalized to unity gain,\n"
+                  "and FILTER_FIR applies taps, taps[0] weighing the newest sample. Outputs are float64.",
+        .tp_basicsize = sizeof(DecimatorObject),
+        .tp_flags = Py_TPFLAGS_DEFAULT,
+        .tp_new = decimator_new,
+        .tp_init = (initproc) decimator_init,
+        .tp_dealloc = (destructor) decimator_dealloc,
+        .tp_methods = decimator_methods,
+        .tp_members = decimator_members,
+};
+
+/*
+ * RunningStats: mean and variance by Welford's method, extremes and the
+ * number of samples at either full-scale code, accumulated in constant
+ * memory. Blocks are folded in with Chan et al.'s pairwise update.
+ */
+typedef struct {
+    PyObject_HEAD
+    uint64_t count;
+    double mean;
+    double m2;  // sum of squared deviations from the mean
+    int32_t min;
+    int32_t max;
+    uint64_t clipped;
+    int busy;
+} RunningStatsObject;
+
+static PyTypeObject RunningStatsType;
+
+static void running_reset(RunningStatsObject *s) {
+    s->count = 0;
+    s->mean = 0;
+    s->m2 = 0;
+    s->min = INT32_MAX;
+    s->max = INT32_MIN;
+    s->clipped = 0;
+}
+
+static inline int32_t full_scale(int bits) {
+    return (int32_t) (1u << (bits - 1));
+}
+
+static inline void running_push(RunningStatsObject *s, int32_t x, int bits) {
+    double delta = x - s->mean;
+    s->count++;
+    s->mean += delta / (double) s->count;
+    s->m2 += delta * (x - s->mean);
+    if (x < s->min) {
+        s->min = x;
+    }
+    if (x > s->max) {
+        s->max = x;
+    }
+    s->clipped += x <= -full_scale(bits) || x >= full_scale(bits) - 1;
+}
+
+static void running_push_block(RunningStatsObject *s, const int32_t *x, uint32_t n, int bits) {
+    if (n == 0) {
+        return;
+    }
+    int64_t sum = 0;
+    int32_t low = x[0];
+    int32_t high = x[0];
+    uint64_t clipped = 0;
+    for (uint32_t i = 0; i < n; i++) {
+        sum += x[i];
+        low = x[i] < low ? x[i] : low;
+        high = x[i] > high ? x[i] : high;
+        clipped += x[i] <= -full_scale(bits) || x[i] >= full_scale(bits) - 1;
+    }
+    double mean = (double) sum / n;
+    double m2 = 0;
+    for (uint32_t i = 0; i < n; i++) {
+        m2 += (x[i] - mean) * (x[i] - mean);
     }
 
-    free(samples);
+    uint64_t count = s->count + n;
+    double delta = mean - s->mean;
+    s->m2 += m2 + delta * delta * ((double) s->count * n / count);
+    s->mean += delta * n / count;
+    s->count = count;
+    s->min = low < s->min ? low : s->min;
+    s->max = high > s->max ? high : s->max;
+    s->clipped += clipped;
+}
 
-    return py_list;
+static int running_acquire(RunningStatsObject *s) {
+    if (s->busy) {
+        PyErr_SetString(PyExc_RuntimeError, "the statistics are in use by another acquisition");
+        return -1;
+    }
+    s->busy = 1;
+    return 0;
 }
 
-static PyMethodDef methods[] = {
-        {"get_data", (PyCFunction) get_data, METH_VARARGS, "Get adc data."},
+static int check_bits(int bits) {
+    if (bits < 2 || bits > 32) {
+        PyErr_SetString(PyExc_ValueError, "bits must be between 2 and 32");
+        return -1;
+    }
+    return 0;
+}
+
+static PyObject *running_new(PyTypeObject *type, PyObject *args, PyObject *kwds) {
+    RunningStatsObject *self = (RunningStatsObject *) type->tp_alloc(type, 0);
+    if (self != NULL) {
+        running_reset(self);
+    }
+    return (PyObject *) self;
+}
+
+/*
+ * update(samples, bits=24)
+ *
+ * Accumulate samples, a buffer of int16 or int32 items, counting those at
+ * -2^(bits-1) or 2^(bits-1)-1 as clipped.
+ */
+static PyObject *running_update(RunningStatsObject *self, PyObject *args) {
+    PyObject *samples;
+    int bits = 24;
+    Py_buffer view;
+
+    if (!PyArg_ParseTuple(args, "O|i", &samples, &bits)) {
+        return NULL;
+    }
+    if (check_bits(bits) < 0) {
+        return NULL;
+    }
+
+    if (PyObject_GetBuffer(samples, &view, PyBUF_C_CONTIGUOUS | PyBUF_FORMAT) < 0) {
+        return NULL;
+    }
+    if (view.itemsize != sizeof(int32_t) && view.itemsize != sizeof(int16_t)) {
+        PyErr_SetString(PyExc_TypeError, "samples must have 2- or 4-byte items");
+        PyBuffer_Release(&view);
+        return NULL;
+    }
+    if (running_acquire(self) < 0) {
+        PyBuffer_Release(&view);
+        return NULL;
+    }
+
+    uint64_t n = (uint64_t) (view.len / view.itemsize);
+    Py_BEGIN_ALLOW_THREADS
+    int32_t chunk[FILTER_CHUNK];
+    for (uint64_t start = 0; start < n; start += FILTER_CHUNK) {
+        uint32_t m = n - start < FILTER_CHUNK ? (uint32_t) (n - start) : FILTER_CHUNK;
+        const int32_t *x = chunk;
+        if (view.itemsize == sizeof(int32_t)) {
+            x = (const int32_t *) view.buf + start;
+        } else {
+            for (uint32_t i = 0; i < m; i++) {
+                chunk[i] = ((const int16_t *) view.buf)[start + i];
+            }
+        }
+        running_push_block(self, x, m, bits);
+    }
+    Py_END_ALLOW_THREADS
+    self->busy = 0;
+
+    PyBuffer_Release(&view);
+    Py_RETURN_NONE;
+}
+
+/*
+ * reset()
+ *
+ * Forget every sample accumulated so far.
+ */
+static PyObject *running_reset_method(RunningStatsObject *self, PyObject *Py_UNUSED(ignored)) {
+    if (running_acquire(self) < 0) {
+        return NULL;
+    }
+    running_reset(self);
+    self->busy = 0;
+    Py_RETURN_NONE;
+}
+
+static PyMethodDef running_methods[] = {
+        {"update", (PyCFunction) running_update, METH_VARARGS, "Accumulate a block of samples."},
+        {"reset", (PyCFunction) running_reset_method, METH_NOARGS, "Forget the accumulated samples."},
         {NULL, NULL, 0, NULL}
 };
 
-static struct PyModuleDef module = {
-        PyModuleDef_HEAD_INIT,
-        "spi_rpi",
-        NULL,
-        -1,
-        methods
+static PyMemberDef running_members[] = {
+        {"count", T_ULONGLONG, offsetof(RunningStatsObject, count), READONLY, NULL},
+        {"mean", T_DOUBLE, offsetof(RunningStatsObject, mean), READONLY, NULL},
+        {"m2", T_DOUBLE, offsetof(RunningStatsObject, m2), READONLY, "Sum of squared deviations from the mean."},
+        {"min", T_INT, offsetof(RunningStatsObject, min), READONLY, NULL},
+        {"max", T_INT, offsetof(RunningStatsObject, max), READONLY, NULL},
+        {"clipped", T_ULONGLONG, offsetof(RunningStatsObject, clipped), READONLY,
+         "Number of samples at either full-scale code."},
+        {NULL}
 };
 
-PyMODINIT_FUNC PyInit_spi_rpi(void) {
-    return PyModule_Create(&module);
+static PyTypeObject RunningStatsType = {
+        PyVarObject_HEAD_INIT(NULL, 0)
+        .tp_name = "spi_rpi.RunningStats",
+        .tp_doc = "RunningStats()\n\n"
+                  "Welford mean and variance, extremes and full-scale clipping count of samples, accumulated by\n"
+                  "update() or by Session.get_data(stats=...) as it reads.",
+        .tp_basicsize = sizeof(RunningStatsObject),
+        .tp_flags = Py_TPFLAGS_DEFAULT,
+        .tp_new = running_new,
+        .tp_methods = running_methods,
+        .tp_members = running_members,
+};
+
+/*
+ * Readiness notification through a file descriptor an event loop can watch:
+ * an eventfd on Linux, a pipe elsewhere. Both ends are non-blocking.
+ */
+static int notifier_open(int fds[2]) {
+#ifdef __linux__
+    int fd = eventfd(0, EFD_NONBLOCK | EFD_CLOEXEC);
+    if (fd < 0) {
+        return -1;
+    }
+    fds[0] = fds[1] = fd;
+#else
+    if (pipe(fds) < 0) {
+        return -1;
+    }
+    for (int i = 0; i < 2; i++) {
+        fcntl(fds[i], F_SETFL, fcntl(fds[i], F_GETFL) | O_NONBLOCK);
+        fcntl(fds[i], F_SETFD, FD_CLOEXEC);
+    }
+#endif
+    return 0;
+}
+
+static void notifier_close(int fds[2]) {
+    if (fds[0] >= 0) {
+        close(fds[0]);
+    }
+    if (fds[1] >= 0 && fds[1] != fds[0]) {
+        close(fds[1]);
+    }
+    fds[0] = fds[1] = -1;
+}
+
+static void notifier_signal(const int fds[2]) {
+    uint64_t one = 1;
+    if (fds[1] >= 0 && write(fds[1], &one, sizeof(one)) < 0) {
+        // already signalled and not yet cleared
+    }
+}
+
+static void notifier_clear(const int fds[2]) {
+    uint64_t value;
+    while (fds[0] >= 0 && read(fds[0], &value, sizeof(value)) > 0) {}
+}
+
+/*
+ * Single-producer/single-consumer ring of decoded samples filled by the
+ * background capture thread. head and tail count samples ever written and
+ * read; wake is the head value a reader waits for, 0 if none. The producer
+ * clears wake when head reaches it, then wakes blocked readers and signals
+ * the notifier.
+ */
+typedef struct {
+    int32_t *buf;
+    double *fbuf;  // decimated samples, in place of buf for a capture through a decimator
+    int64_t *ts;  // data ready time of each sample, NULL unless requested
+    uint64_t capacity;
+    _Atomic uint64_t head;
+    _Atomic uint64_t tail;
+    _Atomic uint64_t wake;
+    _Atomic uint64_t dropped;
+    pthread_mutex_t lock;
+    pthread_cond_t cond;
+    int notify[2];
+} Ring;
+
+/*
+ * Acquisition counters, updated with relaxed atomics by whichever thread does
+ * the work. latency is a log-linear histogram, as in HdrHistogram, of the
+ * time from a data ready edge to the end of the frame that read its sample.
+ */
+typedef struct {
+    _Atomic uint64_t transfers;
+    _Atomic uint64_t bytes;
+    _Atomic uint64_t samples;
+    _Atomic uint64_t spin_iterations;
+    _Atomic uint64_t wait_ns;
+    _Atomic uint64_t transfer_ns;
+    _Atomic uint64_t timeouts;
+    _Atomic uint64_t latency[LATENCY_BUCKETS];
+} Stats;
+
+static inline void stats_add(_Atomic uint64_t *counter, uint64_t n) {
+    atomic_fetch_add_explicit(counter, n, memory_order_relaxed);
+}
+
+static inline unsigned latency_bucket(uint64_t ns) {
+    if (ns < (1u << LATENCY_SUB_BITS)) {
+        return (unsigned) ns;
+    }
+    unsigned k = 63 - (unsigned) __builtin_clzll(ns);
+    if (k >= LATENCY_MAX_BITS) {
+        return LATENCY_BUCKETS - 1;
+    }
+    return (k - LATENCY_SUB_BITS + 1) << LATENCY_SUB_BITS |
+           ((unsigned) (ns >> (k - LATENCY_SUB_BITS)) & ((1u << LATENCY_SUB_BITS) - 1));
+}
+
+// Lowest latency counted in a bucket
+static uint64_t latency_bucket_floor(unsigned i) {
+    unsigned group = i >> LATENCY_SUB_BITS;
+    unsigned sub = i & ((1u << LATENCY_SUB_BITS) - 1);
+    return group == 0 ? sub : (uint64_t) (1u << LATENCY_SUB_BITS | sub) << (group - 1);
+}
+
+// Count samples read in the frame that just ended for the data ready edge at edge_ns
+static void stats_sample(Stats *stats, int64_t edge_ns, uint64_t samples) {
+    int64_t latency = monotonic_ns() - edge_ns;
+    stats_add(&stats->samples, samples);
+    stats_add(&stats->latency[latency_bucket(latency > 0 ? (uint64_t) latency : 0)], 1);
+}
+
+/*
+ * Session: a spidev file descriptor and a /dev/gpiomem mapping opened once and
+ * shared by every register transfer and sample capture until close().
+ *
+ * Captures run without the GIL. spi_lock serializes SPI frames between the
+ * capture loops and transfer(); active counts calls currently running without
+ * the GIL so close() cannot pull the fds from under them.
+ */
+typedef struct {
+    PyObject_HEAD
+    int spi_fd;
+    uint32_t baud;
+    volatile uint32_t *gpio;
+    uint8_t dr_pin;
+    int wait;
+    double timeout;
+    uint32_t spin_budget;
+    uint32_t poll_interval_us;
+    int event_fd;
+    int closed;
+    int active;
+    int capturing;
+    char metrics;  // T_BOOL member
+    Stats stats;
+    pthread_mutex_t spi_lock;
+
+    // background capture
+    pthread_t cap_thread;
+    int cap_started;
+    atomic_int cap_stop;
+    atomic_int cap_done;
+    int cap_error;
+    int cap_errno;
+    uint8_t cap_addr;
+    uint8_t cap_byte_width;
+    uint64_t cap_count;
+    DecimatorObject *cap_decimator;
+    Ring ring;
+} SessionObject;
+
+/*
+ * Level of the DR pin from the GPIO mapping, or from the line event fd
+ * through the GPIO character device if there is no mapping. Returns -1 with
+ * errno set if the line cannot be read.
+ */
+static inline int read_dr_level(SessionObject *self) {
+    if (self->gpio != NULL) {
+        return gpio_read(self->gpio, self->dr_pin);
+    }
+    return gpio_read_line(self->event_fd);
+}
+
+/*
+ * Wait until DR is asserted (low) using the session's wait strategy and set
+ * *edge_ns to its CLOCK_MONOTONIC time: the kernel's edge timestamp with
+ * WAIT_EVENT, the time the low level was seen otherwise. *spins is set to the
+ * number of pin reads.
+ * Returns WAIT_OK, WAIT_ERROR with errno set, WAIT_TIMEOUT once timeout
+ * seconds pass without a data ready pulse, or WAIT_CANCELLED once *cancel is
+ * set if cancel is not NULL.
+ */
+static int wait_dr(SessionObject *self, atomic_int *cancel, int64_t *edge_ns, uint32_t *spins) {
+    *spins = 0;
+    if (self->wait != WAIT_EVENT) {
+        int level = read_dr_level(self);
+        if (level == 0) {
+            *edge_ns = monotonic_ns();
+            *spins = 1;
+            return WAIT_OK;
+        }
+        if (level < 0) {
+            return WAIT_ERROR;
+        }
+    }
+
+    int64_t deadline = self->timeout > 0 ? monotonic_ns() + (int64_t) (self->timeout * 1e9) : 0;
+
+    if (self->wait == WAIT_EVENT) {
+        return wait_event(self->event_fd, deadline, cancel, edge_ns);
+    }
+
+    uint32_t spin = self->wait == WAIT_SPIN_POLL ? self->spin_budget : UINT32_MAX;
+    struct timespec interval = {
+            .tv_sec = self->poll_interval_us / 1000000,
+            .tv_nsec = (long) (self->poll_interval_us % 1000000) * 1000
+    };
+
+    for (uint32_t n = 2;; n++) {
+        int level = read_dr_level(self);
+        if (level == 0) {
+            *edge_ns = monotonic_ns();
+            *spins = n;
+            return WAIT_OK;
+        }
+        if (level < 0) {
+            *spins = n;
+            return WAIT_ERROR;
+        }
+        if (n >= spin) {
+            nanosleep(&interval, NULL);
+        } else if ((n & 0xFF) != 0) {
+            continue;
+        }
+        if (cancel != NULL && atomic_load_explicit(cancel, memory_order_relaxed)) {
+            *spins = n;
+            return WAIT_CANCELLED;
+        }
+        if (deadline && monotonic_ns() >= deadline) {
+            *spins = n;
+            return WAIT_TIMEOUT;
+        }
+    }
+}
+
+/*
+ * wait_dr() that also counts the wait in the session's stats if metrics are
+ * enabled.
+ */
+static int session_wait_dr(SessionObject *self, atomic_int *cancel, int64_t *edge_ns) {
+    uint32_t spins;
+    if (!self->metrics) {
+        return wait_dr(self, cancel, edge_ns, &spins);
+    }
+
+    int64_t start = monotonic_ns();
+    int rc = wait_dr(self, cancel, edge_ns, &spins);
+    stats_add(&self->stats.wait_ns, (uint64_t) (monotonic_ns() - start));
+    stats_add(&self->stats.spin_iterations, spins);
+    if (rc == WAIT_TIMEOUT) {
+        stats_add(&self->stats.timeouts, 1);
+    }
+    return rc;
+}
+
+/*
+ * One read command frame under spi_lock, so register transfers from other
+ * threads slot in between samples rather than inside a frame.
+ */
+static int session_xfer(SessionObject *self, const uint8_t *txbuf, uint8_t *rxbuf, unsigned int length) {
+    int metrics = self->metrics;
+    int64_t start = metrics ? monotonic_ns() : 0;
+    pthread_mutex_lock(&self->spi_lock);
+    int rc = spi_xfer(self->spi_fd, self->baud, txbuf, rxbuf, length);
+    int err = errno;
+    pthread_mutex_unlock(&self->spi_lock);
+    if (metrics && rc >= 0) {
+        stats_add(&self->stats.transfer_ns, (uint64_t) (monotonic_ns() - start));
+        stats_add(&self->stats.transfers, 1);
+        stats_add(&self->stats.bytes, length);
+    }
+    errno = err;
+    return rc;
+}
+
+/*
+ * count frames back to back in txbuf and rxbuf, in as few ioctls as
+ * MAX_BATCH_SEGMENTS and MAX_BATCH_BYTES allow, each under spi_lock.
+ */
+static int session_xfer_many(SessionObject *self, const uint8_t *txbuf, uint8_t *rxbuf, const uint32_t *lengths,
+                             size_t count) {
+    size_t i = 0;
+    while (i < count) {
+        unsigned int n = 0;
+        size_t bytes = 0;
+        while (i + n < count && n < MAX_BATCH_SEGMENTS && (n == 0 || bytes + lengths[i + n] <= MAX_BATCH_BYTES)) {
+            bytes += lengths[i + n];
+            n++;
+        }
+
+        int metrics = self->metrics;
+        int64_t start = metrics ? monotonic_ns() : 0;
+        pthread_mutex_lock(&self->spi_lock);
+        int rc = spi_xfer_many(self->spi_fd, self->baud, txbuf, rxbuf, lengths + i, n);
+        int err = errno;
+        pthread_mutex_unlock(&self->spi_lock);
+        if (rc < 0) {
+            errno = err;
+            return -1;
+        }
+        if (metrics) {
+            stats_add(&self->stats.transfer_ns, (uint64_t) (monotonic_ns() - start));
+            stats_add(&self->stats.transfers, n);
+            stats_add(&self->stats.bytes, bytes);
+        }
+
+        txbuf += bytes;
+        rxbuf += bytes;
+        i += n;
+    }
+    return 0;
+}
+
+static PyObject *set_wait_error(int rc) {
+    if (rc == WAIT_TIMEOUT) {
+        PyErr_SetString(PyExc_TimeoutError, "timed out waiting for data ready");
+        return NULL;
+    }
+    return PyErr_SetFromErrno(PyExc_OSError);
+}
+
+static void ring_wake(Ring *ring) {
+    pthread_mutex_lock(&ring->lock);
+    pthread_cond_broadcast(&ring->cond);
+    pthread_mutex_unlock(&ring->lock);
+    notifier_signal(ring->notify);
+}
+
+static void ring_notify(Ring *ring, uint64_t head) {
+    uint64_t wake = atomic_load(&ring->wake);
+    if (wake != 0 && head >= wake && atomic_compare_exchange_strong(&ring->wake, &wake, 0)) {
+        ring_wake(ring);
+    }
+}
+
+static inline int ring_allocated(const Ring *ring) {
+    return ring->buf != NULL || ring->fbuf != NULL;
+}
+
+// Slot for the next sample, or -1 after counting it as dropped if the ring is full
+static inline int64_t ring_reserve(Ring *ring) {
+    uint64_t head = atomic_load_explicit(&ring->head, memory_order_relaxed);
+    if (head - atomic_load_explicit(&ring->tail, memory_order_acquire) >= ring->capacity) {
+        atomic_fetch_add_explicit(&ring->dropped, 1, memory_order_relaxed);
+        return -1;
+    }
+    return (int64_t) head;
+}
+
+static inline void ring_commit(Ring *ring, uint64_t head) {
+    atomic_store(&ring->head, head + 1);
+    ring_notify(ring, head + 1);
+}
+
+static void ring_push(Ring *ring, int32_t value, int64_t edge_ns) {
+    int64_t head = ring_reserve(ring);
+    if (head < 0) {
+        return;
+    }
+    ring->buf[head % ring->capacity] = value;
+    if (ring->ts != NULL) {
+        ring->ts[head % ring->capacity] = edge_ns;
+    }
+    ring_commit(ring, head);
+}
+
+static void ring_push_decimated(Ring *ring, double value) {
+    int64_t head = ring_reserve(ring);
+    if (head < 0) {
+        return;
+    }
+    ring->fbuf[head % ring->capacity] = value;
+    ring_commit(ring, head);
+}
+
+static void *capture_main(void *arg) {
+    SessionObject *self = arg;
+    uint8_t txbuf[4] = {0};
+    uint8_t rxbuf[4];
+    txbuf[0] = (uint8_t) (self->cap_addr << 1 | 1);
+
+    if (self->wait == WAIT_EVENT) {
+        drain_events(self->event_fd);
+    }
+
+    DecimatorObject *decimator = self->cap_decimator;
+    uint64_t produced = 0;
+    while (self->cap_count == 0 || produced < self->cap_count) {
+        if (atomic_load_explicit(&self->cap_stop, memory_order_relaxed)) {
+            break;
+        }
+        int64_t edge_ns;
+        int rc = session_wait_dr(self, &self->cap_stop, &edge_ns);
+        if (rc == WAIT_OK && session_xfer(self, txbuf, rxbuf, 1 + self->cap_byte_width) < 0) {
+            rc = WAIT_ERROR;
+        }
+        if (rc == WAIT_CANCELLED) {
+            break;
+        }
+        if (rc < 0) {
+            self->cap_errno = errno;
+            self->cap_error = rc;
+            break;
+        }
+        if (self->metrics) {
+            stats_sample(&self->stats, edge_ns, 1);
+        }
+        int32_t value = decode_sample(rxbuf + 1, self->cap_byte_width);
+        double y;
+        if (decimator == NULL) {
+            ring_push(&self->ring, value, edge_ns);
+            produced++;
+        } else if (decimator_push(decimator, value, &y)) {
+            ring_push_decimated(&self->ring, y);
+            produced++;
+        }
+    }
+
+    atomic_store(&self->cap_done, 1);
+    ring_wake(&self->ring);
+    return NULL;
+}
+
+static void capture_release_decimator(SessionObject *self) {
+    if (self->cap_decimator != NULL) {
+        self->cap_decimator->busy = 0;
+        Py_CLEAR(self->cap_decimator);
+    }
+}
+
+/*
+ * Stop and join the capture thread. Called with the GIL held; the thread
+ * never takes the GIL, so joining cannot deadlock.
+ */
+static void capture_join(SessionObject *self) {
+    if (!self->cap_started) {
+        return;
+    }
+    atomic_store(&self->cap_stop, 1);
+    Py_BEGIN_ALLOW_THREADS
+    pthread_join(self->cap_thread, NULL);
+    Py_END_ALLOW_THREADS
+    self->cap_started = 0;
+    capture_release_decimator(self);
+}
+
+static void session_release(SessionObject *self) {
+    capture_join(self);
+    free(self->ring.buf);
+    free(self->ring.fbuf);
+    free(self->ring.ts);
+    self->ring.buf = NULL;
+    self->ring.fbuf = NULL;
+    self->ring.ts = NULL;
+    notifier_close(self->ring.notify);
+    if (self->spi_fd >= 0) {
+        close(self->spi_fd);
+        self->spi_fd = -1;
+    }
+    if (self->gpio != NULL) {
+        gpio_release(self->gpio);
+        self->gpio = NULL;
+    }
+    self->event_fd = -1;
+    self->closed = 1;
+}
+
+static int session_check_open(SessionObject *self) {
+    if (self->closed) {
+        PyErr_SetString(PyExc_ValueError, "session is closed");
+        return -1;
+    }
+    return 0;
+}
+
+static int session_check_spi(SessionObject *self) {
+    if (session_check_open(self) < 0) {
+        return -1;
+    }
+    if (self->spi_fd < 0) {
+        PyErr_SetString(PyExc_ValueError, "session has no SPI device");
+        return -1;
+    }
+    return 0;
+}
+
+static int session_check_gpio(SessionObject *self) {
+    if (session_check_open(self) < 0) {
+        return -1;
+    }
+    if (self->gpio == NULL) {
+        PyErr_SetString(PyExc_ValueError, "session has no GPIO mapping");
+        return -1;
+    }
+    return 0;
+}
+
+static int session_check_idle(SessionObject *self) {
+    if (self->capturing || self->cap_started) {
+        PyErr_SetString(PyExc_RuntimeError, "a capture is already running");
+        return -1;
+    }
+    return 0;
+}
+
+/*
+ * The DR pin is read from the GPIO mapping, or from event_fd without one;
+ * WAIT_EVENT always needs event_fd.
+ */
+static int session_check_dr(SessionObject *self) {
+    if (self->wait == WAIT_EVENT) {
+        if (session_check_open(self) < 0) {
+            return -1;
+        }
+        if (self->event_fd < 0) {
+            PyErr_SetString(PyExc_ValueError, "session has no event fd");
+            return -1;
+        }
+        return 0;
+    }
+    if (self->event_fd >= 0) {
+        return session_check_open(self);
+    }
+    return session_check_gpio(self);
+}
+
+static int session_init(SessionObject *self, PyObject *args, PyObject *kwds) {
+    static char *kwlist[] = {"spi_path", "baud", "dr_pin", "gpio_path", "wait", "timeout", "spin_budget",
+                             "poll_interval_us", "event_fd", "metrics", NULL};
+    const char *spi_path;
+    unsigned int baud;
+    unsigned char dr_pin;
+    const char *gpio_path = "/dev/gpiomem";
+    int wait = WAIT_SPIN;
+    double timeout = 0;
+    unsigned int spin_budget = 1000;
+    unsigned int poll_interval_us = 50;
+    int event_fd = -1;
+    int metrics = 0;
+
+    if (!PyArg_ParseTupleAndKeywords(args, kwds, "zIb|z$idIIip", kwlist, &spi_path, &baud, &dr_pin, &gpio_path,
+                                     &wait, &timeout, &spin_budget, &poll_interval_us, &event_fd, &metrics)) {
+        return -1;
+    }
+
+    if (wait < WAIT_SPIN || wait > WAIT_EVENT) {
+        PyErr_SetString(PyExc_ValueError, "unknown wait strategy");
+        return -1;
+    }
+
+    if (self->active || self->cap_started) {
+        PyErr_SetString(PyExc_RuntimeError, "session is in use");
+        return -1;
+    }
+
+    session_release(self);
+    self->closed = 0;
+    self->baud = baud;
+    self->dr_pin = dr_pin;
+    self->wait = wait;
+    self->timeout = timeout;
+    self->spin_budget = spin_budget;
+    self->poll_interval_us = poll_interval_us;
+    self->event_fd = event_fd;
+    self->metrics = (char) metrics;
+
+    if (gpio_path != NULL) {
+        self->gpio = gpio_init(gpio_path);
+        if (self->gpio == NULL) {
+            PyErr_SetFromErrnoWithFilename(PyExc_OSError, gpio_path);
+            return -1;
+        }
+        gpio_set_input(self->gpio, dr_pin);
+    }
+
+    if (spi_path != NULL) {
+        self->spi_fd = spi_open(spi_path, baud);
+        if (self->spi_fd < 0) {
+            PyErr_SetFromErrnoWithFilename(PyExc_OSError, spi_path);
+            session_release(self);
+            return -1;
+        }
+    }
+
+    return 0;
+}
+
+static PyObject *session_new(PyTypeObject *type, PyObject *args, PyObject *kwds) {
+    SessionObject *self = (SessionObject *) type->tp_alloc(type, 0);
+    if (self != NULL) {
+        self->spi_fd = -1;
+        self->gpio = NULL;
+        self->event_fd = -1;
+        self->closed = 1;
+        self->ring.notify[0] = self->ring.notify[1] = -1;
+        pthread_mutex_init(&self->spi_lock, NULL);
+        pthread_mutex_init(&self->ring.lock, NULL);
+        pthread_condattr_t attr;
+        pthread_condattr_init(&attr);
+        pthread_condattr_setclock(&attr, CLOCK_MONOTONIC);
+        pthread_cond_init(&self->ring.cond, &attr);
+        pthread_condattr_destroy(&attr);
+    }
+    return (PyObject *) self;
+}
+
+static void session_dealloc(SessionObject *self) {
+    session_release(self);
+    pthread_mutex_destroy(&self->spi_lock);
+    pthread_mutex_destroy(&self->ring.lock);
+    pthread_cond_destroy(&self->ring.cond);
+    Py_TYPE(self)->tp_free((PyObject *) self);
+}
+
+static PyObject *session_close(SessionObject *self, PyObject *Py_UNUSED(ignored)) {
+    if (self->active) {
+        PyErr_SetString(PyExc_RuntimeError, "session is in use by another thread");
+        return NULL;
+    }
+    session_release(self);
+    Py_RETURN_NONE;
+}
+
+static PyObject *session_enter(SessionObject *self, PyObject *Py_UNUSED(ignored)) {
+    Py_INCREF(self);
+    return (PyObject *) self;
+}
+
+static PyObject *session_exit(SessionObject *self, PyObject *args) {
+    PyObject *rc = session_close(self, NULL);
+    if (rc == NULL) {
+        return NULL;
+    }
+    Py_DECREF(rc);
+    Py_RETURN_FALSE;
+}
+
+static PyObject *session_get_closed(SessionObject *self, void *closure) {
+    return PyBool_FromLong(self->closed);
+}
+
+/*
+ * transfer(data) -> bytes
+ *
+ * Full-duplex transfer of data in one chip select assertion.
+ */
+static PyObject *session_transfer(SessionObject *self, PyObject *args) {
+    Py_buffer tx;
+
+    if (!PyArg_ParseTuple(args, "y*", &tx)) {
+        return NULL;
+    }
+
+    if (session_check_spi(self) < 0) {
+        PyBuffer_Release(&tx);
+        return NULL;
+    }
+
+    PyObject *rx = PyBytes_FromStringAndSize(NULL, tx.len);
+    if (rx == NULL) {
+        PyBuffer_Release(&tx);
+        return NULL;
+    }
+
+    int rc;
+    self->active++;
+    Py_BEGIN_ALLOW_THREADS
+    rc = session_xfer(self, tx.buf, (uint8_t *) PyBytes_AS_STRING(rx), (unsigned int) tx.len);
+    Py_END_ALLOW_THREADS
+    self->active--;
+
+    if (rc < 0) {
+        PyErr_SetFromErrno(PyExc_OSError);
+        PyBuffer_Release(&tx);
+        Py_DECREF(rx);
+        return NULL;
+    }
+
+    PyBuffer_Release(&tx);
+    return rx;
+}
+
+/*
+ * transfer_many(frames) -> list
+ *
+ * Full-duplex transfer of each bytes-like object in frames, chip select
+ * released between them, batching up to MAX_BATCH_SEGMENTS frames into one
+ * ioctl. Returns the received bytes of each frame.
+ */
+static PyObject *session_transfer_many(SessionObject *self, PyObject *frames) {
+    if (session_check_spi(self) < 0) {
+        return NULL;
+    }
+
+    PyObject *seq = PySequence_Fast(frames, "frames must be a sequence");
+    if (seq == NULL) {
+        return NULL;
+    }
+
+    Py_ssize_t count = PySequence_Fast_GET_SIZE(seq);
+    uint32_t *lengths = PyMem_Malloc(sizeof(uint32_t) * (count ? count : 1));
+    Py_buffer *views = PyMem_Calloc(count ? count : 1, sizeof(Py_buffer));
+    uint8_t *txbuf = NULL;
+    uint8_t *rxbuf = NULL;
+    PyObject *result = NULL;
+    Py_ssize_t acquired = 0;
+    size_t total = 0;
+
+    if (lengths == NULL || views == NULL) {
+        PyErr_NoMemory();
+        goto done;
+    }
+    for (; acquired < count; acquired++) {
+        if (PyObject_GetBuffer(PySequence_Fast_GET_ITEM(seq, acquired), &views[acquired], PyBUF_SIMPLE) < 0) {
+            goto done;
+        }
+        if (views[acquired].len == 0 || views[acquired].len > UINT32_MAX) {
+            PyErr_SetString(PyExc_ValueError, "frames must not be empty");
+            acquired++;
+            goto done;
+        }
+        lengths[acquired] = (uint32_t) views[acquired].len;
+        total += (size_t) views[acquired].len;
+    }
+
+    txbuf = PyMem_Malloc(total ? total : 1);
+    rxbuf = PyMem_Malloc(total ? total : 1);
+    if (txbuf == NULL || rxbuf == NULL) {
+        PyErr_NoMemory();
+        goto done;
+    }
+    for (Py_ssize_t i = 0, offset = 0; i < count; offset += views[i].len, i++) {
+        memcpy(txbuf + offset, views[i].buf, (size_t) views[i].len);
+    }
+
+    int rc;
+    self->active++;
+    Py_BEGIN_ALLOW_THREADS
+    rc = session_xfer_many(self, txbuf, rxbuf, lengths, (size_t) count);
+    Py_END_ALLOW_THREADS
+    self->active--;
+
+    if (rc < 0) {
+        PyErr_SetFromErrno(PyExc_OSError);
+        goto done;
+    }
+
+    result = PyList_New(count);
+    if (result == NULL) {
+        goto done;
+    }
+    for (Py_ssize_t i = 0, offset = 0; i < count; offset += lengths[i], i++) {
+        PyObject *rx = PyBytes_FromStringAndSize((const char *) rxbuf + offset, lengths[i]);
+        if (rx == NULL) {
+            Py_CLEAR(result);
+            goto done;
+        }
+        PyList_SET_ITEM(result, i, rx);
+    }
+
+done:
+    for (Py_ssize_t i = 0; i < acquired; i++) {
+        PyBuffer_Release(&views[i]);
+    }
+    PyMem_Free(views);
+    PyMem_Free(lengths);
+    PyMem_Free(txbuf);
+    PyMem_Free(rxbuf);
+    Py_DECREF(seq);
+    return result;
+}
+
+/*
+ * read_dr() -> bool
+ *
+ * Current level of the data ready pin; DR is active low. Read from the GPIO
+ * mapping, or from event_fd if the session has none.
+ */
+static PyObject *session_read_dr(SessionObject *self, PyObject *Py_UNUSED(ignored)) {
+    if (self->event_fd < 0 || self->gpio != NULL) {
+        if (session_check_gpio(self) < 0) {
+            return NULL;
+        }
+    } else if (session_check_open(self) < 0) {
+        return NULL;
+    }
+
+    int level = read_dr_level(self);
+    if (level < 0) {
+        return PyErr_SetFromErrno(PyExc_OSError);
+    }
+    return PyBool_FromLong(level);
+}
+
+/*
+ * wait_dr() -> int
+ *
+ * Block until the next data ready pulse using the session's wait strategy and
+ * return its CLOCK_MONOTONIC time in nanoseconds.
+ * Raises TimeoutError if none arrives within timeout seconds.
+ */
+static PyObject *session_wait_dr_method(SessionObject *self, PyObject *Py_UNUSED(ignored)) {
+    if (session_check_dr(self) < 0) {
+        return NULL;
+    }
+
+    int rc;
+    int64_t edge_ns = 0;
+    self->active++;
+    Py_BEGIN_ALLOW_THREADS
+    rc = session_wait_dr(self, NULL, &edge_ns);
+    Py_END_ALLOW_THREADS
+    self->active--;
+
+    if (rc < 0) {
+        return set_wait_error(rc);
+    }
+    return PyLong_FromLongLong(edge_ns);
+}
+
+static int raw_get_data(SessionObject *self, uint8_t addr, uint8_t byte_width, uint32_t sample_len,
+                        void *samples, int itemsize, int64_t *timestamps, RunningStatsObject *stats) {
+    uint8_t txbuf[4] = {0};
+    uint8_t rxbuf[4];
+    txbuf[0] = (uint8_t) (addr << 1 | 1);
+
+    for (uint32_t i = 0; i < sample_len; i++) {
+        int64_t edge_ns;
+        int rc = session_wait_dr(self, NULL, &edge_ns);
+        if (rc < 0) {
+            return rc;
+        }
+        if (timestamps != NULL) {
+            timestamps[i] = edge_ns;
+        }
+        if (session_xfer(self, txbuf, rxbuf, 1 + byte_width) < 0) {
+            return WAIT_ERROR;
+        }
+        if (self->metrics) {
+            stats_sample(&self->stats, edge_ns, 1);
+        }
+        int32_t value = decode_sample(rxbuf + 1, byte_width);
+        if (samples != NULL) {
+            store_sample(samples, itemsize, i, value);
+        }
+        if (stats != NULL) {
+            running_push(stats, value, 8 * byte_width);
+        }
+    }
+
+    return 0;
+}
+
+static int raw_get_data_decimated(SessionObject *self, uint8_t addr, uint8_t byte_width, uint32_t sample_len,
+                                  double *out, DecimatorObject *decimator) {
+    uint8_t txbuf[4] = {0};
+    uint8_t rxbuf[4];
+    txbuf[0] = (uint8_t) (addr << 1 | 1);
+
+    for (uint32_t i = 0; i < sample_len;) {
+        int64_t edge_ns;
+        int rc = session_wait_dr(self, NULL, &edge_ns);
+        if (rc < 0) {
+            return rc;
+        }
+        if (session_xfer(self, txbuf, rxbuf, 1 + byte_width) < 0) {
+            return WAIT_ERROR;
+        }
+        if (self->metrics) {
+            stats_sample(&self->stats, edge_ns, 1);
+        }
+        i += decimator_push(decimator, decode_sample(rxbuf + 1, byte_width), &out[i]);
+    }
+
+    return 0;
+}
+
+// Check an optional decimator argument; decimated samples carry no timestamps
+static int check_decimator(PyObject *decimator, int timestamps) {
+    if (decimator == Py_None) {
+        return 0;
+    }
+    if (!PyObject_TypeCheck(decimator, &DecimatorType)) {
+        PyErr_SetString(PyExc_TypeError, "decimator must be a Decimator or None");
+        return -1;
+    }
+    if (timestamps) {
+        PyErr_SetString(PyExc_ValueError, "timestamps are not supported with a decimator");
+        return -1;
+    }
+    return 0;
+}
+
+/*
+ * Check that out can hold sample_len signed samples of byte_width bytes:
+ * 2-byte items (int16) for 16-bit data, 4-byte items (int32) for either width.
+ */
+static int get_sample_buffer(PyObject *out, Py_buffer *view, uint8_t byte_width, uint32_t sample_len) {
+    if (PyObject_GetBuffer(out, view, PyBUF_WRITABLE | PyBUF_C_CONTIGUOUS | PyBUF_FORMAT) < 0) {
+        return -1;
+    }
+
+    if (view->itemsize != sizeof(int32_t) && !(view->itemsize == sizeof(int16_t) && byte_width == 2)) {
+        PyErr_SetString(PyExc_TypeError, "out must have 4-byte items, or 2-byte items for 16-bit data");
+        PyBuffer_Release(view);
+        return -1;
+    }
+
+    if ((size_t) view->len < (size_t) sample_len * view->itemsize) {
+        PyErr_SetString(PyExc_ValueError, "out is shorter than sample_len");
+        PyBuffer_Release(view);
+        return -1;
+    }
+
+    return 0;
+}
+
+/*
+ * Get a writable view of an optional timestamps buffer of at least
+ * sample_len 8-byte items; view->buf is NULL if timestamps is None.
+ */
+static int get_timestamp_buffer(PyObject *timestamps, Py_buffer *view, uint64_t sample_len) {
+    view->buf = NULL;
+    view->obj = NULL;
+    if (timestamps == NULL || timestamps == Py_None) {
+        return 0;
+    }
+
+    if (PyObject_GetBuffer(timestamps, view, PyBUF_WRITABLE | PyBUF_C_CONTIGUOUS | PyBUF_FORMAT) < 0) {
+        return -1;
+    }
+
+    if (view->itemsize != sizeof(int64_t)) {
+        PyErr_SetString(PyExc_TypeError, "timestamps must have 8-byte items");
+        PyBuffer_Release(view);
+        view->buf = NULL;
+        return -1;
+    }
+
+    if ((uint64_t) (view->len / view->itemsize) < sample_len) {
+        PyErr_SetString(PyExc_ValueError, "timestamps is shorter than sample_len");
+        PyBuffer_Release(view);
+        view->buf = NULL;
+        return -1;
+    }
+
+    return 0;
+}
+
+// Release a view unless its buf was left NULL for a buffer passed as None
+static void release_optional_buffer(Py_buffer *view) {
+    if (view->buf != NULL) {
+        PyBuffer_Release(view);
+    }
+}
+
+static PyObject *session_get_data_decimated(SessionObject *self, uint8_t addr, uint8_t byte_width,
+                                            uint32_t sample_len, PyObject *out, DecimatorObject *decimator) {
+    Py_buffer view;
+
+    if (get_float_buffer(out, &view, sample_len) < 0) {
+        return NULL;
+    }
+    if (decimator_acquire(decimator) < 0) {
+        PyBuffer_Release(&view);
+        return NULL;
+    }
+
+    if (self->wait == WAIT_EVENT) {
+        drain_events(self->event_fd);
+    }
+
+    int rc;
+    self->active++;
+    self->capturing = 1;
+    Py_BEGIN_ALLOW_THREADS
+    rc = raw_get_data_decimated(self, addr, byte_width, sample_len, view.buf, decimator);
+    Py_END_ALLOW_THREADS
+    self->capturing = 0;
+    self->active--;
+    decimator->busy = 0;
+    PyBuffer_Release(&view);
+    if (rc < 0) {
+        return set_wait_error(rc);
+    }
+
+    Py_INCREF(out);
+    return out;
+}
+
+/*
+ * get_data(addr, byte_width, sample_len, out, timestamps=None, decimator=None) -> out
+ *
+ * Reads one sample per data ready pulse and fills the first sample_len items
+ * of out with sign-extended samples. out must be a writable, C-contiguous
+ * buffer such as array.array('i') / numpy.int32, or array.array('h') /
+ * numpy.int16 for 16-bit data, so no Python object is created per sample.
+ * timestamps, an int64 buffer such as array.array('q'), receives the
+ * CLOCK_MONOTONIC time in nanoseconds of each sample's data ready pulse.
+ *
+ * With a Decimator, samples are filtered as they are read and out, a float64
+ * buffer, receives sample_len decimated samples instead.
+ *
+ * With a RunningStats, every sample read is also accumulated into it; out
+ * may then be None to keep nothing but the statistics.
+ */
+static PyObject *session_get_data(SessionObject *self, PyObject *args) {
+    uint8_t addr;
+    uint8_t byte_width;
+    uint32_t sample_len;
+    PyObject *out;
+    PyObject *timestamps = Py_None;
+    PyObject *decimator = Py_None;
+    PyObject *stats_obj = Py_None;
+    Py_buffer view;
+    Py_buffer ts_view;
+
+    if (!PyArg_ParseTuple(args, "bbIO|OOO", &addr, &byte_width, &sample_len, &out, &timestamps, &decimator,
+                          &stats_obj)) {
+        return NULL;
+    }
+
+    if (check_decimator(decimator, timestamps != Py_None) < 0) {
+        return NULL;
+    }
+
+    RunningStatsObject *stats = NULL;
+    if (stats_obj != Py_None) {
+        if (!PyObject_TypeCheck(stats_obj, &RunningStatsType)) {
+            PyErr_SetString(PyExc_TypeError, "stats must be a RunningStats or None");
+            return NULL;
+        }
+        if (decimator != Py_None) {
+            PyErr_SetString(PyExc_ValueError, "stats are not supported with a decimator");
+            return NULL;
+        }
+        stats = (RunningStatsObject *) stats_obj;
+    }
+
+    if (byte_width != 2 && byte_width != 3) {
+        PyErr_SetString(PyExc_ValueError, "byte_width must be 2 or 3");
+        return NULL;
+    }
+
+    if (session_check_spi(self) < 0 || session_check_dr(self) < 0 || session_check_idle(self) < 0) {
+        return NULL;
+    }
+
+    if (decimator != Py_None) {
+        return session_get_data_decimated(self, addr, byte_width, sample_len, out, (DecimatorObject *) decimator);
+    }
+
+    view.buf = NULL;
+    view.itemsize = 0;
+    if (!(out == Py_None && stats != NULL) && get_sample_buffer(out, &view, byte_width, sample_len) < 0) {
+        return NULL;
+    }
+    if (get_timestamp_buffer(timestamps, &ts_view, sample_len) < 0) {
+        release_optional_buffer(&view);
+        return NULL;
+    }
+    if (stats != NULL && running_acquire(stats) < 0) {
+        release_optional_buffer(&view);
+        release_optional_buffer(&ts_view);
+        return NULL;
+    }
+
+    if (self->wait == WAIT_EVENT) {
+        drain_events(self->event_fd);
+    }
+
+    int rc;
+    self->active++;
+    self->capturing = 1;
+    Py_BEGIN_ALLOW_THREADS
+    rc = raw_get_data(self, addr, byte_width, sample_len, view.buf, (int) view.itemsize, ts_view.buf, stats);
+    Py_END_ALLOW_THREADS
+    self->capturing = 0;
+    self->active--;
+    if (stats != NULL) {
+        stats->busy = 0;
+    }
+    release_optional_buffer(&view);
+    release_optional_buffer(&ts_view);
+    if (rc < 0) {
+        return set_wait_error(rc);
+    }
+
+    Py_INCREF(out);
+    return out;
+}
+
+static int raw_get_data_both(SessionObject *self, uint8_t addr, const uint8_t byte_width[2], uint32_t sample_len,
+                             void *samples[2], const int itemsize[2], uint32_t stride, int64_t *timestamps) {
+    uint8_t txbuf[MAX_FRAME_SIZE] = {0};
+    uint8_t rxbuf[MAX_FRAME_SIZE];
+    unsigned int frame_len = 1 + byte_width[0] + byte_width[1];
+    txbuf[0] = (uint8_t) (addr << 1 | 1);
+
+    for (uint32_t i = 0; i < sample_len; i++) {
+        int64_t edge_ns;
+        int rc = session_wait_dr(self, NULL, &edge_ns);
+        if (rc < 0) {
+            return rc;
+        }
+        if (timestamps != NULL) {
+            timestamps[i] = edge_ns;
+        }
+        if (session_xfer(self, txbuf, rxbuf, frame_len) < 0) {
+            return WAIT_ERROR;
+        }
+        if (self->metrics) {
+            stats_sample(&self->stats, edge_ns, 2);
+        }
+        store_sample(samples[0], itemsize[0], i * stride, decode_sample(rxbuf + 1, byte_width[0]));
+        store_sample(samples[1], itemsize[1], i * stride, decode_sample(rxbuf + 1 + byte_width[0], byte_width[1]));
+    }
+
+    return 0;
+}
+
+/*
+ * get_data_both(addr, byte_width0, byte_width1, sample_len, out0, out1, timestamps=None) -> (out0, out1)
+ *
+ * Reads both channels in one SPI frame per data ready pulse, relying on the
+ * device's address loop to clock out the second channel after the first.
+ * If out1 is None, samples are interleaved into out0 (ch0, ch1, ch0, ...),
+ * which must then hold 2 * sample_len items, and out0 is returned.
+ * timestamps receives one data ready time per frame as in get_data().
+ */
+static PyObject *session_get_data_both(SessionObject *self, PyObject *args) {
+    uint8_t addr;
+    uint8_t byte_width[2];
+    uint32_t sample_len;
+    PyObject *out0;
+    PyObject *out1;
+    PyObject *timestamps = Py_None;
+    Py_buffer view0;
+    Py_buffer view1;
+    Py_buffer ts_view;
+
+    if (!PyArg_ParseTuple(args, "bbbIOO|O", &addr, &byte_width[0], &byte_width[1], &sample_len, &out0, &out1,
+                          &timestamps)) {
+        return NULL;
+    }
+
+    for (int ch = 0; ch < 2; ch++) {
+        if (byte_width[ch] != 2 && byte_width[ch] != 3) {
+            PyErr_SetString(PyExc_ValueError, "byte_width must be 2 or 3");
+            return NULL;
+        }
+    }
+
+    if (session_check_spi(self) < 0 || session_check_dr(self) < 0 || session_check_idle(self) < 0) {
+        return NULL;
+    }
+
+    if (get_timestamp_buffer(timestamps, &ts_view, sample_len) < 0) {
+        return NULL;
+    }
+
+    if (self->wait == WAIT_EVENT) {
+        drain_events(self->event_fd);
+    }
+
+    int rc;
+    if (out1 == Py_None) {
+        uint8_t common_width = byte_width[0] == 2 && byte_width[1] == 2 ? 2 : 3;
+        if (get_sample_buffer(out0, &view0, common_width, sample_len * 2) < 0) {
+            release_optional_buffer(&ts_view);
+            return NULL;
+        }
+        void *samples[2] = {view0.buf, (char *) view0.buf + view0.itemsize};
+        int itemsize[2] = {(int) view0.itemsize, (int) view0.itemsize};
+        self->active++;
+        self->capturing = 1;
+        Py_BEGIN_ALLOW_THREADS
+        rc = raw_get_data_both(self, addr, byte_width, sample_len, samples, itemsize, 2, ts_view.buf);
+        Py_END_ALLOW_THREADS
+        self->capturing = 0;
+        self->active--;
+        PyBuffer_Release(&view0);
+        release_optional_buffer(&ts_view);
+        if (rc < 0) {
+            return set_wait_error(rc);
+        }
+        Py_INCREF(out0);
+        return out0;
+    }
+
+    if (get_sample_buffer(out0, &view0, byte_width[0], sample_len) < 0) {
+        release_optional_buffer(&ts_view);
+        return NULL;
+    }
+    if (get_sample_buffer(out1, &view1, byte_width[1], sample_len) < 0) {
+        PyBuffer_Release(&view0);
+        release_optional_buffer(&ts_view);
+        return NULL;
+    }
+    void *samples[2] = {view0.buf, view1.buf};
+    int itemsize[2] = {(int) view0.itemsize, (int) view1.itemsize};
+    self->active++;
+    self->capturing = 1;
+    Py_BEGIN_ALLOW_THREADS
+    rc = raw_get_data_both(self, addr, byte_width, sample_len, samples, itemsize, 1, ts_view.buf);
+    Py_END_ALLOW_THREADS
+    self->capturing = 0;
+    self->active--;
+    PyBuffer_Release(&view0);
+    PyBuffer_Release(&view1);
+    release_optional_buffer(&ts_view);
+    if (rc < 0) {
+        return set_wait_error(rc);
+    }
+
+    return Py_BuildValue("(OO)", out0, out1);
+}
+
+/*
+ * start_capture(addr, byte_width, capacity, count=0, timestamps=False)
+ *
+ * Start acquiring samples on a native background thread into a ring of
+ * capacity samples, stopping after count samples unless count is 0. Samples
+ * arriving while the ring is full are dropped and counted in capture_dropped.
+ * With timestamps set, the data ready time of each sample is kept for
+ * read_capture().
+ */
+static PyObject *session_start_capture(SessionObject *self, PyObject *args, PyObject *kwds) {
+    static char *kwlist[] = {"addr", "byte_width", "capacity", "count", "timestamps", "decimator", NULL};
+    uint8_t addr;
+    uint8_t byte_width;
+    unsigned long long capacity;
+    unsigned long long count = 0;
+    int timestamps = 0;
+    PyObject *decimator = Py_None;
+
+    if (!PyArg_ParseTupleAndKeywords(args, kwds, "bbK|KpO", kwlist, &addr, &byte_width, &capacity, &count,
+                                     &timestamps, &decimator)) {
+        return NULL;
+    }
+
+    if (check_decimator(decimator, timestamps) < 0) {
+        return NULL;
+    }
+
+    if (byte_width != 2 && byte_width != 3) {
+        PyErr_SetString(PyExc_ValueError, "byte_width must be 2 or 3");
+        return NULL;
+    }
+
+    if (capacity == 0) {
+        PyErr_SetString(PyExc_ValueError, "capacity must be positive");
+        return NULL;
+    }
+
+    if (session_check_spi(self) < 0 || session_check_dr(self) < 0 || session_check_idle(self) < 0) {
+        return NULL;
+    }
+
+    int decimated = decimator != Py_None;
+    int32_t *buf = decimated ? NULL : malloc(sizeof(int32_t) * capacity);
+    double *fbuf = decimated ? malloc(sizeof(double) * capacity) : NULL;
+    int64_t *ts = timestamps ? malloc(sizeof(int64_t) * capacity) : NULL;
+    if ((buf == NULL && fbuf == NULL) || (timestamps && ts == NULL)) {
+        free(buf);
+        free(fbuf);
+        free(ts);
+        return PyErr_NoMemory();
+    }
+    if (decimated && decimator_acquire((DecimatorObject *) decimator) < 0) {
+        free(fbuf);
+        return NULL;
+    }
+
+    free(self->ring.buf);
+    free(self->ring.fbuf);
+    free(self->ring.ts);
+    self->ring.buf = buf;
+    self->ring.fbuf = fbuf;
+    self->ring.ts = ts;
+    self->ring.capacity = capacity;
+    atomic_store(&self->ring.head, 0);
+    atomic_store(&self->ring.tail, 0);
+    atomic_store(&self->ring.wake, 0);
+    atomic_store(&self->ring.dropped, 0);
+    atomic_store(&self->cap_stop, 0);
+    atomic_store(&self->cap_done, 0);
+    self->cap_error = WAIT_OK;
+    self->cap_addr = addr;
+    self->cap_byte_width = byte_width;
+    self->cap_count = count;
+    if (decimated) {
+        Py_INCREF(decimator);
+        self->cap_decimator = (DecimatorObject *) decimator;
+    }
+    notifier_clear(self->ring.notify);
+
+    int rc = pthread_create(&self->cap_thread, NULL, capture_main, self);
+    if (rc != 0) {
+        capture_release_decimator(self);
+        errno = rc;
+        return PyErr_SetFromErrno(PyExc_OSError);
+    }
+    self->cap_started = 1;
+
+    Py_RETURN_NONE;
+}
+
+/*
+ * read_capture(out, min_samples=0, timeout=None, timestamps=None) -> int
+ *
+ * Move up to len(out) captured samples into out and return how many were
+ * moved. Waits, without the GIL, until at least min_samples are available,
+ * timeout seconds pass, or the capture stops. Raises the capture's error
+ * once it stopped on one and no samples are left, so the samples captured
+ * before the error are returned first. timestamps, an int64 buffer as long
+ * as out, receives the samples' data ready times if the capture was started
+ * with timestamps.
+ */
+static PyObject *session_read_capture(SessionObject *self, PyObject *args, PyObject *kwds) {
+    static char *kwlist[] = {"out", "min_samples", "timeout", "timestamps", NULL};
+    PyObject *out;
+    unsigned long long min_samples = 0;
+    PyObject *timeout_obj = Py_None;
+    PyObject *timestamps = Py_None;
+    Py_buffer view;
+    Py_buffer ts_view;
+
+    if (!PyArg_ParseTupleAndKeywords(args, kwds, "O|KOO", kwlist, &out, &min_samples, &timeout_obj,
+                                     &timestamps)) {
+        return NULL;
+    }
+
+    if (!ring_allocated(&self->ring)) {
+        PyErr_SetString(PyExc_RuntimeError, "no capture was started");
+        return NULL;
+    }
+
+    if (timestamps != Py_None && self->ring.ts == NULL) {
+        PyErr_SetString(PyExc_RuntimeError, "the capture was started without timestamps");
+        return NULL;
+    }
+
+    double timeout = -1;
+    if (timeout_obj != Py_None) {
+        timeout = PyFloat_AsDouble(timeout_obj);
+        if (timeout == -1 && PyErr_Occurred()) {
+            return NULL;
+        }
+    }
+
+    if (self->ring.fbuf != NULL ? get_float_buffer(out, &view, 0) < 0
+                                : get_sample_buffer(out, &view, self->cap_byte_width, 0) < 0) {
+        return NULL;
+    }
+
+    Ring *ring = &self->ring;
+    uint64_t max_samples = (uint64_t) (view.len / view.itemsize);
+    if (get_timestamp_buffer(timestamps, &ts_view, max_samples) < 0) {
+        PyBuffer_Release(&view);
+        return NULL;
+    }
+    if (min_samples > max_samples) {
+        min_samples = max_samples;
+    }
+
+    uint64_t tail = atomic_load(&ring->tail);
+    if (atomic_load(&ring->head) - tail < min_samples) {
+        struct timespec deadline;
+        clock_gettime(CLOCK_MONOTONIC, &deadline);
+        if (timeout > 0) {
+            int64_t ns = deadline.tv_nsec + (int64_t) (timeout * 1e9);
+            deadline.tv_sec += (time_t) (ns / 1000000000);
+            deadline.tv_nsec = (long) (ns % 1000000000);
+        }
+
+        self->active++;
+        Py_BEGIN_ALLOW_THREADS
+        pthread_mutex_lock(&ring->lock);
+        while (timeout != 0 && !atomic_load(&self->cap_done)) {
+            atomic_store(&ring->wake, tail + min_samples);
+            if (atomic_load(&ring->head) - tail >= min_samples) {
+                break;
+            }
+            if (timeout < 0) {
+                pthread_cond_wait(&ring->cond, &ring->lock);
+            } else if (pthread_cond_timedwait(&ring->cond, &ring->lock, &deadline) == ETIMEDOUT) {
+                break;
+            }
+        }
+        atomic_store(&ring->wake, 0);
+        pthread_mutex_unlock(&ring->lock);
+        Py_END_ALLOW_THREADS
+        self->active--;
+        tail = atomic_load(&ring->tail);
+    }
+
+    uint64_t available = atomic_load_explicit(&ring->head, memory_order_acquire) - tail;
+    uint64_t n = available < max_samples ? available : max_samples;
+    if (ring->fbuf != NULL) {
+        double *y = view.buf;
+        for (uint64_t i = 0; i < n; i++) {
+            y[i] = ring->fbuf[(tail + i) % ring->capacity];
+        }
+    } else {
+        for (uint64_t i = 0; i < n; i++) {
+            store_sample(view.buf, (int) view.itemsize, (uint32_t) i, ring->buf[(tail + i) % ring->capacity]);
+        }
+    }
+    if (ts_view.buf != NULL) {
+        int64_t *ts = ts_view.buf;
+        for (uint64_t i = 0; i < n; i++) {
+            ts[i] = ring->ts[(tail + i) % ring->capacity];
+        }
+    }
+    atomic_store_explicit(&ring->tail, tail + n, memory_order_release);
+    PyBuffer_Release(&view);
+    release_optional_buffer(&ts_view);
+
+    if (n == 0 && min_samples > 0 && atomic_load(&self->cap_done) && self->cap_error != WAIT_OK) {
+        errno = self->cap_errno;
+        return set_wait_error(self->cap_error);
+    }
+
+    return PyLong_FromUnsignedLongLong(n);
+}
+
+/*
+ * stop_capture()
+ *
+ * Stop the capture thread. Samples still in the ring can be read afterwards.
+ */
+static PyObject *session_stop_capture(SessionObject *self, PyObject *Py_UNUSED(ignored)) {
+    capture_join(self);
+    Py_RETURN_NONE;
+}
+
+/*
+ * capture_fileno() -> int
+ *
+ * File descriptor that becomes readable once arm_capture()'s condition is
+ * met, for event loops to watch. It belongs to the session.
+ */
+static PyObject *session_capture_fileno(SessionObject *self, PyObject *Py_UNUSED(ignored)) {
+    if (session_check_open(self) < 0) {
+        return NULL;
+    }
+    if (self->ring.notify[0] < 0 && notifier_open(self->ring.notify) < 0) {
+        return PyErr_SetFromErrno(PyExc_OSError);
+    }
+    return PyLong_FromLong(self->ring.notify[0]);
+}
+
+/*
+ * arm_capture(min_samples)
+ *
+ * Clear capture_fileno() and make it readable again once at least
+ * min_samples captured samples are available or the capture stops.
+ */
+static PyObject *session_arm_capture(SessionObject *self, PyObject *args) {
+    unsigned long long min_samples;
+
+    if (!PyArg_ParseTuple(args, "K", &min_samples)) {
+        return NULL;
+    }
+
+    if (!ring_allocated(&self->ring)) {
+        PyErr_SetString(PyExc_RuntimeError, "no capture was started");
+        return NULL;
+    }
+
+    Ring *ring = &self->ring;
+    uint64_t tail = atomic_load(&ring->tail);
+    notifier_clear(ring->notify);
+    atomic_store(&ring->wake, tail + (min_samples ? min_samples : 1));
+    if (atomic_load(&ring->head) - tail >= min_samples || atomic_load(&self->cap_done)) {
+        atomic_store(&ring->wake, 0);
+        notifier_signal(ring->notify);
+    }
+
+    Py_RETURN_NONE;
+}
+
+static PyObject *session_get_capture_available(SessionObject *self, void *closure) {
+    if (!ring_allocated(&self->ring)) {
+        return PyLong_FromLong(0);
+    }
+    return PyLong_FromUnsignedLongLong(atomic_load(&self->ring.head) - atomic_load(&self->ring.tail));
+}
+
+static PyObject *session_get_capture_dropped(SessionObject *self, void *closure) {
+    return PyLong_FromUnsignedLongLong(atomic_load(&self->ring.dropped));
+}
+
+static PyObject *session_get_capturing(SessionObject *self, void *closure) {
+    return PyBool_FromLong(self->cap_started && !atomic_load(&self->cap_done));
+}
+
+/*
+ * stats() -> dict
+ *
+ * Counters collected while metrics is enabled: SPI transfers, bytes and
+ * nanoseconds spent in them, samples read, data ready pin reads, nanoseconds
+ * spent waiting for data ready and the waits that timed out. latency holds
+ * (low_ns, high_ns, count) of each non-empty histogram bucket of the time
+ * from a data ready edge to the end of the frame reading it.
+ */
+static PyObject *session_stats(SessionObject *self, PyObject *Py_UNUSED(ignored)) {
+    Stats *stats = &self->stats;
+    PyObject *latency = PyList_New(0);
+    if (latency == NULL) {
+        return NULL;
+    }
+    for (unsigned i = 0; i < LATENCY_BUCKETS; i++) {
+        uint64_t count = atomic_load_explicit(&stats->latency[i], memory_order_relaxed);
+        if (count == 0) {
+            continue;
+        }
+        uint64_t high = i + 1 < LATENCY_BUCKETS ? latency_bucket_floor(i + 1) : UINT64_MAX;
+        PyObject *bucket = Py_BuildValue("(KKK)", (unsigned long long) latency_bucket_floor(i),
+                                         (unsigned long long) high, (unsigned long long) count);
+        if (bucket == NULL || PyList_Append(latency, bucket) < 0) {
+            Py_XDECREF(bucket);
+            Py_DECREF(latency);
+            return NULL;
+        }
+        Py_DECREF(bucket);
+    }
+
+    return Py_BuildValue(
+            "{sKsKsKsKsKsKsKsN}",
+            "transfers", (unsigned long long) atomic_load_explicit(&stats->transfers, memory_order_relaxed),
+            "bytes", (unsigned long long) atomic_load_explicit(&stats->bytes, memory_order_relaxed),
+            "samples", (unsigned long long) atomic_load_explicit(&stats->samples, memory_order_relaxed),
+            "spin_iterations", (unsigned long long) atomic_load_explicit(&stats->spin_iterations, memory_order_relaxed),
+            "wait_ns", (unsigned long long) atomic_load_explicit(&stats->wait_ns, memory_order_relaxed),
+            "transfer_ns", (unsigned long long) atomic_load_explicit(&stats->transfer_ns, memory_order_relaxed),
+            "timeouts", (unsigned long long) atomic_load_explicit(&stats->timeouts, memory_order_relaxed),
+            "latency", latency);
+}
+
+/*
+ * reset_stats()
+ *
+ * Zero the counters of stats(). Counts from a running capture may land on
+ * either side of the reset.
+ */
+static PyObject *session_reset_stats(SessionObject *self, PyObject *Py_UNUSED(ignored)) {
+    Stats *stats = &self->stats;
+    atomic_store_explicit(&stats->transfers, 0, memory_order_relaxed);
+    atomic_store_explicit(&stats->bytes, 0, memory_order_relaxed);
+    atomic_store_explicit(&stats->samples, 0, memory_order_relaxed);
+    atomic_store_explicit(&stats->spin_iterations, 0, memory_order_relaxed);
+    atomic_store_explicit(&stats->wait_ns, 0, memory_order_relaxed);
+    atomic_store_explicit(&stats->transfer_ns, 0, memory_order_relaxed);
+    atomic_store_explicit(&stats->timeouts, 0, memory_order_relaxed);
+    for (unsigned i = 0; i < LATENCY_BUCKETS; i++) {
+        atomic_store_explicit(&stats->latency[i], 0, memory_order_relaxed);
+    }
+    Py_RETURN_NONE;
+}
+
+static PyMethodDef session_methods[] = {
+        {"transfer", (PyCFunction) session_transfer, METH_VARARGS, "Transfer bytes over SPI."},
+        {"transfer_many", (PyCFunction) session_transfer_many, METH_O, "Transfer several frames in one ioctl."},
+        {"read_dr", (PyCFunction) session_read_dr, METH_NOARGS, "Read the data ready pin level."},
+        {"wait_dr", (PyCFunction) session_wait_dr_method, METH_NOARGS, "Wait for a data ready pulse."},
+        {"get_data", (PyCFunction) session_get_data, METH_VARARGS, "Get adc data."},
+        {"get_data_both", (PyCFunction) session_get_data_both, METH_VARARGS, "Get adc data of both channels."},
+        {"start_capture", (PyCFunction) (void (*)(void)) session_start_capture, METH_VARARGS | METH_KEYWORDS,
+         "Start a background capture."},
+        {"read_capture", (PyCFunction) (void (*)(void)) session_read_capture, METH_VARARGS | METH_KEYWORDS,
+         "Read samples from the background capture."},
+        {"stop_capture", (PyCFunction) session_stop_capture, METH_NOARGS, "Stop the background capture."},
+        {"capture_fileno", (PyCFunction) session_capture_fileno, METH_NOARGS, "Capture notification fd."},
+        {"arm_capture", (PyCFunction) session_arm_capture, METH_VARARGS, "Arm the capture notification fd."},
+        {"stats", (PyCFunction) session_stats, METH_NOARGS, "Acquisition counters and latency histogram."},
+        {"reset_stats", (PyCFunction) session_reset_stats, METH_NOARGS, "Zero the acquisition counters."},
+        {"close", (PyCFunction) session_close, METH_NOARGS, "Close the SPI device and unmap GPIO."},
+        {"__enter__", (PyCFunction) session_enter, METH_NOARGS, NULL},
+        {"__exit__", (PyCFunction) session_exit, METH_VARARGS, NULL},
+        {NULL, NULL, 0, NULL}
+};
+
+static PyGetSetDef session_getset[] = {
+        {"closed", (getter) session_get_closed, NULL, "True once the session is closed.", NULL},
+        {"capturing", (getter) session_get_capturing, NULL, "True while the capture thread runs.", NULL},
+        {"capture_available", (getter) session_get_capture_available, NULL,
+         "Number of captured samples waiting to be read.", NULL},
+        {"capture_dropped", (getter) session_get_capture_dropped, NULL,
+         "Number of samples dropped because the ring was full.", NULL},
+        {NULL}
+};
+
+static PyMemberDef session_members[] = {
+        {"baud", T_UINT, offsetof(SessionObject, baud), READONLY, NULL},
+        {"dr_pin", T_UBYTE, offsetof(SessionObject, dr_pin), READONLY, NULL},
+        {"wait", T_INT, offsetof(SessionObject, wait), READONLY, NULL},
+        {"timeout", T_DOUBLE, offsetof(SessionObject, timeout), 0,
+         "Seconds to wait for each data ready pulse, 0 to wait forever."},
+        {"spin_budget", T_UINT, offsetof(SessionObject, spin_budget), 0, NULL},
+        {"poll_interval_us", T_UINT, offsetof(SessionObject, poll_interval_us), 0, NULL},
+        {"event_fd", T_INT, offsetof(SessionObject, event_fd), READONLY, NULL},
+        {"metrics", T_BOOL, offsetof(SessionObject, metrics), 0, "Collect the counters of stats()."},
+        {NULL}
+};
+
+static PyTypeObject SessionType = {
+        PyVarObject_HEAD_INIT(NULL, 0)
+        .tp_name = "spi_rpi.Session",
+        .tp_doc = "Session(spi_path, baud, dr_pin, gpio_path='/dev/gpiomem', *, wait=WAIT_SPIN, timeout=0,\n"
+                  "        spin_budget=1000, poll_interval_us=50, event_fd=-1, metrics=False)\n\n"
+                  "Persistent SPI device and GPIO mapping. Pass None as a path to skip opening it.\n"
+                  "event_fd is a GPIO line event fd used by WAIT_EVENT, and to read the DR pin without a GPIO\n"
+                  "mapping; it is not closed by the session.",
+        .tp_basicsize = sizeof(SessionObject),
+        .tp_flags = Py_TPFLAGS_DEFAULT,
+        .tp_new = session_new,
+        .tp_init = (initproc) session_init,
+        .tp_dealloc = (destructor) session_dealloc,
+        .tp_methods = session_methods,
+        .tp_members = session_members,
+        .tp_getset = session_getset,
+};
+
+/*
+ * sign_extend(buf, bits)
+ *
+ * Sign-extends raw two's-complement codes of the given bit width in place.
+ * buf must be a writable buffer of 2- or 4-byte items.
+ */
+static PyObject *sign_extend(PyObject *self, PyObject *args) {
+    PyObject *buf;
+    int bits;
+    Py_buffer view;
+
+    if (!PyArg_ParseTuple(args, "Oi", &buf, &bits)) {
+        return NULL;
+    }
+
+    if (bits < 2 || bits > 32) {
+        PyErr_SetString(PyExc_ValueError, "bits must be between 2 and 32");
+        return NULL;
+    }
+
+    if (PyObject_GetBuffer(buf, &view, PyBUF_WRITABLE | PyBUF_C_CONTIGUOUS | PyBUF_FORMAT) < 0) {
+        return NULL;
+    }
+
+    if (view.itemsize != sizeof(int32_t) && view.itemsize != sizeof(int16_t)) {
+        PyErr_SetString(PyExc_TypeError, "buf must have 2- or 4-byte items");
+        PyBuffer_Release(&view);
+        return NULL;
+    }
+
+    uint32_t sign = (uint32_t) 1 << (bits - 1);
+    uint32_t mask = bits == 32 ? 0xFFFFFFFFu : (sign << 1) - 1;
+    Py_ssize_t n = view.len / view.itemsize;
+
+    if (view.itemsize == sizeof(int32_t)) {
+        int32_t *p = view.buf;
+        for (Py_ssize_t i = 0; i < n; i++) {
+            p[i] = (int32_t) ((((uint32_t) p[i] & mask) ^ sign) - sign);
+        }
+    } else {
+        int16_t *p = view.buf;
+        for (Py_ssize_t i = 0; i < n; i++) {
+            p[i] = (int16_t) ((((uint32_t) (uint16_t) p[i] & mask) ^ sign) - sign);
+        }
+    }
+
+    PyBuffer_Release(&view);
+
+    Py_RETURN_NONE;
+}
+
+/*
+ * scale(codes, factor, out)
+ *
+ * Writes codes * factor into out, a float32 or float64 buffer at least as long
+ * as codes. codes is a buffer of int16, int32 or float64 items; out may be codes
+ * itself when both are float64.
+ */
+static PyObject *scale(PyObject *self, PyObject *args) {
+    PyObject *codes;
+    PyObject *out;
+    double factor;
+    Py_buffer in_view;
+    Py_buffer out_view;
+
+    if (!PyArg_ParseTuple(args, "OdO", &codes, &factor, &out)) {
+        return NULL;
+    }
+
+    if (PyObject_GetBuffer(codes, &in_view, PyBUF_C_CONTIGUOUS | PyBUF_FORMAT) < 0) {
+        return NULL;
+    }
+    if (PyObject_GetBuffer(out, &out_view, PyBUF_WRITABLE | PyBUF_C_CONTIGUOUS | PyBUF_FORMAT) < 0) {
+        PyBuffer_Release(&in_view);
+        return NULL;
+    }
+
+    const char *in_format = in_view.format != NULL ? in_view.format : "B";
+    const char *out_format = out_view.format != NULL ? out_view.format : "B";
+    int in_double = in_format[strlen(in_format) - 1] == 'd';
+    int out_double = out_format[strlen(out_format) - 1] == 'd';
+    Py_ssize_t n = in_view.len / in_view.itemsize;
+
+    if (!(in_double ? in_view.itemsize == sizeof(double)
+                    : in_view.itemsize == sizeof(int32_t) || in_view.itemsize == sizeof(int16_t))) {
+        PyErr_SetString(PyExc_TypeError, "codes must have int16, int32 or float64 items");
+    } else if (!(out_double ? out_view.itemsize == sizeof(double)
+                            : out_format[strlen(out_format) - 1] == 'f' && out_view.itemsize == sizeof(float))) {
+        PyErr_SetString(PyExc_TypeError, "out must be a float32 or float64 buffer");
+    } else if (out_view.len / out_view.itemsize < n) {
+        PyErr_SetString(PyExc_ValueError, "out is shorter than codes");
+    }
+    if (PyErr_Occurred()) {
+        PyBuffer_Release(&in_view);
+        PyBuffer_Release(&out_view);
+        return NULL;
+    }
+
+#define SCALE_LOOP(in_type, out_type) do { \
+        const in_type *src = in_view.buf; \
+        out_type *dst = out_view.buf; \
+        for (Py_ssize_t i = 0; i < n; i++) { \
+            dst[i] = (out_type) (src[i] * factor); \
+        } \
+    } while (0)
+
+    if (in_double) {
+        if (out_double) {
+            SCALE_LOOP(double, double);
+        } else {
+            SCALE_LOOP(double, float);
+        }
+    } else if (in_view.itemsize == sizeof(int32_t)) {
+        if (out_double) {
+            SCALE_LOOP(int32_t, double);
+        } else {
+            SCALE_LOOP(int32_t, float);
+        }
+    } else {
+        if (out_double) {
+            SCALE_LOOP(int16_t, double);
+        } else {
+            SCALE_LOOP(int16_t, float);
+        }
+    }
+#undef SCALE_LOOP
+
+    PyBuffer_Release(&in_view);
+    PyBuffer_Release(&out_view);
+
+    Py_RETURN_NONE;
+}
+
+/*
+ * request_line_event(chip_path, pin, consumer='py-adc', pull_up=False) -> int
+ *
+ * Request falling edge events of a GPIO line from the GPIO character device
+ * and return the event fd, to be passed to Session(event_fd=...). The fd also
+ * reads the line level. pull_up enables the pin's pull-up on kernels that
+ * support bias settings (5.5 and later).
+ */
+static PyObject *request_line_event(PyObject *self, PyObject *args, PyObject *kwds) {
+    static char *kwlist[] = {"chip_path", "pin", "consumer", "pull_up", NULL};
+    const char *chip_path;
+    unsigned int pin;
+    const char *consumer = "py-adc";
+    int pull_up = 0;
+
+    if (!PyArg_ParseTupleAndKeywords(args, kwds, "sI|sp", kwlist, &chip_path, &pin, &consumer, &pull_up)) {
+        return NULL;
+    }
+
+    int fd = gpio_request_line_event(chip_path, pin, consumer, pull_up);
+    if (fd < 0) {
+        return PyErr_SetFromErrnoWithFilename(PyExc_OSError, chip_path);
+    }
+    return PyLong_FromLong(fd);
+}
+
+/*
+ * Points p at the index-th uint64 of buf, which view then holds; -1 with an exception set on error.
+ */
+static int u64_item(PyObject *buf, Py_ssize_t index, Py_buffer *view, _Atomic uint64_t **p) {
+    if (PyObject_GetBuffer(buf, view, PyBUF_WRITABLE | PyBUF_C_CONTIGUOUS) < 0) {
+        return -1;
+    }
+    if (index < 0 || (size_t) (index + 1) * sizeof(uint64_t) > (size_t) view->len ||
+        (uintptr_t) view->buf % sizeof(uint64_t) != 0) {
+        PyErr_SetString(PyExc_IndexError, "index is not an aligned uint64 of buf");
+        PyBuffer_Release(view);
+        return -1;
+    }
+    *p = (_Atomic uint64_t *) view->buf + index;
+    return 0;
+}
+
+/*
+ * load_u64(buf, index)
+ *
+ * Reads the index-th uint64 of buf atomically, with a full memory fence on each side:
+ * memory accesses before the call complete before it and those after it start after.
+ * The counters of adc.shm.SharedRing are shared between processes this way.
+ */
+static PyObject *load_u64(PyObject *self, PyObject *args) {
+    PyObject *buf;
+    Py_ssize_t index;
+    Py_buffer view;
+    _Atomic uint64_t *p;
+
+    if (!PyArg_ParseTuple(args, "On", &buf, &index) || u64_item(buf, index, &view, &p) < 0) {
+        return NULL;
+    }
+    atomic_thread_fence(memory_order_seq_cst);
+    uint64_t value = atomic_load_explicit(p, memory_order_relaxed);
+    atomic_thread_fence(memory_order_seq_cst);
+    PyBuffer_Release(&view);
+    return PyLong_FromUnsignedLongLong(value);
+}
+
+/*
+ * store_u64(buf, index, value)
+ *
+ * Writes the index-th uint64 of buf atomically, with a full memory fence on each side.
+ */
+static PyObject *store_u64(PyObject *self, PyObject *args) {
+    PyObject *buf;
+    Py_ssize_t index;
+    unsigned long long value;
+    Py_buffer view;
+    _Atomic uint64_t *p;
+
+    if (!PyArg_ParseTuple(args, "OnK", &buf, &index, &value) || u64_item(buf, index, &view, &p) < 0) {
+        return NULL;
+    }
+    atomic_thread_fence(memory_order_seq_cst);
+    atomic_store_explicit(p, value, memory_order_relaxed);
+    atomic_thread_fence(memory_order_seq_cst);
+    PyBuffer_Release(&view);
+    Py_RETURN_NONE;
+}
+
+static PyMethodDef methods[] = {
+        {"request_line_event", (PyCFunction) (void (*)(void)) request_line_event, METH_VARARGS | METH_KEYWORDS,
+         "Request GPIO line edge events."},
+        {"sign_extend", (PyCFunction) sign_extend, METH_VARARGS, "Sign-extend raw codes in place."},
+        {"scale", (PyCFunction) scale, METH_VARARGS, "Multiply codes by a factor into a float buffer."},
+        {"load_u64", (PyCFunction) load_u64, METH_VARARGS, "Atomically read a uint64 between full fences."},
+        {"store_u64", (PyCFunction) store_u64, METH_VARARGS, "Atomically write a uint64 between full fences."},
+        {NULL, NULL, 0, NULL}
+};
+
+static struct PyModuleDef module = {
+        PyModuleDef_HEAD_INIT,
+        "spi_rpi",
+        NULL,
+        -1,
+        methods
+};
+
+PyMODINIT_FUNC PyInit_spi_rpi(void) {
+    if (PyType_Ready(&SessionType) < 0 || PyType_Ready(&DecimatorType) < 0 || PyType_Ready(&RunningStatsType) < 0) {
+        return NULL;
+    }
+
+    PyObject *m = PyModule_Create(&module);
+    if (m == NULL) {
+        return NULL;
+    }
+
+    if (PyModule_AddIntConstant(m, "WAIT_SPIN", WAIT_SPIN) < 0 ||
+        PyModule_AddIntConstant(m, "WAIT_SPIN_POLL", WAIT_SPIN_POLL) < 0 ||
+        PyModule_AddIntConstant(m, "WAIT_EVENT", WAIT_EVENT) < 0 ||
+        PyModule_AddIntConstant(m, "FILTER_BOXCAR", FILTER_BOXCAR) < 0 ||
+        PyModule_AddIntConstant(m, "FILTER_CIC", FILTER_CIC) < 0 ||
+        PyModule_AddIntConstant(m, "FILTER_FIR", FILTER_FIR) < 0) {
+        Py_DECREF(m);
+        return NULL;
+    }
+
+    Py_INCREF(&SessionType);
+    if (PyModule_AddObject(m, "Session", (PyObject *) &SessionType) < 0) {
+        Py_DECREF(&SessionType);
+        Py_DECREF(m);
+        return NULL;
+    }
+
+    Py_INCREF(&DecimatorType);
+    if (PyModule_AddObject(m, "Decimator", (PyObject *) &DecimatorType) < 0) {
+        Py_DECREF(&DecimatorType);
+        Py_DECREF(m);
+        return NULL;
+    }
+
+    Py_INCREF(&RunningStatsType);
+    if (PyModule_AddObject(m, "RunningStats", (PyObject *) &RunningStatsType) < 0) {
+        Py_DECREF(&RunningStatsType);
+        Py_DECREF(m);
+        return NULL;
+    }
+
+    return m;
 }
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+
+"""
+Replay of recorded samples through the drivers without hardware
+
+ReplayBackend serves the codes of a recording instead of simulated inputs, with the register
+emulation of SimulatedBackend: register reads are answered from a register image, the one kept
+in the recording's header by default, and writes change it as on the device. Samples are read
+from the memory-mapped file as they are requested, so recordings of any length replay in
+constant memory. With realtime set, get_data() is paced at the data rate of the image's OSR and
+prescaler, at the master clock the recording was made with; otherwise samples are served as
+fast as the consumer reads them, which makes throughput measurements repeatable.
+"""
+
+import mmap
+
+from . import backend as _backend
+from .backend import new_buffer
+from .simulated import _MODELS, SimulatedBackend
+
+
+class ReplayBackend(SimulatedBackend):
+
+    def __init__(self, path: str, device: str = None, registers=None, width: int = None, channel: int = None,
+                 mclk: float = None, realtime: bool = False, loop: bool = True):
+        """
+        path is an adc.recording file, a .npy file of codes (numpy required), one column or one per
+        channel, or a raw file of native int16 (width 16) or int32 (width 24, the default) codes.
+        device, registers, a RegisterMap or its bytes, width, the bits per recorded code, and channel,
+        where a single column is replayed, default to the recording's header, or to 'MCP3911', the
+        device's reset values, the file's item size and channel 0. The other channel reads 0.
+        mclk defaults to the recording's master clock, else 4 MHz. Past the end of the recording, the
+        samples start over if loop is set; otherwise get_data() raises EOFError.
+        """
+        self._recording = None
+        self._mmap = None
+        numpy = _backend._load_numpy()
+        with open(path, 'rb') as f:
+            magic = f.read(4)
+
+        if magic == b'ADCW':
+            from ..recording import Recording
+
+            self._recording = Recording(path)
+            data = self._recording.samples
+            device = device or self._recording.device
+            registers = registers if registers is not None else self._recording.registers
+            width = width or self._recording.width
+            channel = self._recording.channel if channel is None else channel
+        elif str(path).endswith('.npy'):
+            assert numpy is not None, 'numpy is required for .npy files'
+            data = numpy.load(path, mmap_mode='r')
+            assert data.ndim in (1, 2) and data.dtype.kind == 'i', '.npy file must hold integer codes'
+            width = width or (16 if data.dtype.itemsize == 2 else 24)
+        else:
+            width = width or 24
+            item = new_buffer(0, width // 8)
+            with open(path, 'rb') as f:
+                self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            count = len(self._mmap) // item.itemsize
+            if numpy is not None:
+                data = numpy.frombuffer(self._mmap, numpy.dtype(item.typecode), count)
+            else:
+                data = memoryview(self._mmap)[:count * item.itemsize].cast(item.typecode)
+
+        device = (device or 'MCP3911').upper()
+        assert device in _MODELS, 'device must be MCP3911 or MCP3901'
+        assert width in (16, 24), 'width must be 16 or 24'
+        if getattr(data, 'ndim', 1) == 2:
+            assert data.shape[1] == 2, 'a .npy file has one column per channel'
+            self._channels = [data[:, 0], data[:, 1]]
+        else:
+            self._channels = [None, None]
+            self._channels[channel or 0] = data
+        assert len(data) > 0, 'recording is empty'
+        self.length = len(data)
+        """Number of samples per channel in the recording"""
+        self.width = width
+        self.loop = loop
+
+        super().__init__(device, mclk=mclk or 4e6, realtime=realtime)
+        if registers is not None:
+            self._mem[:] = bytes(registers)
+        if mclk is None and self._recording is not None:
+            # the data rate is proportional to MCLK
+            self.mclk = self._recording.data_rate / self.model.data_rate(self.regs, 1.0)
+        self._rate = self.data_rate
+
+    def _next_samples(self, count: int) -> int:
+        start = super()._next_samples(count)
+        if not self.loop and start + count > self.length:
+            raise EOFError('the recording ended after {} samples'.format(self.length))
+        return start
+
+    def _conversions(self, ch: int, start: int, count: int):
+        data = self._channels[ch]
+        numpy = _backend._load_numpy()
+        codes = numpy.zeros(count, numpy.int32) if numpy is not None else [0] * count
+        if data is None:
+            return codes
+
+        # copy the recording piece by piece, in slices of the mapped file
+        shift = 24 - self.width
+        done = 0
+        while done < count:
+            i = (start + done) % self.length if self.loop else min(start + done, self.length)
+            piece = data[i:i + count - done]
+            if len(piece) == 0:
+                break
+            if numpy is not None:
+                codes[done:done + len(piece)] = piece
+            else:
+                codes[done:done + len(piece)] = piece.tolist()
+            done += len(piece)
+        if numpy is not None:
+            codes <<= shift
+            return codes
+        return [c << shift for c in codes]
+
+    def close(self):
+        super().close()
+        for data in self._channels:
+            if isinstance(data, memoryview):
+                data.release()
+        self._channels = [None, None]
+        if self._recording is not None:
+            self._recording.close()
+            self._recording = None
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
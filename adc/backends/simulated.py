@@ -0,0 +1,376 @@
+#!/usr/bin/env python3
+
+"""
+Simulated MCP3911 / MCP3901 backend for running the drivers without hardware
+
+The device's register map, read and write address looping, channel data width, PGA gain, the
+MCP3911's offset and gain correction and data rate, MCLK / (PRE * 4 * OSR), are modeled.
+Channel inputs come from pluggable signal sources in volts. With realtime set, get_data()
+returns at the data ready time of its last sample, and conversions that were not read in time
+are skipped as on the device; otherwise samples are generated as fast as possible, which is
+what benchmarks want. Timestamps are the simulated data ready times, so skipped conversions
+show up as gaps.
+"""
+
+import math
+import random
+import time
+from abc import ABCMeta, abstractmethod
+
+from .. import mcp3901_register, mcp3911_register
+from . import backend as _backend
+from .backend import Backend, new_buffer
+
+
+class Source(object, metaclass=ABCMeta):
+    """Signal at a simulated channel input, in volts"""
+
+    @abstractmethod
+    def generate(self, start: int, count: int, rate: float):
+        """
+        Values of samples start to start + count - 1 taken at rate samples per second,
+        a numpy array if numpy is available, else a list.
+        """
+        pass
+
+
+class Constant(Source):
+
+    def __init__(self, volts: float = 0.0):
+        self.volts = volts
+
+    def generate(self, start: int, count: int, rate: float):
+        numpy = _backend._load_numpy()
+        if numpy is not None:
+            return numpy.full(count, self.volts)
+        return [self.volts] * count
+
+
+class Sine(Source):
+
+    def __init__(self, amplitude: float, frequency: float, offset: float = 0.0, phase: float = 0.0):
+        self.amplitude = amplitude
+        self.frequency = frequency
+        self.offset = offset
+        self.phase = phase
+
+    def generate(self, start: int, count: int, rate: float):
+        w = 2 * math.pi * self.frequency / rate
+        numpy = _backend._load_numpy()
+        if numpy is not None:
+            return self.offset + self.amplitude * numpy.sin(w * numpy.arange(start, start + count) + self.phase)
+        return [self.offset + self.amplitude * math.sin(w * i + self.phase) for i in range(start, start + count)]
+
+
+class Noise(Source):
+    """Gaussian noise"""
+
+    def __init__(self, stddev: float, offset: float = 0.0, seed: int = None):
+        self.stddev = stddev
+        self.offset = offset
+        numpy = _backend._load_numpy()
+        self._rng = numpy.random.default_rng(seed) if numpy is not None else random.Random(seed)
+
+    def generate(self, start: int, count: int, rate: float):
+        if not isinstance(self._rng, random.Random):
+            return self._rng.normal(self.offset, self.stddev, count)
+        return [self._rng.gauss(self.offset, self.stddev) for _ in range(count)]
+
+
+class File(Source):
+    """
+    Recorded values in volts, from a .npy file (numpy required) or a text file of one value per line.
+    The recording repeats if loop is set, otherwise the input is 0 V after its end.
+    """
+
+    def __init__(self, path: str, loop: bool = True):
+        numpy = _backend._load_numpy()
+        if str(path).endswith('.npy'):
+            self.values = numpy.load(path).astype(float).ravel()
+        else:
+            with open(path) as f:
+                self.values = [float(line) for line in f if line.strip()]
+            if numpy is not None:
+                self.values = numpy.array(self.values, dtype=float)
+        assert len(self.values) > 0, 'recording is empty'
+        self.loop = loop
+
+    def generate(self, start: int, count: int, rate: float):
+        n = len(self.values)
+        numpy = _backend._load_numpy()
+        if numpy is not None:
+            index = numpy.arange(start, start + count)
+            if self.loop:
+                return self.values[index % n]
+            return numpy.where(index < n, self.values[numpy.minimum(index, n - 1)], 0.0)
+        if self.loop:
+            return [self.values[i % n] for i in range(start, start + count)]
+        return [self.values[i] if i < n else 0.0 for i in range(start, start + count)]
+
+
+class _MCP3911(object):
+    reg = mcp3911_register
+    scale = 1.5 / 1.2
+    """Code per volt at gain 1, relative to full scale 2^23, with VREF = 1.2 V"""
+    registers = [(0x00, 3), (0x03, 3), (0x06, 1), (0x07, 2), (0x09, 1), (0x0A, 2), (0x0C, 2),
+                 (0x0E, 3), (0x11, 3), (0x14, 3), (0x17, 3), (0x1A, 1)]
+    types = [(0x00, 0x06), (0x06, 0x1B)]
+    groups = [(0x00, 0x06), (0x06, 0x0A), (0x0A, 0x0E), (0x0E, 0x14), (0x14, 0x1A), (0x1A, 0x1B)]
+
+    @staticmethod
+    def defaults(reg):
+        return reg.RegisterMap(gain=reg.GainReg(), status_com=reg.StatusComReg(), config=reg.ConfigReg())
+
+    @staticmethod
+    def widths(regs) -> (int, int):
+        return tuple(24 if regs.status_com.width >> ch & 1 else 16 for ch in (0, 1))
+
+    @staticmethod
+    def data_rate(regs, mclk: float) -> float:
+        return regs.config.data_rate(mclk)
+
+    @staticmethod
+    def write_loops(regs) -> bool:
+        return regs.status_com.write == mcp3911_register.StatusComReg.Write.on
+
+    @staticmethod
+    def correction(regs, ch: int) -> (int, float):
+        """Offset and gain correction of a channel, the identity where disabled"""
+        status = regs.status_com
+        offset = int.from_bytes(bytes(regs.offcal_ch1 if ch else regs.offcal_ch0), 'big', signed=True)
+        gain = int.from_bytes(bytes(regs.gaincal_ch1 if ch else regs.gaincal_ch0), 'big', signed=True)
+        return offset if status.en_offcal else 0, 1 + gain / (1 << 23) if status.en_gaincal else 1.0
+
+
+class _MCP3901(object):
+    reg = mcp3901_register
+    scale = 3 / 2.37
+    """Code per volt at gain 1, relative to full scale 2^23, with VREF = 2.37 V"""
+    registers = [(0x00, 3), (0x03, 3), (0x06, 1), (0x07, 1), (0x08, 1), (0x09, 1), (0x0A, 1), (0x0B, 1)]
+    types = [(0x00, 0x06), (0x06, 0x0C)]
+    groups = [(0x00, 0x06), (0x06, 0x09), (0x09, 0x0C)]
+
+    @staticmethod
+    def defaults(reg):
+        return reg.RegisterMap(gain=reg.GainReg(), status_com=reg.StatusComReg(), config1=reg.Config1Reg(),
+                               config2=reg.Config2Reg())
+
+    @staticmethod
+    def widths(regs) -> (int, int):
+        return (24, 24) if regs.config1.width == mcp3901_register.Config1Reg.Width.w24 else (16, 16)
+
+    @staticmethod
+    def data_rate(regs, mclk: float) -> float:
+        return regs.config1.data_rate(mclk)
+
+    @staticmethod
+    def write_loops(regs) -> bool:
+        return True
+
+    @staticmethod
+    def correction(regs, ch: int) -> (int, float):
+        return 0, 1.0
+
+
+_MODELS = {'MCP3911': _MCP3911, 'MCP3901': _MCP3901}
+
+
+class SimulatedBackend(Backend):
+
+    def __init__(self, device: str = 'MCP3911', sources=(None, None), mclk: float = 4e6, realtime: bool = False):
+        """
+        device is 'MCP3911' or 'MCP3901', sources the Source of each channel (None for 0 V),
+        mclk the master clock in Hz, and realtime paces get_data() at the data rate.
+        """
+        assert device.upper() in _MODELS, 'device must be MCP3911 or MCP3901'
+        assert len(sources) == 2, 'one source per channel'
+
+        self.model = _MODELS[device.upper()]
+        self.sources = [source or Constant() for source in sources]
+        self.mclk = mclk
+        self.realtime = realtime
+
+        reg = self.model.reg
+        self._mem = bytearray(bytes(self.model.defaults(reg)))
+        self.regs = reg.RegisterMap.from_buffer(self._mem)
+        """Register map of the device, shared with the bytes read and written by transfer()"""
+        self._writable = reg.Address.PHASE
+        self._index = 0
+        self._rate = self.data_rate
+        self._t0 = time.monotonic()
+
+    @property
+    def data_rate(self) -> float:
+        """Data ready rate in Hz of the current configuration"""
+        return self.model.data_rate(self.regs, self.mclk)
+
+    @property
+    def sample_index(self) -> int:
+        """Index of the next sample returned by get_data()"""
+        return self._index
+
+    def transfer(self, data: bytes) -> bytes:
+        addr = data[0] >> 1
+        if data[0] & 1:
+            self._latch()
+            return bytes(1) + bytes(self._mem[p] for p in self._walk(addr, len(data) - 1, True))
+
+        for p, b in zip(self._walk(addr, len(data) - 1, False), data[1:]):
+            if p >= self._writable:
+                self._mem[p] = b
+        return bytes(len(data))
+
+    def _register(self, p: int) -> (int, int):
+        for start, length in self.model.registers:
+            if start <= p < start + length:
+                return start, length
+
+    def _walk(self, addr: int, n: int, read: bool):
+        """Addresses accessed by an n byte transfer from addr, following the address loop settings"""
+        p = addr % len(self._mem)
+        for _ in range(n):
+            yield p
+
+            start, length = self._register(p)
+            p += 1
+            if start < 6 and self.model.widths(self.regs)[start // 3] == 16 and p == start + 2:
+                # 16-bit channel data is two bytes, the address moves on to the next register
+                p = start + 3
+
+            if read:
+                mode = self.regs.status_com.read
+                loops = {0b11: [(0, len(self._mem))], 0b10: self.model.types, 0b01: self.model.groups,
+                         0b00: [(start, start + length)]}[mode]
+            else:
+                loops = [(0, len(self._mem))] if self.model.write_loops(self.regs) else [(start, start + length)]
+            for first, end in loops:
+                if first <= start < end and p >= end:
+                    p = first
+
+    def _latch(self) -> None:
+        """Put the latest conversion into the data registers"""
+        if self.realtime:
+            index = max(int((time.monotonic() - self._t0) * self.data_rate) - 1, 0)
+        else:
+            index = max(self._index - 1, 0)
+        for ch in (0, 1):
+            width = self.model.widths(self.regs)[ch]
+            code = int(self._codes(ch, index, 1, width // 8)[0])
+            self._mem[3 * ch:3 * ch + 3] = (code & 0xFFFFFF).to_bytes(3, 'big') if width == 24 else \
+                (code & 0xFFFF).to_bytes(2, 'big') + bytes(1)
+
+    def _next_samples(self, count: int) -> int:
+        """Index of the first of count samples to return, waiting for their conversion if realtime"""
+        rate = self.data_rate
+        now = time.monotonic()
+        if rate != self._rate:
+            self._rate = rate
+            self._t0 = now - self._index / rate
+
+        start = self._index
+        if self.realtime:
+            start = max(start, int((now - self._t0) * rate))
+            delay = self._t0 + (start + count) / rate - now
+            if delay > 0:
+                time.sleep(delay)
+        self._index = start + count
+        return start
+
+    def _conversions(self, ch: int, start: int, count: int):
+        """
+        24-bit signed codes of conversions start to start + count - 1 of a channel, a new int32
+        numpy array if numpy is available, else a list
+        """
+        volts = self.sources[ch].generate(start, count, self.data_rate)
+        scale = self.model.scale * (1 << (self.regs.gain.pga_ch1 if ch else self.regs.gain.pga_ch0)) * (1 << 23)
+        # the digital offset and gain correction follow the conversion
+        offset, gain = self.model.correction(self.regs, ch)
+        numpy = _backend._load_numpy()
+        if numpy is not None:
+            codes = numpy.clip(numpy.rint(numpy.asarray(volts) * scale), -(1 << 23), (1 << 23) - 1)
+            if offset or gain != 1:
+                codes = numpy.clip(numpy.rint((codes + offset) * gain), -(1 << 23), (1 << 23) - 1)
+            return codes.astype(numpy.int32)
+        codes = [min(max(round(v * scale), -(1 << 23)), (1 << 23) - 1) for v in volts]
+        if offset or gain != 1:
+            codes = [min(max(round((c + offset) * gain), -(1 << 23)), (1 << 23) - 1) for c in codes]
+        return codes
+
+    def _codes(self, ch: int, start: int, count: int, byte_width: int):
+        """Signed codes of a channel as read with byte_width bytes per sample"""
+        codes = self._conversions(ch, start, count)
+        width = self.model.widths(self.regs)[ch]
+        # a code read with a different width than the device's is truncated, or followed by the
+        # next register's byte, modeled as zero
+        shift = 24 - width
+        extend = max(8 * byte_width - width, 0)
+        if 8 * byte_width < width:
+            shift += width - 8 * byte_width
+
+        if _backend._load_numpy() is not None:
+            codes >>= shift
+            codes <<= extend
+            return codes
+        return [c >> shift << extend for c in codes]
+
+    @staticmethod
+    def _fill(out, offset: int, step: int, codes) -> None:
+        numpy = _backend._load_numpy()
+        if numpy is not None:
+            view = numpy.frombuffer(out, dtype=numpy.int16 if memoryview(out).itemsize == 2 else numpy.int32)
+            view[offset:offset + step * len(codes):step] = codes
+        else:
+            for i, c in enumerate(codes):
+                out[offset + i * step] = c
+
+    def _stamp(self, timestamps, start: int, count: int) -> None:
+        """Data ready times of samples start to start + count - 1 in CLOCK_MONOTONIC nanoseconds"""
+        if timestamps is None:
+            return
+        t0 = round(self._t0 * 1e9)
+        period = 1e9 / self._rate
+        numpy = _backend._load_numpy()
+        if numpy is not None:
+            view = numpy.frombuffer(timestamps, dtype=numpy.int64)
+            view[:count] = t0 + numpy.rint(numpy.arange(start + 1, start + count + 1) * period).astype(numpy.int64)
+        else:
+            for i in range(count):
+                timestamps[i] = t0 + round((start + i + 1) * period)
+
+    def get_data(self, addr: int, byte_width: int, sample_len: int, out=None, timestamps=None):
+        assert addr in (0x00, 0x03), 'addr must be a channel data register'
+        assert 2 <= byte_width <= 3
+
+        if out is None:
+            out = new_buffer(sample_len, byte_width)
+        start = self._next_samples(sample_len)
+        self._fill(out, 0, 1, self._codes(addr // 3, start, sample_len, byte_width))
+        self._stamp(timestamps, start, sample_len)
+        return out
+
+    def get_data_both(self, addr: int, byte_widths: (int, int), sample_len: int, out=None, interleave=False,
+                      timestamps=None):
+        assert addr == 0x00, 'addr must be the channel 0 data register'
+        assert all(2 <= w <= 3 for w in byte_widths)
+
+        start = self._next_samples(sample_len)
+        self._stamp(timestamps, start, sample_len)
+        codes = [self._codes(ch, start, sample_len, byte_widths[ch]) for ch in (0, 1)]
+        if interleave:
+            if out is None:
+                out = new_buffer(2 * sample_len, max(byte_widths))
+            self._fill(out, 0, 2, codes[0])
+            self._fill(out, 1, 2, codes[1])
+            return out
+
+        if out is None:
+            out = (new_buffer(sample_len, byte_widths[0]), new_buffer(sample_len, byte_widths[1]))
+        self._fill(out[0], 0, 1, codes[0])
+        self._fill(out[1], 0, 1, codes[1])
+        return out
+
+    def close(self):
+        capture = getattr(self, '_capture', None)
+        if capture is not None:
+            capture.close()
+            self._capture = None
@@ -1,35 +1,159 @@
 #!/usr/bin/env python3
 
+import time
+import warnings
+
 try:
     from .ext import spi_rpi
 except ImportError:
-    pass
+    spi_rpi = None
 
 import pigpio
 
-from .backend import Backend
+from .backend import Backend, Wait, new_buffer
+from .spi_spidev import SPI_spidev
 
 
-class SPI_pigpio(Backend):
+class SPI_pigpiod(Backend):
+    """
+    Backend doing all I/O through the pigpio daemon, so pi may also be a remote host.
+    Every pin read and SPI frame is a socket round trip, which limits the data rate to a few
+    hundred samples per second; SPI_pigpio falls back to it when the spi_rpi extension is not built.
+    """
 
-    def __init__(self, pi: pigpio.pi, ch: int, baud: int, data_ready_pin: int):
+    def __init__(self, pi: pigpio.pi, ch: int, baud: int, data_ready_pin: int, wait=Wait.spin, timeout=None,
+                 poll_interval=50e-6):
+        """
+        wait selects how data ready is awaited: Wait.spin reads the pin continuously, Wait.spin_poll
+        sleeps poll_interval seconds between reads and Wait.event uses pigpio's wait_for_edge().
+        timeout is the number of seconds to wait for each data ready pulse before TimeoutError is
+        raised (None waits forever).
+        """
         self.pi = pi
         self.ch = ch
         self.baud = baud
         self.dr_pin = data_ready_pin
+        self.wait = wait
+        self.timeout = timeout
+        self.poll_interval = poll_interval
 
         pi.set_mode(data_ready_pin, pigpio.INPUT)
         pi.set_pull_up_down(data_ready_pin, pigpio.PUD_UP)
+        self.handle = pi.spi_open(ch, baud)
 
     def transfer(self, data: bytes) -> bytes:
-        spi = self.pi.spi_open(self.ch, self.baud)
-        _, data = self.pi.spi_xfer(spi, data)
-        self.pi.spi_close(spi)
+        _, data = self.pi.spi_xfer(self.handle, data)
         return bytes(data)
 
-    def get_data(self, addr: int, byte_width: int, sample_len: int) -> [int]:
+    def read_dr(self) -> bool:
+        """Level of the data ready pin, which is active low"""
+        return bool(self.pi.read(self.dr_pin))
+
+    def _wait_dr(self) -> int:
+        """Wait until data ready is asserted and return the CLOCK_MONOTONIC time in ns it was seen"""
+        deadline = None if not self.timeout else time.monotonic() + self.timeout
+        while self.pi.read(self.dr_pin):
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                raise TimeoutError('timed out waiting for data ready')
+            if self.wait == Wait.event:
+                if self.pi.wait_for_edge(self.dr_pin, pigpio.FALLING_EDGE, 1.0 if remaining is None else remaining):
+                    break
+            elif self.wait == Wait.spin_poll:
+                time.sleep(self.poll_interval)
+        return time.monotonic_ns()
+
+    def get_data(self, addr: int, byte_width: int, sample_len: int, out=None, timestamps=None):
         assert 2 <= byte_width <= 3
-        return spi_rpi.get_data(self.ch, self.baud, self.dr_pin, addr, byte_width, sample_len)
+        if out is None:
+            out = new_buffer(sample_len, byte_width)
+
+        frame = bytes([addr << 1 | 1]) + bytes(byte_width)
+        for i in range(sample_len):
+            t = self._wait_dr()
+            if timestamps is not None:
+                timestamps[i] = t
+            out[i] = int.from_bytes(self.transfer(frame)[1:], 'big', signed=True)
+        return out
+
+    def get_data_both(self, addr: int, byte_widths: (int, int), sample_len: int, out=None, interleave=False,
+                      timestamps=None):
+        assert all(2 <= w <= 3 for w in byte_widths)
+        if out is None:
+            out = new_buffer(2 * sample_len, max(byte_widths)) if interleave else \
+                (new_buffer(sample_len, byte_widths[0]), new_buffer(sample_len, byte_widths[1]))
+
+        w0, w1 = byte_widths
+        frame = bytes([addr << 1 | 1]) + bytes(w0 + w1)
+        for i in range(sample_len):
+            t = self._wait_dr()
+            if timestamps is not None:
+                timestamps[i] = t
+            rx = self.transfer(frame)
+            ch0 = int.from_bytes(rx[1:1 + w0], 'big', signed=True)
+            ch1 = int.from_bytes(rx[1 + w0:], 'big', signed=True)
+            if interleave:
+                out[2 * i], out[2 * i + 1] = ch0, ch1
+            else:
+                out[0][i], out[1][i] = ch0, ch1
+        return out
 
     def close(self):
-        pass
+        capture = getattr(self, '_capture', None)
+        if capture is not None:
+            capture.close()
+            self._capture = None
+        if self.handle is not None:
+            self.pi.spi_close(self.handle)
+            self.handle = None
+
+
+if spi_rpi is None:
+
+    class SPI_pigpio(SPI_pigpiod):
+        """
+        SPI_pigpio without the spi_rpi extension built: everything goes through the pigpio daemon.
+        spin_budget, gpio_chip and metrics only apply to the extension; a RuntimeWarning names those
+        given, and stats() reports zeros.
+        """
+
+        def __init__(self, pi: pigpio.pi, ch: int, baud: int, data_ready_pin: int, wait=Wait.spin, timeout=None,
+                     spin_budget=1000, poll_interval=50e-6, gpio_chip='/dev/gpiochip0', metrics=False):
+            ignored = [name for name, value, default in (('spin_budget', spin_budget, 1000),
+                                                         ('gpio_chip', gpio_chip, '/dev/gpiochip0'),
+                                                         ('metrics', metrics, False)) if value != default]
+            if ignored:
+                warnings.warn('the spi_rpi extension is not built, SPI_pigpio ignores {}'.format(', '.join(ignored)),
+                              RuntimeWarning, stacklevel=2)
+            super().__init__(pi, ch, baud, data_ready_pin, wait, timeout, poll_interval)
+
+else:
+
+    class SPI_pigpio(SPI_spidev):
+        """
+        Backend using pigpio to configure the data ready pin, and the spi_rpi extension for SPI and
+        for reading the pin through /dev/gpiomem
+        """
+
+        def __init__(self, pi: pigpio.pi, ch: int, baud: int, data_ready_pin: int, wait=Wait.spin, timeout=None,
+                     spin_budget=1000, poll_interval=50e-6, gpio_chip='/dev/gpiochip0', metrics=False):
+            """
+            wait selects how captures wait for data ready (see Wait), and timeout is the number of
+            seconds to wait for each data ready pulse before TimeoutError is raised (None waits forever).
+            spin_budget and poll_interval tune Wait.spin_poll; gpio_chip is used by Wait.event.
+            metrics enables the counters of stats(); it can also be toggled later.
+            """
+            self.pi = pi
+            self.bus = 0
+            self.ch = ch
+            self.baud = baud
+            self.dr_pin = data_ready_pin
+
+            pi.set_mode(data_ready_pin, pigpio.INPUT)
+            pi.set_pull_up_down(data_ready_pin, pigpio.PUD_UP)
+
+            self.event_fd = -1
+            if wait == Wait.event:
+                self.event_fd = spi_rpi.request_line_event(gpio_chip, data_ready_pin)
+            self._open_session('/dev/spidev0.{}'.format(ch), '/dev/gpiomem', wait, timeout, spin_budget,
+                               poll_interval, metrics)
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+
+import os
+
+try:
+    from .ext import spi_rpi
+except ImportError:
+    spi_rpi = None
+
+from .backend import Backend, Stats, Wait, new_buffer, new_float_buffer
+
+
+class SPI_spidev(Backend):
+    """
+    Backend talking to /dev/spidevB.C directly through the spi_rpi extension, with the data ready
+    pin read through the GPIO character device. No pigpio daemon is involved.
+    """
+
+    def __init__(self, ch: int, baud: int, data_ready_pin: int, bus: int = 0, wait=Wait.event, timeout=None,
+                 spin_budget=1000, poll_interval=50e-6, gpio_chip='/dev/gpiochip0', gpio_mem=None, metrics=False):
+        """
+        wait selects how captures wait for data ready (see Wait), and timeout is the number of
+        seconds to wait for each data ready pulse before TimeoutError is raised (None waits forever).
+        spin_budget and poll_interval tune Wait.spin_poll. The pin is requested with its pull-up from
+        gpio_chip; the spin waits read its level with an ioctl each, or from the mapping of gpio_mem,
+        such as '/dev/gpiomem', if given. metrics enables the counters of stats().
+        """
+        if spi_rpi is None:
+            raise RuntimeError('the spi_rpi extension is not built')
+
+        self.bus = bus
+        self.ch = ch
+        self.baud = baud
+        self.dr_pin = data_ready_pin
+        self.event_fd = spi_rpi.request_line_event(gpio_chip, data_ready_pin, pull_up=True)
+        self._open_session('/dev/spidev{}.{}'.format(bus, ch), gpio_mem, wait, timeout, spin_budget, poll_interval,
+                           metrics)
+
+    def _open_session(self, spi_path: str, gpio_mem, wait, timeout, spin_budget, poll_interval, metrics):
+        try:
+            self.session = spi_rpi.Session(spi_path, self.baud, self.dr_pin, gpio_mem,
+                                           wait=wait, timeout=timeout or 0, spin_budget=spin_budget,
+                                           poll_interval_us=round(poll_interval * 1e6), event_fd=self.event_fd,
+                                           metrics=metrics)
+        except OSError:
+            self._close_event_fd()
+            raise
+
+    def _close_event_fd(self):
+        if self.event_fd >= 0:
+            os.close(self.event_fd)
+            self.event_fd = -1
+
+    def transfer(self, data: bytes) -> bytes:
+        return self.session.transfer(data)
+
+    def transfer_many(self, frames) -> list:
+        return self.session.transfer_many(frames)
+
+    def read_dr(self) -> bool:
+        """Level of the data ready pin, which is active low"""
+        return self.session.read_dr()
+
+    def get_data(self, addr: int, byte_width: int, sample_len: int, out=None, timestamps=None):
+        assert 2 <= byte_width <= 3
+        if out is None:
+            out = new_buffer(sample_len, byte_width)
+        return self.session.get_data(addr, byte_width, sample_len, out, timestamps)
+
+    def get_data_both(self, addr: int, byte_widths: (int, int), sample_len: int, out=None, interleave=False,
+                      timestamps=None):
+        assert all(2 <= w <= 3 for w in byte_widths)
+        if interleave:
+            if out is None:
+                out = new_buffer(2 * sample_len, max(byte_widths))
+            return self.session.get_data_both(addr, *byte_widths, sample_len, out, None, timestamps)
+
+        if out is None:
+            out = (new_buffer(sample_len, byte_widths[0]), new_buffer(sample_len, byte_widths[1]))
+        return self.session.get_data_both(addr, *byte_widths, sample_len, *out, timestamps)
+
+    def get_data_decimated(self, addr: int, byte_width: int, sample_len: int, decimator, out=None):
+        assert 2 <= byte_width <= 3
+        if out is None:
+            out = new_float_buffer(sample_len)
+        return self.session.get_data(addr, byte_width, sample_len, out, None, decimator.native())
+
+    def get_data_stats(self, addr: int, byte_width: int, sample_len: int, stats, out=None):
+        assert 2 <= byte_width <= 3
+        return self.session.get_data(addr, byte_width, sample_len, out, None, None, stats.native())
+
+    def start_capture(self, addr: int, byte_width: int, capacity: int, count: int = 0,
+                      timestamps: bool = False, decimator=None) -> None:
+        assert 2 <= byte_width <= 3
+        self.session.start_capture(addr, byte_width, capacity, count, timestamps,
+                                   decimator.native() if decimator is not None else None)
+
+    def read_capture(self, out, min_samples: int = 0, timeout: float = None, timestamps=None) -> int:
+        return self.session.read_capture(out, min_samples, timeout, timestamps)
+
+    def capture_running(self) -> bool:
+        return self.session.capturing
+
+    def capture_available(self) -> int:
+        return self.session.capture_available
+
+    def capture_dropped(self) -> int:
+        return self.session.capture_dropped
+
+    def stop_capture(self) -> None:
+        self.session.stop_capture()
+
+    def capture_fileno(self) -> int:
+        return self.session.capture_fileno()
+
+    def arm_capture(self, min_samples: int) -> None:
+        self.session.arm_capture(min_samples)
+
+    @property
+    def metrics(self) -> bool:
+        return self.session.metrics
+
+    @metrics.setter
+    def metrics(self, enabled: bool) -> None:
+        self.session.metrics = enabled
+
+    def stats(self) -> Stats:
+        return Stats.from_dict(self.session.stats())
+
+    def reset_stats(self) -> None:
+        self.session.reset_stats()
+
+    def close(self):
+        self.session.close()
+        self._close_event_fd()
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+
+import unittest
+from array import array
+from unittest.mock import patch
+
+from adc.backends import backend
+from adc.backends.backend import (Backend, LatencyHistogram, Stats, find_gaps, new_buffer, new_timestamps,
+                                 scale_codes, sign_extend)
+from adc.backends.simulated import Constant, SimulatedBackend, Sine
+
+
+class TestBackend(unittest.TestCase):
+
+    def test_new_buffer(self):
+        self.assertEqual(new_buffer(4, 2).typecode, 'h')
+        self.assertEqual(new_buffer(4, 3).typecode, 'i')
+        self.assertEqual(list(new_buffer(3)), [0, 0, 0])
+
+    def check_sign_extend(self):
+        data = array('i', [0x000000, 0x7FFFFF, 0x800000, 0xFFFFFF])
+        sign_extend(data, 24)
+        self.assertEqual(list(data), [0, 8388607, -8388608, -1])
+
+        data = array('i', [0x0000, 0x7FFF, 0x8000, 0xFFFF])
+        sign_extend(data, 16)
+        self.assertEqual(list(data), [0, 32767, -32768, -1])
+
+        data = array('h', [0, 32767, -32768, -1])
+        sign_extend(data, 16)
+        self.assertEqual(list(data), [0, 32767, -32768, -1])
+
+    def test_sign_extend(self):
+        self.check_sign_extend()
+
+    def test_sign_extend_fallback(self):
+        with patch.object(backend, 'spi_rpi', None), patch.object(backend, 'numpy', None):
+            self.check_sign_extend()
+
+    def check_scale_codes(self):
+        self.assertEqual(list(scale_codes(array('i', [0, 2, -4]), 0.5)), [0.0, 1.0, -2.0])
+        out = array('f', [0.0] * 4)
+        self.assertIs(scale_codes(array('h', [1, -1]), 0.25, out), out)
+        self.assertEqual(list(out), [0.25, -0.25, 0.0, 0.0])
+
+        data = array('d', [1.0, 3.0])
+        scale_codes(data, 2.0, data)
+        self.assertEqual(list(data), [2.0, 6.0])
+
+    def test_scale_codes(self):
+        self.check_scale_codes()
+
+    def test_scale_codes_fallback(self):
+        with patch.object(backend, 'spi_rpi', None):
+            self.check_scale_codes()
+        with patch.object(backend, 'spi_rpi', None), patch.object(backend, 'numpy', None):
+            self.check_scale_codes()
+
+    def check_find_gaps(self):
+        timestamps = array('q', [0, 100, 200, 400, 500, 1010, 1110, 1270])
+        gaps = find_gaps(timestamps, 100)
+        self.assertEqual(gaps.missed, 6)
+        self.assertEqual(gaps.indices, [3, 5, 7])
+        self.assertEqual(gaps.counts, [1, 4, 1])
+        self.assertEqual(find_gaps(timestamps, 100, tolerance=0.6).indices, [3, 5])
+        self.assertEqual(find_gaps(new_timestamps(1), 100).missed, 0)
+
+    def test_find_gaps(self):
+        self.check_find_gaps()
+
+    def test_find_gaps_fallback(self):
+        with patch.object(backend, 'numpy', None):
+            self.check_find_gaps()
+
+    def test_get_data_both_fallback(self):
+        simulated = SimulatedBackend('MCP3911', (Constant(0.6), Sine(0.1, 50)))
+        expected = simulated.get_data_both(0x00, (3, 3), 8)
+        simulated = SimulatedBackend('MCP3911', (Constant(0.6), Sine(0.1, 50)))
+        timestamps = new_timestamps(8)
+        ch0, ch1 = Backend.get_data_both(simulated, 0x00, (3, 3), 8, timestamps=timestamps)
+        self.assertEqual((list(ch0), list(ch1)), (list(expected[0]), list(expected[1])))
+        self.assertEqual(find_gaps(timestamps, 1e9 / simulated.data_rate).missed, 0)
+
+        data = Backend.get_data_both(simulated, 0x00, (3, 3), 2, interleave=True)
+        self.assertEqual(list(data[0::2]), list(expected[0][:2]))
+
+    def test_latency_histogram(self):
+        stats = Stats.from_dict({'transfers': 4, 'bytes': 16, 'samples': 4, 'spin_iterations': 9, 'wait_ns': 100,
+                                 'transfer_ns': 40, 'timeouts': 0, 'latency': [(96, 104, 3), (1024, 1152, 1)]})
+        self.assertEqual(stats.samples, 4)
+        self.assertEqual(stats.latency.count, 4)
+        self.assertEqual(stats.latency.percentile(50), 104)
+        self.assertEqual(stats.latency.percentile(99), 1152)
+        self.assertEqual(stats.latency.mean, (100 * 3 + 1088) / 4)
+        self.assertEqual(LatencyHistogram().percentile(99), 0)
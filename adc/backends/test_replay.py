@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+
+import os
+import tempfile
+import time
+import unittest
+from array import array
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from adc.backends.replay import ReplayBackend
+from adc.backends.simulated import Constant, SimulatedBackend
+from adc.mcp3901 import MCP3901
+from adc.mcp3911 import MCP3911
+from adc.mcp3911_register import *
+from adc.running_stats import RunningStats
+
+
+class TestReplayBackend(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.dir.name, name)
+
+    def test_raw(self):
+        path = self.path('codes.raw')
+        with open(path, 'wb') as f:
+            f.write(array('i', (i << 10 for i in range(-50, 50))).tobytes())
+        backend = ReplayBackend(path)
+        ad = MCP3911(backend)
+        self.assertEqual(list(ad.read_data_array(60)), [i << 10 for i in range(-50, 10)])
+        # the recording starts over
+        self.assertEqual(list(ad.read_data_array(60)), [i << 10 for i in list(range(10, 50)) + list(range(-50, -30))])
+        self.assertEqual(list(ad.read_data_array(4, ch=1)), [0] * 4)
+
+        ad.write_reg_status_com(StatusComReg(width=StatusComReg.Width.both_ch_16bit))
+        code = ad.read_data(width=16)
+        self.assertIn(code >> 2, range(-50, 50))
+        # the next sample, a 16-bit code followed by the next register's byte
+        self.assertEqual(ad.read_data(width=24), code + 4 << 8)
+        backend.close()
+
+    @unittest.skipIf(numpy is None, 'requires numpy')
+    def test_npy(self):
+        path = self.path('codes.npy')
+        codes = numpy.arange(200, dtype=numpy.int16).reshape(100, 2) - 100
+        numpy.save(path, codes)
+        backend = ReplayBackend(path, device='MCP3901', loop=False)
+        ad = MCP3901(backend)
+        ch0, ch1 = ad.read_data_array_both(100, width=24)
+        self.assertEqual(list(ch0), (codes[:, 0].astype(int) << 8).tolist())
+        self.assertEqual(list(ch1), (codes[:, 1].astype(int) << 8).tolist())
+        with self.assertRaises(EOFError):
+            ad.read_data_array(1)
+        backend.close()
+
+    def test_recording(self):
+        simulated = SimulatedBackend('MCP3911', (Constant(0.6), None), realtime=True)
+        ad = MCP3911(simulated)
+        ad.write_reg_config(ConfigReg(osr=ConfigReg.Osr.osr32))
+        path = self.path('noise.adc')
+        with ad.record(path, block_size=1024):
+            time.sleep(0.05)
+
+        backend = ReplayBackend(path)
+        self.assertEqual(backend.data_rate, simulated.data_rate)
+        replay = MCP3911(backend)
+        self.assertEqual(replay.read_reg_config().osr, ConfigReg.Osr.osr32)
+        stats = replay.measure(backend.length)
+        self.assertEqual((stats.min, stats.max), (round(0.6 * 1.5 / 1.2 * 2 ** 23),) * 2)
+
+        # the master clock follows the recording
+        backend.close()
+        backend = ReplayBackend(path, realtime=True)
+        replay = MCP3911(backend)
+        replay.write_reg_config(ConfigReg(osr=ConfigReg.Osr.osr64))
+        self.assertEqual(backend.data_rate, simulated.data_rate / 2)
+        start = time.monotonic()
+        replay.read_data_array(256)
+        self.assertGreater(time.monotonic() - start, 0.9 * 256 / backend.data_rate)
+        backend.close()
+
+    def test_stream(self):
+        path = self.path('codes.raw')
+        with open(path, 'wb') as f:
+            f.write(array('h', range(1000)).tobytes())
+        backend = ReplayBackend(path, width=16, loop=False)
+        ad = MCP3911(backend)
+        ad.write_reg_status_com(StatusComReg(width=StatusComReg.Width.both_ch_16bit))
+        stats = RunningStats()
+        with self.assertRaises(EOFError):
+            for _ in ad.stream(100, width=16, stats=stats, timeout=5):
+                pass
+        # the capture reads past the end a chunk at a time, the samples before it are all there
+        self.assertGreater(stats.count, 0)
+        self.assertEqual((stats.min, stats.max), (0, stats.count - 1))
+        backend.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
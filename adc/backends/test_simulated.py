@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+
+import math
+import os
+import tempfile
+import time
+import unittest
+from array import array
+
+from adc.backends.simulated import Constant, File, Noise, SimulatedBackend, Sine
+from adc.decimate import Boxcar, CIC
+from adc.mcp3901 import MCP3901
+from adc.mcp3911 import MCP3911
+from adc.mcp3911_register import *
+from adc.running_stats import RunningStats
+
+
+class TestSimulatedBackend(unittest.TestCase):
+
+    def setUp(self):
+        self.backend = SimulatedBackend('MCP3911', (Constant(0.6), Sine(0.1, 50)))
+        self.ad = MCP3911(self.backend)
+
+    def test_data_rate(self):
+        self.assertEqual(self.backend.data_rate, 4e6 / (4 * 256))
+        self.ad.write_reg_config(ConfigReg(pre=ConfigReg.Pre.pre2, osr=ConfigReg.Osr.osr4096))
+        self.assertEqual(self.backend.data_rate, 4e6 / (2 * 4 * 4096))
+        self.assertEqual(SimulatedBackend('MCP3901', mclk=8e6).data_rate, 8e6 / (4 * 64))
+
+    def test_codes(self):
+        self.assertEqual(list(self.ad.read_data_array(2)), [round(0.6 * 1.5 / 1.2 * 2 ** 23)] * 2)
+        sine = Sine(0.1 * 1.5 / 1.2 * 2 ** 23, 50)
+        self.assertEqual(self.ad.read_data_array(1, ch=1)[0], round(sine.generate(2, 1, 3906.25)[0]))
+        self.assertEqual(self.backend.sample_index, 3)
+
+        self.ad.write_reg_gain(GainReg(pga_ch0=GainReg.Pga.x2))
+        self.assertEqual(self.ad.read_data(), 2 ** 23 - 1)
+
+        self.ad.write_reg_status_com(StatusComReg(width=StatusComReg.Width.both_ch_16bit))
+        self.assertEqual(self.ad.read_data(width=16), 2 ** 15 - 1)
+        self.assertEqual(self.ad.read_data(width=24), (2 ** 15 - 1) << 8)
+
+    def test_both(self):
+        ch0, ch1 = self.ad.read_data_array_both(100)
+        self.assertEqual(set(ch0), {round(0.6 * 1.5 / 1.2 * 2 ** 23)})
+        self.assertEqual(ch1[25], round(Sine(0.1 * 1.5 / 1.2 * 2 ** 23, 50).generate(25, 1, 3906.25)[0]))
+        data = self.ad.read_data_array_both(4, interleave=True)
+        self.assertEqual(data[0], ch0[0])
+        self.assertEqual(len(data), 8)
+
+    def test_address_loop(self):
+        self.ad.write_reg_status_com(StatusComReg(read=StatusComReg.Read.types))
+        data = self.ad.read_reg(Address.CHANNEL0, 9)
+        self.assertEqual(data[6:], data[:3])
+        self.assertEqual(self.ad.read_reg(Address.VREFCAL, 2)[1], self.ad.read_reg(Address.MOD)[0])
+
+        self.ad.write_reg_status_com(StatusComReg(read=StatusComReg.Read.off, width=StatusComReg.Width.both_ch_16bit))
+        self.assertEqual(self.ad.read_reg(Address.CHANNEL1, 4), bytes([0x00, 0x00] * 2))
+        self.assertEqual(self.ad.read_reg(Address.CONFIG, 4), bytes(ConfigReg()) * 2)
+
+        self.ad.write_reg(Address.CHANNEL0, bytes(3))
+        self.assertEqual(self.ad.read_reg(Address.CHANNEL0, 2), bytes([0x60, 0x00]))
+
+    def test_realtime(self):
+        self.backend.realtime = True
+        self.ad.write_reg_config(ConfigReg(osr=ConfigReg.Osr.osr32))
+        start = time.monotonic()
+        self.ad.read_data_array(1000)
+        self.assertGreaterEqual(time.monotonic() - start, 1000 / 31250 * 0.9)
+
+        time.sleep(0.01)
+        index = self.backend.sample_index
+        self.ad.read_data_array(10)
+        self.assertGreater(self.backend.sample_index - index, 100)
+
+    def test_timestamps(self):
+        self.backend.realtime = True
+        self.ad.write_reg_config(ConfigReg(osr=ConfigReg.Osr.osr32))
+        data, first = self.ad.read_data_array(100, timestamps=True)
+        self.assertEqual(len(first), 100)
+        self.assertEqual(first[1] - first[0], 32000)
+        self.assertLessEqual(first[-1], time.monotonic_ns())
+        self.assertEqual(self.ad.find_gaps(first).missed, 0)
+
+        time.sleep(0.01)
+        _, second = self.ad.read_data_array(10, timestamps=True)
+        gaps = self.ad.find_gaps(first + second)
+        self.assertEqual(gaps.indices, [100])
+        self.assertEqual(gaps.missed, self.backend.sample_index - 110)
+
+    def test_capture_timestamps(self):
+        self.ad.start_capture(capacity=1024, timestamps=True)
+        time.sleep(0.01)
+        self.ad.stop_capture()
+        data, timestamps = self.ad.read_available(timestamps=True)
+        self.assertEqual(len(data), len(timestamps))
+        self.assertEqual(timestamps[-1] - timestamps[0], round((len(data) - 1) * 256000))
+
+        self.ad.start_capture(capacity=1024)
+        self.ad.stop_capture()
+        with self.assertRaises(AssertionError):
+            self.ad.read_available(timestamps=True)
+
+    def test_decimate(self):
+        code = round(0.6 * 1.5 / 1.2 * 2 ** 23)
+        data = self.ad.read_data_array(10, decimate=CIC(16))
+        self.assertEqual(data.typecode, 'd')
+        self.assertEqual(list(data[2:]), [code] * 8)
+        self.assertEqual(self.backend.sample_index, 160)
+
+        with self.ad.stream(4, decimate=Boxcar(8), timeout=5) as stream:
+            self.assertEqual(list(next(stream)), [code] * 4)
+
+        self.ad.start_capture(capacity=64, decimate=Boxcar(4))
+        time.sleep(0.01)
+        self.ad.stop_capture()
+        self.assertEqual(set(self.ad.read_available()), {code})
+
+    def test_running_stats(self):
+        code = round(0.6 * 1.5 / 1.2 * 2 ** 23)
+        stats = RunningStats()
+        data = self.ad.read_data_array(10, stats=stats)
+        self.assertEqual(list(data), [code] * 10)
+        self.assertEqual(self.ad.measure(10000, stats=stats), stats)
+        self.assertEqual((stats.count, stats.mean, stats.stdev, stats.clipped), (10010, code, 0, 0))
+
+        self.ad.write_reg_gain(GainReg(pga_ch0=GainReg.Pga.x2))
+        with self.ad.stream(8, stats=stats, timeout=5) as stream:
+            next(stream)
+        self.assertEqual((stats.count, stats.max, stats.clipped), (10018, 2 ** 23 - 1, 8))
+
+    def test_stats(self):
+        self.ad.read_data_array(10)
+        stats = self.ad.stats()
+        self.assertEqual((stats.samples, stats.transfers, stats.latency.count), (0, 0, 0))
+        self.ad.reset_stats()
+
+    def test_volts(self):
+        data = self.ad.read_data_array(4, unit='volts')
+        self.assertEqual(data.typecode, 'd')
+        for v in data:
+            self.assertAlmostEqual(v, 0.6, places=6)
+        self.assertAlmostEqual(self.ad.volts_per_code(), 1.2 / 1.5 / 2 ** 23)
+
+        self.ad.write_reg_gain(GainReg(pga_ch1=GainReg.Pga.x4))
+        out = array('f', bytes(16))
+        samples, timestamps = self.ad.read_data_array(4, ch=1, width=16, out=out, timestamps=True, unit='volts')
+        self.assertIs(samples, out)
+        self.assertEqual(len(timestamps), 4)
+        self.assertAlmostEqual(samples[0], 0.1 * math.sin(2 * math.pi * 50 * 4 / self.backend.data_rate), places=3)
+        self.assertAlmostEqual(self.ad.read_data_array(2, decimate=Boxcar(2), unit='volts')[1], 0.6, places=6)
+
+        with self.ad.stream(8, timeout=5, unit='volts') as stream:
+            self.assertAlmostEqual(next(stream)[7], 0.6, places=6)
+
+        # one factor per gain setting, channel and width
+        self.ad.write_reg_gain(GainReg())
+        self.ad.volts_per_code()
+        self.assertEqual(len(self.ad._scales), 3)
+
+    def test_sources(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.txt', delete=False) as f:
+            f.write('0.1\n0.2\n0.3\n')
+        try:
+            self.assertEqual(list(File(f.name).generate(2, 3, 1000)), [0.3, 0.1, 0.2])
+            self.assertEqual(list(File(f.name, loop=False).generate(2, 3, 1000)), [0.3, 0.0, 0.0])
+        finally:
+            os.unlink(f.name)
+        self.assertEqual(list(Noise(0.1, seed=1).generate(0, 5, 1000)), list(Noise(0.1, seed=1).generate(0, 5, 1000)))
+
+    def test_mcp3901(self):
+        ad = MCP3901(SimulatedBackend('MCP3901', (None, Constant(-0.1))), cache=True)
+        self.assertEqual(ad.read_data(ch=1), round(-0.1 * 3 / 2.37 * 2 ** 15))
+        self.assertEqual(len(list(zip(range(3), ad.stream(100, timeout=5)))), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+
+import importlib
+import sys
+import unittest
+from array import array
+from unittest.mock import Mock, patch
+
+import pigpio
+
+from adc.backends import ext, spi_pigpio
+from adc.backends.backend import Wait, new_timestamps
+from adc.backends.spi_pigpio import SPI_pigpiod
+from adc.mcp3911 import MCP3911
+from adc.mcp3911_register import *
+
+
+class TestSPIPigpiod(unittest.TestCase):
+
+    def setUp(self):
+        self.pi = Mock(spec=pigpio.pi)
+        self.pi.spi_open.return_value = 7
+        self.pi.read.return_value = 0
+        rx = b'\x00\xff\xfe\xfd\x01\x02\x03'
+        self.pi.spi_xfer.side_effect = lambda handle, data: (len(data), bytearray(rx[:len(data)]))
+        self.backend = SPI_pigpiod(self.pi, 0, 1000000, 13)
+
+    def test_open_once(self):
+        self.pi.spi_open.assert_called_once_with(0, 1000000)
+        self.pi.set_pull_up_down.assert_called_once_with(13, pigpio.PUD_UP)
+        self.backend.transfer(b'\x01\x00')
+        self.backend.transfer(b'\x01\x00')
+        self.pi.spi_open.assert_called_once_with(0, 1000000)
+        self.backend.close()
+        self.pi.spi_close.assert_called_once_with(7)
+
+    def test_get_data(self):
+        timestamps = new_timestamps(2)
+        data = MCP3911(self.backend).read_data_array(2, width=16, timestamps=timestamps)[0]
+        self.assertEqual(data.typecode, 'h')
+        self.assertEqual(list(data), [-2, -2])
+        self.assertTrue(all(timestamps))
+        self.pi.spi_xfer.assert_called_with(7, bytes([Address.CHANNEL0 << 1 | 1, 0, 0]))
+
+        ch0, ch1 = self.backend.get_data_both(0, (3, 3), 2)
+        self.assertEqual((ch0[0], ch1[0]), (-259, 0x010203))
+
+    def test_wait_timeout(self):
+        self.pi.read.return_value = 1
+        self.backend.timeout = 0.01
+        self.backend.wait = Wait.spin_poll
+        with self.assertRaises(TimeoutError):
+            self.backend.get_data(0, 3, 1)
+
+        self.backend.wait = Wait.event
+        self.pi.wait_for_edge.return_value = True
+        self.assertEqual(self.backend.get_data(0, 3, 1)[0], -259)
+        self.pi.wait_for_edge.assert_called_once()
+
+    def test_capture(self):
+        self.backend.start_capture(0, 2, 16, 4)
+        out = array('h', bytes(8))
+        self.assertEqual(self.backend.read_capture(out, 4, 1.0), 4)
+        self.assertEqual(list(out), [-2] * 4)
+        self.backend.close()
+
+    def test_fallback(self):
+        saved = getattr(ext, 'spi_rpi', None)
+        try:
+            with patch.dict(sys.modules, {'adc.backends.ext.spi_rpi': None}):
+                if saved is not None:
+                    del ext.spi_rpi
+                fallback = importlib.reload(spi_pigpio)
+            self.assertTrue(issubclass(fallback.SPI_pigpio, fallback.SPI_pigpiod))
+            with self.assertWarnsRegex(RuntimeWarning, 'ignores gpio_chip, metrics'):
+                backend = fallback.SPI_pigpio(self.pi, 0, 1000000, 13, gpio_chip='/dev/gpiochip4', metrics=True)
+            self.assertEqual(backend.stats().samples, 0)
+        finally:
+            if saved is not None:
+                ext.spi_rpi = saved
+            importlib.reload(spi_pigpio)
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+
+import os
+import struct
+import sys
+import tempfile
+import unittest
+from array import array
+
+try:
+    from adc.backends.ext import spi_rpi
+except ImportError:
+    spi_rpi = None
+
+GPLEV0 = 13 * 4
+DR_PIN = 13
+
+
+@unittest.skipUnless(spi_rpi is not None and sys.platform.startswith('linux'), 'requires the built extension on Linux')
+class TestSession(unittest.TestCase):
+
+    def setUp(self):
+        fd, self.gpio_path = tempfile.mkstemp()
+        os.write(fd, bytes(4096))
+        os.close(fd)
+
+    def tearDown(self):
+        os.unlink(self.gpio_path)
+
+    def set_dr(self, level: int):
+        with open(self.gpio_path, 'r+b') as f:
+            f.seek(GPLEV0)
+            f.write(struct.pack('=I', level << DR_PIN))
+
+    def test_read_dr(self):
+        with spi_rpi.Session(None, 1000000, DR_PIN, self.gpio_path) as session:
+            self.assertFalse(session.read_dr())
+            self.set_dr(1)
+            self.assertTrue(session.read_dr())
+            self.set_dr(0)
+            self.assertFalse(session.read_dr())
+        self.assertTrue(session.closed)
+
+    def test_close(self):
+        session = spi_rpi.Session(None, 1000000, DR_PIN, self.gpio_path)
+        self.assertFalse(session.closed)
+        session.close()
+        session.close()
+        self.assertTrue(session.closed)
+        with self.assertRaises(ValueError):
+            session.read_dr()
+        with self.assertRaises(ValueError):
+            session.get_data(0, 3, 1, array('i', [0]))
+
+    def test_no_spi(self):
+        with spi_rpi.Session(None, 1000000, DR_PIN, self.gpio_path) as session:
+            with self.assertRaises(ValueError):
+                session.transfer(b'\x00')
+            with self.assertRaises(ValueError):
+                session.transfer_many([b'\x00'])
+
+    def test_read_dr_from_line_fd(self):
+        r, w = os.pipe()
+        try:
+            with spi_rpi.Session(None, 1000000, DR_PIN, None, event_fd=r, timeout=0.05) as session:
+                # a pipe is not a GPIO line, so the level ioctl fails instead of spinning forever
+                with self.assertRaises(OSError):
+                    session.read_dr()
+                with self.assertRaises(OSError):
+                    session.wait_dr()
+        finally:
+            os.close(r)
+            os.close(w)
+
+    def test_open_failure(self):
+        with self.assertRaises(OSError):
+            spi_rpi.Session(self.gpio_path, 1000000, DR_PIN, None)
+        with self.assertRaises(OSError):
+            spi_rpi.Session(None, 1000000, DR_PIN, os.path.join(self.gpio_path, 'missing'))
+
+    def test_wait_dr_spin(self):
+        for wait in [spi_rpi.WAIT_SPIN, spi_rpi.WAIT_SPIN_POLL]:
+            with spi_rpi.Session(None, 1000000, DR_PIN, self.gpio_path, wait=wait, timeout=0.05,
+                                 spin_budget=10, poll_interval_us=1000) as session:
+                self.set_dr(0)
+                session.wait_dr()
+                self.set_dr(1)
+                with self.assertRaises(TimeoutError):
+                    session.wait_dr()
+
+    def test_stats(self):
+        with spi_rpi.Session(None, 1000000, DR_PIN, self.gpio_path, timeout=0.01) as session:
+            self.assertFalse(session.metrics)
+            session.wait_dr()
+            self.assertEqual(session.stats()['spin_iterations'], 0)
+
+            session.metrics = True
+            session.wait_dr()
+            self.set_dr(1)
+            with self.assertRaises(TimeoutError):
+                session.wait_dr()
+            stats = session.stats()
+            self.assertEqual(stats['timeouts'], 1)
+            self.assertGreater(stats['spin_iterations'], 1)
+            self.assertGreaterEqual(stats['wait_ns'], 10000000)
+            self.assertEqual(stats['latency'], [])
+
+            session.reset_stats()
+            self.assertEqual(session.stats()['timeouts'], 0)
+
+    def test_wait_dr_event(self):
+        r, w = os.pipe()
+        try:
+            with spi_rpi.Session(None, 1000000, DR_PIN, None, wait=spi_rpi.WAIT_EVENT, timeout=0.05,
+                                 event_fd=r) as session:
+                os.write(w, bytes(16))
+                session.wait_dr()
+                with self.assertRaises(TimeoutError):
+                    session.wait_dr()
+        finally:
+            os.close(r)
+            os.close(w)
+
+    def test_wait_dr_event_without_fd(self):
+        with spi_rpi.Session(None, 1000000, DR_PIN, self.gpio_path, wait=spi_rpi.WAIT_EVENT) as session:
+            with self.assertRaises(ValueError):
+                session.wait_dr()
+
+    def test_capture_requires_spi(self):
+        with spi_rpi.Session(None, 1000000, DR_PIN, self.gpio_path) as session:
+            with self.assertRaises(RuntimeError):
+                session.read_capture(array('i', [0]))
+            with self.assertRaises(ValueError):
+                session.start_capture(0, 3, 16)
+            self.assertFalse(session.capturing)
+            self.assertEqual(session.capture_available, 0)
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+
+"""
+Offset and gain calibration
+
+A Calibration holds the offset and gain correction of both channels, applied as the MCP3911's
+OFFCAL and GAINCAL registers do: corrected = (code + offset) * gain, in 24-bit codes. Measure it
+with the driver's calibrate(), first with the inputs shorted, then with a reference applied,
+and load it with apply_calibration(): the MCP3911 corrects in the chip, so samples arrive
+corrected, while the MCP3901, which has no correction registers, corrects samples in software.
+Profiles are saved to and loaded from JSON files.
+"""
+
+import json
+
+from .backends import backend as _backend
+
+
+def _from_word(data) -> int:
+    """Signed value of a 24-bit two's complement register"""
+    return int.from_bytes(bytes(data), 'big', signed=True)
+
+
+def _to_word(value: int) -> bytes:
+    assert -(1 << 23) <= value < 1 << 23, 'correction does not fit in 24 bits'
+    return value.to_bytes(3, 'big', signed=True)
+
+
+class Calibration(object):
+    """
+    Offset and gain correction of both channels: offset is added to each channel's 24-bit codes
+    and the sum multiplied by gain
+    """
+
+    def __init__(self, offset=(0, 0), gain=(1.0, 1.0)):
+        """offset is the code added to each channel's 24-bit codes, and gain the factor applied after it"""
+        self.offset = [int(o) for o in offset]
+        self.gain = [float(g) for g in gain]
+
+    def gain_word(self, ch: int) -> int:
+        """GAINCAL value of a channel, the gain being 1 + GAINCAL / 2^23, from 0 to just under 2"""
+        return round((self.gain[ch] - 1) * (1 << 23))
+
+    @classmethod
+    def from_registers(cls, regs) -> 'Calibration':
+        """Corrections held in the OFFCAL and GAINCAL registers of an MCP3911 RegisterMap"""
+        return cls((_from_word(regs.offcal_ch0), _from_word(regs.offcal_ch1)),
+                   (1 + _from_word(regs.gaincal_ch0) / (1 << 23), 1 + _from_word(regs.gaincal_ch1) / (1 << 23)))
+
+    def registers(self) -> bytes:
+        """OFFCAL_CH0 through GAINCAL_CH1 as written from address OFFCAL_CH0"""
+        return b''.join(_to_word(self.offset[ch]) + _to_word(self.gain_word(ch)) for ch in (0, 1))
+
+    def correct(self, samples, ch: int = 0, bits: int = 24) -> None:
+        """
+        Correct samples of a channel in place, a buffer of int16 or int32 items of bits-wide data,
+        clipping to the full-scale codes as the chip does. A strided memoryview such as
+        memoryview(interleaved)[1::2] corrects one channel of interleaved samples.
+        """
+        offset = self.offset[ch] / (1 << (24 - bits))
+        gain = self.gain[ch]
+        low, high = -(1 << (bits - 1)), (1 << (bits - 1)) - 1
+        numpy = _backend._load_numpy()
+        if numpy is not None:
+            view = numpy.asarray(memoryview(samples))
+            view[:] = numpy.clip(numpy.rint((view + offset) * gain), low, high)
+            return
+        for i, v in enumerate(samples):
+            samples[i] = min(max(round((v + offset) * gain), low), high)
+
+    def correct_filtered(self, outputs, ch: int = 0, bits: int = 24, dc_gain: float = 1.0) -> None:
+        """
+        Correct in place float64 outputs of a linear filter, such as an adc.decimate one, run over
+        uncorrected bits-wide samples of a channel, as if the samples had been corrected first.
+        dc_gain is the sum of the filter's taps; outputs are not clipped.
+        """
+        offset = self.offset[ch] / (1 << (24 - bits)) * dc_gain
+        gain = self.gain[ch]
+        numpy = _backend._load_numpy()
+        if numpy is not None:
+            view = numpy.asarray(memoryview(outputs))
+            view += offset
+            view *= gain
+            return
+        for i, v in enumerate(outputs):
+            outputs[i] = (v + offset) * gain
+
+    def save(self, path: str) -> None:
+        with open(path, 'w') as f:
+            json.dump({'offset': self.offset, 'gain': self.gain}, f, indent=2)
+            f.write('\n')
+
+    @classmethod
+    def load(cls, path: str) -> 'Calibration':
+        with open(path) as f:
+            profile = json.load(f)
+        return cls(profile['offset'], profile['gain'])
+
+    def __eq__(self, other):
+        return isinstance(other, Calibration) and (self.offset, self.gain) == (other.offset, other.gain)
+
+    def __repr__(self):
+        return 'Calibration(offset={}, gain={})'.format(self.offset, self.gain)
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+
+"""
+Decimating filters applied while samples are acquired
+
+Pass one as decimate= to read_data_array(), start_capture() or stream() to receive every
+factor-th output of the filter instead of every sample, as float64 samples in ADC codes.
+With the spi_rpi extension the filter runs in its native loop, so Python only sees the reduced
+stream; other backends filter each block as it is read. A filter keeps its state between calls,
+so consecutive reads are filtered as one sequence; reset() starts over.
+"""
+
+import math
+from abc import ABCMeta, abstractmethod
+
+from .backends import backend as _backend
+from .backends.backend import new_float_buffer
+
+
+class Decimator(object, metaclass=ABCMeta):
+    """
+    Base class of the filters. An output is produced after every factor inputs since the last reset(),
+    from the inputs weighed by taps(), taps()[0] weighing the newest one.
+    """
+
+    _KIND = None
+
+    def __init__(self, factor: int):
+        assert factor >= 1, 'factor must be positive'
+        self.factor = factor
+        self._state = None
+        self._history = None
+        self._phase = 0
+
+    @abstractmethod
+    def taps(self) -> list:
+        """Coefficients of the filter's impulse response, newest input first"""
+        pass
+
+    def _native_args(self) -> tuple:
+        return (self._KIND, self.factor)
+
+    def native(self):
+        """spi_rpi.Decimator holding the filter state, or None without the extension"""
+        if self._state is None:
+            spi_rpi = _backend._load_spi_rpi()
+            if spi_rpi is None:
+                return None
+            self._state = spi_rpi.Decimator(*self._native_args())
+        return self._state
+
+    @property
+    def phase(self) -> int:
+        """Inputs fed since the last output"""
+        state = self.native()
+        return state.phase if state is not None else self._phase
+
+    def output_length(self, n: int) -> int:
+        """Number of outputs n more inputs produce"""
+        return (self.phase + n) // self.factor
+
+    def input_length(self, n: int) -> int:
+        """Number of inputs needed for n more outputs"""
+        return max(n * self.factor - self.phase, 0)
+
+    def filter(self, samples, out=None):
+        """
+        Feed samples, a buffer of int16 or int32 items, and return the outputs that fall due:
+        a new float64 array, or a memoryview of the filled part of out, a float64 buffer, if given.
+        """
+        if out is None:
+            out = new_float_buffer(self.output_length(len(samples)))
+            self._feed(samples, out)
+            return out
+        return memoryview(out)[:self._feed(samples, out)]
+
+    def _feed(self, samples, out) -> int:
+        state = self.native()
+        if state is not None:
+            return state.filter(samples, out)
+        return self._filter(samples, out)
+
+    def _filter(self, samples, out) -> int:
+        taps = self.taps()
+        if self._history is None:
+            self._history = [0.0] * (len(taps) - 1)
+        n = self.output_length(len(samples))
+        assert len(out) >= n, 'out is too short for the decimated samples'
+
+        # input j of samples ends the window x[j:j + len(taps)]
+        first = (self.factor - 1 - self._phase) % self.factor
+        numpy = _backend._load_numpy()
+        if numpy is not None:
+            x = numpy.concatenate((numpy.asarray(self._history, dtype=numpy.float64),
+                                   numpy.asarray(samples, dtype=numpy.float64)))
+            windows = numpy.lib.stride_tricks.sliding_window_view(x, len(taps))[first::self.factor]
+            numpy.frombuffer(out, numpy.float64)[:n] = windows @ numpy.asarray(taps[::-1])
+            history = x[len(x) - len(self._history):].tolist()
+        else:
+            x = self._history + [float(v) for v in samples]
+            reverse = taps[::-1]
+            for i, j in enumerate(range(first, len(samples), self.factor)):
+                out[i] = sum(t * v for t, v in zip(reverse, x[j:j + len(taps)]))
+            history = x[len(x) - len(self._history):]
+
+        self._history = history
+        self._phase = (self._phase + len(samples)) % self.factor
+        return n
+
+    def reset(self) -> None:
+        """Clear the filter state, as if no sample had been fed"""
+        if self._state is not None:
+            self._state.reset()
+        self._history = None
+        self._phase = 0
+
+    def __repr__(self):
+        return '{}(factor={})'.format(type(self).__name__, self.factor)
+
+
+class Boxcar(Decimator):
+    """Mean of each block of factor samples"""
+
+    _KIND = 0
+
+    def taps(self) -> list:
+        return [1 / self.factor] * self.factor
+
+
+class CIC(Decimator):
+    """
+    Cascaded integrator-comb decimator of order stages, a sinc^order response like the chip's own
+    SINC3 filter, normalized to unity DC gain. The integrators are exact 64-bit integers, which
+    limits order * log2(factor) to 39.
+    """
+
+    _KIND = 1
+
+    def __init__(self, factor: int, order: int = 3):
+        assert 1 <= order <= 8, 'order must be between 1 and 8'
+        assert factor ** order <= 1 << 39, 'factor ** order is too large for 64-bit integrators'
+        super().__init__(factor)
+        self.order = order
+
+    def _native_args(self) -> tuple:
+        return (self._KIND, self.factor, self.order)
+
+    def taps(self) -> list:
+        response = [1]
+        for _ in range(self.order):
+            stage = [0] * (len(response) + self.factor - 1)
+            for i, v in enumerate(response):
+                for k in range(self.factor):
+                    stage[i + k] += v
+            response = stage
+        gain = self.factor ** self.order
+        return [v / gain for v in response]
+
+    def __repr__(self):
+        return 'CIC(factor={}, order={})'.format(self.factor, self.order)
+
+
+class FIR(Decimator):
+    """Arbitrary taps evaluated once per output, taps[0] weighing the newest sample"""
+
+    _KIND = 2
+
+    def __init__(self, taps, factor: int):
+        assert len(taps) > 0, 'taps must not be empty'
+        super().__init__(factor)
+        self._taps = [float(t) for t in taps]
+
+    @classmethod
+    def lowpass(cls, factor: int, numtaps: int = None) -> 'FIR':
+        """
+        Hamming-windowed sinc low-pass with its cutoff at the decimated Nyquist frequency and unity DC
+        gain, 8 * factor + 1 taps long by default
+        """
+        numtaps = numtaps or 8 * factor + 1
+        center = (numtaps - 1) / 2
+        taps = []
+        for i in range(numtaps):
+            t = (i - center) / factor
+            sinc = math.sin(math.pi * t) / (math.pi * t) if t else 1.0
+            window = 0.54 - 0.46 * math.cos(2 * math.pi * i / (numtaps - 1)) if numtaps > 1 else 1.0
+            taps.append(sinc * window)
+        total = sum(taps)
+        return cls([t / total for t in taps], factor)
+
+    def _native_args(self) -> tuple:
+        return (self._KIND, self.factor, 1, self._taps)
+
+    def taps(self) -> list:
+        return list(self._taps)
+
+    def __repr__(self):
+        return 'FIR({} taps, factor={})'.format(len(self._taps), self.factor)
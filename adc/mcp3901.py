@@ -1,50 +1,80 @@
 #!/usr/bin/env python3
 
+import contextlib
+
+from .calibration import Calibration
 from .mcp3901_register import *
 from .spiadc import SPIADC
 
 
 class MCP3901(SPIADC):
-    """24bit 2ch ADC"""
-
-    def read_data_array(self, length: int, ch=0, width=24) -> [int]:
+    """
+    24bit 2ch ADC
+    width arguments are 16 or 24 bits; None uses the width configured in Config1Reg when the
+    register cache is enabled, else 24.
+    The device has no correction registers: samples are corrected in software by the calibration
+    set with apply_calibration() as they are read, captured, streamed, published or measured, and
+    decimated outputs as if their samples had been. Recordings keep uncorrected codes.
+    """
+
+    calibration = None
+    """adc.calibration.Calibration applied to samples read, None for none"""
+
+    _VREF = 2.37
+    _INPUT_SCALE = 3
+
+    _VOLATILE = frozenset(range(Address.DATA_CH0, Address.PHASE))
+
+    @staticmethod
+    def data_address(ch: int, width: int) -> (int, int):
+        """Register address and byte width of a channel's data"""
         assert ch in [0, 1], 'ADC channel must be 0 or 1'
         assert width in [16, 24], 'width must be 16 or 24'
 
-        addr = Address.CHANNEL0 if ch == 0 else Address.CHANNEL1
-        byte_width = length * (2 if width == 16 else 3)
-
-        data = self.backend.get_data(addr, byte_width, length)
-
-        if width == 16:
-            for i in range(length):
-                x = data[i]
-                if x > 32768:
-                    x -= 65536
-                data[i] = x
-        else:
-            for i in range(length):
-                x = data[i]
-                if x > 8388608:
-                    x -= 16777216
-                data[i] = x
-
+        return Address.DATA_CH0 if ch == 0 else Address.DATA_CH1, 2 if width == 16 else 3
+
+    def data_width(self, ch: int) -> int:
+        """Data width of a channel in bits as configured in the cached Config1Reg, 24 without the cache"""
+        if not self.cache:
+            return 24
+        return 24 if self.read_reg_config1().width == Config1Reg.Width.w24 else 16
+
+    def data_rate(self) -> float:
+        """Data ready rate in Hz at mclk, MCLK / (PRESCALE * 4 * OSR)"""
+        return self.read_reg_config1().data_rate(self.mclk)
+
+    def read_data_array_both(self, length: int, width=None, out=None, interleave=False, timestamps=None):
+        """
+        Read length time-aligned samples of both channels, one SPI frame per data ready pulse.
+        StatusComReg.read must loop over CH0 and CH1 (types, groups or all).
+        Returns (ch0, ch1), or one buffer alternating ch0 and ch1 samples if interleave is set.
+        out is the tuple of buffers, or the single buffer, to fill in place.
+        timestamps works as in read_data_array(), with one timestamp per frame.
+        """
+        byte_width = self.data_address(0, width or self.data_width(0))[1]
+        data = self._get_data(self.backend.get_data_both, length,
+                              (Address.DATA_CH0, (byte_width, byte_width), length, out, interleave), timestamps)
+        if self.calibration is not None:
+            samples = data if timestamps is None else data[0]
+            channels = (memoryview(samples)[0::2], memoryview(samples)[1::2]) if interleave else samples
+            for ch in (0, 1):
+                self.calibration.correct(channels[ch], ch, 8 * byte_width)
         return data
 
-    def read_data(self, ch=0, width=24) -> int:
+    def read_data(self, ch=0, width=None) -> int:
         return self.read_data_array(1, ch, width)[0]
 
     def read_reg_gain(self) -> GainReg:
-        return GainReg(self.read_reg(Address.GAIN))
+        return GainReg.from_bytes(self.read_reg(Address.GAIN))
 
     def read_reg_status_com(self) -> StatusComReg:
         return StatusComReg.from_bytes(self.read_reg(Address.STATUS_COM))
 
     def read_reg_config1(self) -> Config1Reg:
-        return Config1Reg(self.read_reg(Address.CONFIG1))
+        return Config1Reg.from_bytes(self.read_reg(Address.CONFIG1))
 
     def read_reg_config2(self) -> Config2Reg:
-        return Config2Reg(self.read_reg(Address.CONFIG2))
+        return Config2Reg.from_bytes(self.read_reg(Address.CONFIG2))
 
     def write_reg_gain(self, reg: GainReg) -> None:
         self.write_reg(Address.GAIN, bytes(reg))
@@ -58,5 +88,88 @@ class MCP3901(SPIADC):
     def write_reg_config2(self, reg: Config2Reg) -> None:
         self.write_reg(Address.CONFIG2, bytes(reg))
 
+    def update_reg_gain(self, **fields) -> GainReg:
+        """Read-modify-write of GainReg fields; only the write touches the bus when the register is cached"""
+        reg = self._update(self.read_reg_gain(), fields)
+        self.write_reg_gain(reg)
+        return reg
+
+    def update_reg_status_com(self, **fields) -> StatusComReg:
+        """Read-modify-write of StatusComReg fields; only the write touches the bus when the register is cached"""
+        reg = self._update(self.read_reg_status_com(), fields)
+        self.write_reg_status_com(reg)
+        return reg
+
+    def update_reg_config1(self, **fields) -> Config1Reg:
+        """Read-modify-write of Config1Reg fields; only the write touches the bus when the register is cached"""
+        reg = self._update(self.read_reg_config1(), fields)
+        self.write_reg_config1(reg)
+        return reg
+
+    def update_reg_config2(self, **fields) -> Config2Reg:
+        """Read-modify-write of Config2Reg fields; only the write touches the bus when the register is cached"""
+        reg = self._update(self.read_reg_config2(), fields)
+        self.write_reg_config2(reg)
+        return reg
+
+    def read_calibration(self) -> Calibration:
+        """Software correction applied to samples read"""
+        return self.calibration or Calibration()
+
+    def apply_calibration(self, calibration: Calibration) -> None:
+        """Correct the samples read in software with calibration, None to stop correcting"""
+        self.calibration = calibration
+
+    def _corrector(self, ch: int, bits: int, decimate=None):
+        calibration = self.calibration
+        if calibration is None:
+            return None
+        if decimate is None:
+            return lambda samples: calibration.correct(samples, ch, bits)
+        dc_gain = sum(decimate.taps())
+        return lambda outputs: calibration.correct_filtered(outputs, ch, bits, dc_gain)
+
+    @contextlib.contextmanager
+    def _uncalibrated(self):
+        calibration, self.calibration = self.calibration, None
+        try:
+            yield
+        finally:
+            self.calibration = calibration
+
+    def snapshot(self) -> RegisterMap:
+        """
+        Read the whole register map in one transfer; 16-bit channel data is padded to 24 bits.
+        StatusComReg.read is set to all first if it is not already, and the data width is taken
+        from Config1Reg; with the register cache enabled neither touches the bus.
+        """
+        self._loop_all()
+        byte_width = self.data_address(0, 24 if self.read_reg_config1().width else 16)[1]
+        return self._read_map(RegisterMap, (byte_width, byte_width))
+
+    def restore(self, regs: RegisterMap) -> None:
+        """
+        Write every writable register, PHASE through CONFIG2, from a snapshot in one transfer and
+        verify them with one readback; RuntimeError is raised on a mismatch.
+        The burst loops with StatusComReg read all, and the snapshot's own read setting is written
+        afterwards if it differs.
+        """
+        self._loop_all()
+        burst = RegisterMap.from_bytes(bytes(regs))
+        burst.status_com.read = StatusComReg.Read.all
+        byte_width = self.data_address(0, 24 if burst.config1.width else 16)[1]
+        self._restore_map(burst, Address.PHASE, (byte_width, byte_width), self._mask_volatile)
+
+        if regs.status_com.read != StatusComReg.Read.all:
+            self.write_reg_status_com(regs.status_com)
+
+    def _loop_all(self) -> None:
+        if self.read_reg_status_com().read != StatusComReg.Read.all:
+            self.update_reg_status_com(read=StatusComReg.Read.all)
+
+    @staticmethod
+    def _mask_volatile(expected: RegisterMap, actual: RegisterMap) -> None:
+        expected.status_com.drstatus = actual.status_com.drstatus
+
     def close(self):
         self.backend.close()
@@ -170,6 +170,10 @@ class Config1Reg(Register):
     def __init__(self, prescale=Prescale.pre1, osr=Osr.osr64, width=Width.w16, modout=ModOut.off):
         super().__init__(prescale, osr, width, modout)
 
+    def data_rate(self, mclk: float) -> float:
+        """Data ready rate in Hz for a master clock of mclk Hz, MCLK / (PRESCALE * 4 * OSR)"""
+        return mclk / ((1 << self.prescale) * 4 * (32 << self.osr))
+
 
 class Config2Reg(Register):
     """Configuration Register 2"""
@@ -230,3 +234,15 @@ class Config2Reg(Register):
     def __init__(self, reset=Reset.neither, shutdown=Shutdown.neither, dither=Dither.both, vrefext=VrefExt.internal,
                  clkext=ClkExt.crystal):
         super().__init__(reset, shutdown, dither, vrefext, clkext)
+
+
+class RegisterMap(Register):
+    """Whole register map, DATA_CH0 through CONFIG2, as read or written in one address-looping burst"""
+    _fields_ = [('data_ch0', ctypes.c_uint8 * 3),
+                ('data_ch1', ctypes.c_uint8 * 3),
+                ('mod', ctypes.c_uint8),
+                ('phase', ctypes.c_uint8),
+                ('gain', GainReg),
+                ('status_com', StatusComReg),
+                ('config1', Config1Reg),
+                ('config2', Config2Reg)]
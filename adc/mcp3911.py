@@ -1,37 +1,65 @@
 #!/usr/bin/env python3
 
+import contextlib
+
+from .calibration import Calibration
 from .mcp3911_register import *
 from .spiadc import SPIADC
 
+_BYTE_WIDTHS = {
+    StatusComReg.Width.both_ch_24bit: (3, 3),
+    StatusComReg.Width.ch1_24bit_ch0_16bit: (2, 3),
+    StatusComReg.Width.ch1_16bit_ch0_24bit: (3, 2),
+    StatusComReg.Width.both_ch_16bit: (2, 2),
+}
 
-class MCP3911(SPIADC):
-    """24bit 2ch ADC"""
-
-    def read_data_array(self, length: int, ch=0, width=24) -> [int]:
-        assert ch in [0, 1], 'ADC channel must be 0 or 1'
-        assert width in [16, 24], 'width must be 16 or 24'
 
-        addr = Address.CHANNEL0 if ch == 0 else Address.CHANNEL1
-        byte_width = 2 if width == 16 else 3
+class MCP3911(SPIADC):
+    """
+    24bit 2ch ADC
+    width arguments are 16 or 24 bits; None uses the width configured in StatusComReg when the
+    register cache is enabled, else 24.
+    """
 
-        data = self.backend.get_data(addr, byte_width, length)
+    _VREF = 1.2
+    _INPUT_SCALE = 1.5
 
-        if width == 16:
-            for i in range(length):
-                x = data[i]
-                if x > 32768:
-                    x -= 65536
-                data[i] = x
-        else:
-            for i in range(length):
-                x = data[i]
-                if x > 8388608:
-                    x -= 16777216
-                data[i] = x
+    _VOLATILE = frozenset(range(Address.CHANNEL0, Address.PHASE))
 
-        return data
+    @staticmethod
+    def data_address(ch: int, width: int) -> (int, int):
+        """Register address and byte width of a channel's data"""
+        assert ch in [0, 1], 'ADC channel must be 0 or 1'
+        assert width in [16, 24], 'width must be 16 or 24'
 
-    def read_data(self, ch=0, width=24) -> int:
+        return Address.CHANNEL0 if ch == 0 else Address.CHANNEL1, 2 if width == 16 else 3
+
+    def data_width(self, ch: int) -> int:
+        """Data width of a channel in bits as configured in the cached StatusComReg, 24 without the cache"""
+        if not self.cache:
+            return 24
+        return 24 if self.read_reg_status_com().width >> ch & 1 else 16
+
+    def data_rate(self) -> float:
+        """Data ready rate in Hz at mclk, MCLK / (PRE * 4 * OSR)"""
+        return self.read_reg_config().data_rate(self.mclk)
+
+    def read_data_array_both(self, length: int, width=None, out=None, interleave=False, timestamps=None):
+        """
+        Read length time-aligned samples of both channels, one SPI frame per data ready pulse.
+        width is the StatusComReg.Width setting of the device, the cached one if None (both 24-bit
+        without the cache), and StatusComReg.read must loop over CH0 and CH1 (types, groups or all).
+        Returns (ch0, ch1), or one buffer alternating ch0 and ch1 samples if interleave is set.
+        out is the tuple of buffers, or the single buffer, to fill in place.
+        timestamps works as in read_data_array(), with one timestamp per frame.
+        """
+        if width is None:
+            width = self.read_reg_status_com().width if self.cache else StatusComReg.Width.both_ch_24bit
+        byte_widths = _BYTE_WIDTHS[StatusComReg.Width(width)]
+        return self._get_data(self.backend.get_data_both, length,
+                              (Address.CHANNEL0, byte_widths, length, out, interleave), timestamps)
+
+    def read_data(self, ch=0, width=None) -> int:
         return self.read_data_array(1, ch, width)[0]
 
     def read_reg_gain(self) -> GainReg:
@@ -52,5 +80,93 @@ class MCP3911(SPIADC):
     def write_reg_config(self, reg: ConfigReg) -> None:
         self.write_reg(Address.CONFIG, bytes(reg))
 
+    def update_reg_gain(self, **fields) -> GainReg:
+        """Read-modify-write of GainReg fields; only the write touches the bus when the register is cached"""
+        reg = self._update(self.read_reg_gain(), fields)
+        self.write_reg_gain(reg)
+        return reg
+
+    def update_reg_status_com(self, **fields) -> StatusComReg:
+        """Read-modify-write of StatusComReg fields; only the write touches the bus when the register is cached"""
+        reg = self._update(self.read_reg_status_com(), fields)
+        self.write_reg_status_com(reg)
+        return reg
+
+    def update_reg_config(self, **fields) -> ConfigReg:
+        """Read-modify-write of ConfigReg fields; only the write touches the bus when the register is cached"""
+        reg = self._update(self.read_reg_config(), fields)
+        self.write_reg_config(reg)
+        return reg
+
+    def read_calibration(self) -> Calibration:
+        """Corrections in the OFFCAL and GAINCAL registers, whether enabled or not"""
+        regs = RegisterMap()
+        for name, addr in (('offcal_ch0', Address.OFFCAL_CH0), ('gaincal_ch0', Address.GAINCAL_CH0),
+                           ('offcal_ch1', Address.OFFCAL_CH1), ('gaincal_ch1', Address.GAINCAL_CH1)):
+            getattr(regs, name)[:] = self.read_reg(addr, 3)
+        return Calibration.from_registers(regs)
+
+    def apply_calibration(self, calibration: Calibration) -> None:
+        """
+        Write the corrections to the OFFCAL and GAINCAL registers, a register at a time whatever the
+        address loop setting, and enable each correction that is not the identity. Gain correction
+        delays data ready by 24 DMCLK periods.
+        """
+        data = calibration.registers()
+        for i, addr in enumerate((Address.OFFCAL_CH0, Address.GAINCAL_CH0, Address.OFFCAL_CH1, Address.GAINCAL_CH1)):
+            self.write_reg(addr, data[3 * i:3 * i + 3])
+        offset = any(calibration.offset)
+        gain = any(calibration.gain_word(ch) for ch in (0, 1))
+        self.update_reg_status_com(en_offcal=StatusComReg.EN_OffCal(offset), en_gaincal=StatusComReg.EN_GainCal(gain))
+
+    @contextlib.contextmanager
+    def _uncalibrated(self):
+        status = self.read_reg_status_com()
+        enabled = status.en_offcal or status.en_gaincal
+        if enabled:
+            self.update_reg_status_com(en_offcal=StatusComReg.EN_OffCal.disabled,
+                                       en_gaincal=StatusComReg.EN_GainCal.disabled)
+        try:
+            yield
+        finally:
+            if enabled:
+                self.update_reg_status_com(en_offcal=status.en_offcal, en_gaincal=status.en_gaincal)
+
+    def snapshot(self) -> RegisterMap:
+        """
+        Read the whole register map in one transfer; 16-bit channel data is padded to 24 bits.
+        StatusComReg.read is set to all first if it is not already; with the register cache
+        enabled that check does not touch the bus.
+        """
+        status = self._loop_all()
+        return self._read_map(RegisterMap, _BYTE_WIDTHS[StatusComReg.Width(status.width)])
+
+    def restore(self, regs: RegisterMap) -> None:
+        """
+        Write every writable register, PHASE through VREFCAL, from a snapshot in one transfer and
+        verify them with one readback; RuntimeError is raised on a mismatch.
+        The burst loops with StatusComReg read all and write on, and the snapshot's own address
+        loop settings are written afterwards if they differ.
+        """
+        self._loop_all()
+        burst = RegisterMap.from_bytes(bytes(regs))
+        burst.status_com.read = StatusComReg.Read.all
+        burst.status_com.write = StatusComReg.Write.on
+        self._restore_map(burst, Address.PHASE, _BYTE_WIDTHS[StatusComReg.Width(burst.status_com.width)],
+                          self._mask_volatile)
+
+        if regs.status_com.read != StatusComReg.Read.all or regs.status_com.write != StatusComReg.Write.on:
+            self.write_reg_status_com(regs.status_com)
+
+    def _loop_all(self) -> StatusComReg:
+        status = self.read_reg_status_com()
+        if status.read != StatusComReg.Read.all or status.write != StatusComReg.Write.on:
+            status = self.update_reg_status_com(read=StatusComReg.Read.all, write=StatusComReg.Write.on)
+        return status
+
+    @staticmethod
+    def _mask_volatile(expected: RegisterMap, actual: RegisterMap) -> None:
+        expected.status_com.drstatus = actual.status_com.drstatus
+
     def close(self):
         self.backend.close()
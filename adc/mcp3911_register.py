@@ -273,3 +273,23 @@ class ConfigReg(Register):
     def __init__(self, pre=Pre.pre1, osr=Osr.osr256, dither=Dither.both, az_freq=AzFreq.low,
                  reset=Reset.neither, shutdown=Shutdown.neither, vrefext=VrefExt.internal, clkext=ClkExt.external):
         super().__init__(pre, osr, dither, az_freq, reset, shutdown, 0, vrefext, clkext, 0)
+
+    def data_rate(self, mclk: float) -> float:
+        """Data ready rate in Hz for a master clock of mclk Hz, MCLK / (PRE * 4 * OSR)"""
+        return mclk / ((1 << self.pre) * 4 * (32 << self.osr))
+
+
+class RegisterMap(Register):
+    """Whole register map, CHANNEL0 through VREFCAL, as read or written in one address-looping burst"""
+    _fields_ = [('channel0', ctypes.c_uint8 * 3),
+                ('channel1', ctypes.c_uint8 * 3),
+                ('mod', ctypes.c_uint8),
+                ('phase', ctypes.c_uint8 * 2),
+                ('gain', GainReg),
+                ('status_com', StatusComReg),
+                ('config', ConfigReg),
+                ('offcal_ch0', ctypes.c_uint8 * 3),
+                ('gaincal_ch0', ctypes.c_uint8 * 3),
+                ('offcal_ch1', ctypes.c_uint8 * 3),
+                ('gaincal_ch1', ctypes.c_uint8 * 3),
+                ('vrefcal', ctypes.c_uint8)]
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+
+"""
+Synchronized acquisition from several devices
+
+MultiADC starts a timestamped background capture on every device, each running on its own
+backend's capture thread, native with the spi_rpi extension, so the devices are read concurrently
+whatever bus or chip select they are on, and the aggregate throughput is that of the devices
+together rather than one read_data_array() after another. Data ready times are all
+CLOCK_MONOTONIC, so the blocks of the devices line up on one timebase: the first block of every
+device starts at the first conversion after the latest device began converting, and blocks
+follow on without gaps.
+"""
+
+from .backends.backend import new_buffer, new_timestamps
+
+
+class MultiADC(object):
+    """
+    Concurrent capture of one channel of each of several devices.
+    read() returns a list of (samples, timestamps) per device, in the order of devices.
+    """
+
+    def __init__(self, devices, ch=0, width=None, capacity: int = 65536):
+        """
+        devices are MCP3911 or MCP3901 drivers, each on its own backend. ch and width, see
+        read_data_array(), apply to every device, or are sequences of one value per device.
+        capacity is the size of each capture ring in samples.
+        """
+        assert len(devices) > 0, 'at least one device is required'
+        assert len(set(id(d.backend) for d in devices)) == len(devices), 'each device needs its own backend'
+
+        self.devices = list(devices)
+        channels = ch if isinstance(ch, (list, tuple)) else [ch] * len(devices)
+        widths = width if isinstance(width, (list, tuple)) else [width] * len(devices)
+        assert len(channels) == len(widths) == len(devices), 'one ch and width per device'
+
+        self.channels = channels
+        self.widths = [w or d.data_width(c) for d, c, w in zip(self.devices, channels, widths)]
+        self.capacity = capacity
+        self.start_ns = None
+        """Time of the first sample of the first blocks in CLOCK_MONOTONIC nanoseconds, set by the first read()"""
+        self._periods = None
+        self._carry = None
+        self._correct = None
+        self._running = False
+        self._dropped = [0] * len(self.devices)
+
+    def start(self) -> None:
+        """Start the captures, one device after another; read() aligns their starts"""
+        assert not self._running, 'the captures are already running'
+        # data rates are read before any capture competes for the buses
+        self._periods = [1e9 / d.data_rate() for d in self.devices]
+        self._carry = [None] * len(self.devices)
+        self._correct = [d._corrector(ch, width) for d, ch, width in zip(self.devices, self.channels, self.widths)]
+        self.start_ns = None
+        started = []
+        try:
+            for d, ch, width in zip(self.devices, self.channels, self.widths):
+                d.start_capture(ch, width, self.capacity, timestamps=True)
+                started.append(d)
+        except BaseException:
+            for d in started:
+                d.stop_capture()
+            raise
+        self._running = True
+
+    def _byte_width(self, i: int) -> int:
+        return self.devices[i].data_address(self.channels[i], self.widths[i])[1]
+
+    def _read(self, i: int, out, timestamps, timeout: float) -> None:
+        """Fill out and timestamps with the next samples of device i, the carried sample first"""
+        backend = self.devices[i].backend
+        n = 0
+        if self._carry[i] is not None:
+            out[0], timestamps[0] = self._carry[i]
+            self._carry[i] = None
+            n = 1
+        if n < len(out):
+            view = memoryview(out)[n:]
+            got = backend.read_capture(view, len(view), timeout, memoryview(timestamps)[n:])
+            if got < len(view):
+                if backend.capture_running():
+                    raise TimeoutError('timed out waiting for {} samples of device {}'.format(len(out), i))
+                # raises the error the capture stopped on
+                backend.read_capture(view[got:], 1, 0)
+                raise RuntimeError('the capture of device {} stopped'.format(i))
+
+    def _align(self, timeout: float) -> None:
+        """Drop the samples of each device converted before the latest device's first one"""
+        first = []
+        for i in range(len(self.devices)):
+            sample, ts = new_buffer(1, self._byte_width(i)), new_timestamps(1)
+            self._read(i, sample, ts, timeout)
+            self._carry[i] = (sample[0], ts[0])
+            first.append(ts[0])
+
+        self.start_ns = max(first)
+        for i, period in enumerate(self._periods):
+            # the sample within half a period of the start is the one converted with it
+            sample, ts = new_buffer(1, self._byte_width(i)), new_timestamps(1)
+            while self._carry[i][1] < self.start_ns - period / 2:
+                self._carry[i] = None
+                self._read(i, sample, ts, timeout)
+                self._carry[i] = (sample[0], ts[0])
+
+    def read(self, length: int, timeout: float = None) -> list:
+        """
+        Read the next length samples of every device, waiting up to timeout seconds for each
+        (None waits forever, TimeoutError is raised after). Returns [(samples, timestamps), ...]
+        as read_data_array() with timestamps, one pair per device.
+        """
+        assert self._running, 'start() was not called'
+        if self.start_ns is None:
+            self._align(timeout)
+
+        blocks = []
+        for i in range(len(self.devices)):
+            out, timestamps = new_buffer(length, self._byte_width(i)), new_timestamps(length)
+            self._read(i, out, timestamps, timeout)
+            if self._correct[i] is not None:
+                self._correct[i](out)
+            blocks.append((out, timestamps))
+        return blocks
+
+    @property
+    def dropped(self) -> list:
+        """Samples dropped by each device because the reader fell behind"""
+        return [d.backend.capture_dropped() for d in self.devices]
+
+    def stop(self) -> list:
+        """Stop every capture and return the number of samples each one dropped"""
+        if self._running:
+            self._running = False
+            self._dropped = [d.stop_capture() for d in self.devices]
+        return self._dropped
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
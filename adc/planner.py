@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+
+"""
+Sample rate planning
+
+plan() lists the prescaler and oversampling ratio settings reaching a target data rate at a given
+MCLK, with each SPI baud rate under which reading every conversion fits in the data ready period,
+best first; given a driver, only the clocks its backend reaches are listed. apply() configures a
+device with a plan, and validate() reads with timestamps to check that no conversion is skipped at it.
+"""
+
+from collections import namedtuple
+
+from . import mcp3901_register, mcp3911_register
+from .backends.backend import find_gaps
+
+Plan = namedtuple('Plan', 'pre osr baud mclk channels width data_rate frame_bytes transfer_time period headroom')
+Plan.__doc__ = """
+A configuration reaching the target rate: pre and osr are the device's prescaler and OSR register
+values, baud the SPI clock in Hz, channels and width the channels read and their bits per sample,
+and data_rate the resulting data ready rate in Hz at mclk.
+frame_bytes are the SPI bytes read per data ready period, taking transfer_time seconds including
+the per-frame overhead, out of a period of period seconds; headroom is the fraction of the period
+left, 1 - transfer_time / period.
+"""
+
+Validation = namedtuple('Validation', 'samples missed interval expected ok')
+Validation.__doc__ = """
+Result of validate(): samples read, conversions missed between them, the mean interval between data
+ready times and the expected one in seconds, and ok, set if none was missed.
+"""
+
+BAUDS = (1000000, 2000000, 4000000, 5000000, 8000000, 10000000, 16000000, 20000000)
+"""SPI clocks tried by default, up to the 20 MHz maximum of both devices"""
+
+_DEVICES = {
+    'MCP3911': (mcp3911_register.ConfigReg.Pre, mcp3911_register.ConfigReg.Osr,
+                lambda pre, osr: mcp3911_register.ConfigReg(pre=pre, osr=osr)),
+    'MCP3901': (mcp3901_register.Config1Reg.Prescale, mcp3901_register.Config1Reg.Osr,
+                lambda pre, osr: mcp3901_register.Config1Reg(prescale=pre, osr=osr)),
+}
+"""Prescaler and OSR values of each device, and its register holding them"""
+
+
+def _device_name(device) -> str:
+    """'MCP3911' or 'MCP3901' from a name, a driver class or a driver"""
+    if isinstance(device, str):
+        names = [device.upper()]
+    else:
+        names = [c.__name__ for c in (device if isinstance(device, type) else type(device)).__mro__]
+    for name in names:
+        if name in _DEVICES:
+            return name
+    raise AssertionError('device must be MCP3911 or MCP3901')
+
+
+def plan(device, mclk: float, rate: float, channels: int = 1, width: int = 24, bauds=BAUDS,
+         overhead: float = 10e-6, tolerance: float = 0.01, min_headroom: float = 0.2) -> list:
+    """
+    Configurations of device, 'MCP3911', 'MCP3901' or a driver, whose data rate at mclk Hz is within
+    tolerance, a fraction, of rate Hz, and under which reading channels channels of width bits per
+    data ready period leaves at least min_headroom of the period, for each SPI clock in bauds; for a
+    driver whose backend has a baud, only those up to it. overhead is the host's time per frame in
+    seconds besides the transfer itself, waking up on data ready and issuing the transfer; validate()
+    shows whether it is enough.
+    Returns the Plans sorted best first: closest rate, then highest OSR, then slowest SPI clock, which
+    any backend at least as fast can run.
+    """
+    assert channels in (1, 2), 'channels must be 1 or 2'
+    assert width in (16, 24), 'width must be 16 or 24'
+
+    pres, osrs, config = _DEVICES[_device_name(device)]
+    max_baud = getattr(getattr(device, 'backend', None), 'baud', None)
+    if max_baud is not None:
+        bauds = [baud for baud in bauds if baud <= max_baud]
+    frame_bytes = 1 + channels * width // 8
+    plans = []
+    for pre in pres:
+        for osr in osrs:
+            data_rate = config(pre, osr).data_rate(mclk)
+            if abs(data_rate - rate) > tolerance * rate:
+                continue
+            period = 1 / data_rate
+            for baud in bauds:
+                transfer_time = frame_bytes * 8 / baud + overhead
+                headroom = 1 - transfer_time / period
+                if headroom >= min_headroom:
+                    plans.append(Plan(pre, osr, baud, mclk, channels, width, data_rate, frame_bytes, transfer_time,
+                                      period, headroom))
+
+    plans.sort(key=lambda p: (abs(p.data_rate - rate), -p.osr, p.baud))
+    return plans
+
+
+def apply(ad, plan: Plan) -> None:
+    """
+    Configure the driver ad with plan: its prescaler and OSR, the plan's data width on both
+    channels, and mclk. The SPI clock is set when the backend is opened; ValueError is raised if
+    the backend's is slower than the plan's.
+    """
+    name = _device_name(ad)
+    baud = getattr(ad.backend, 'baud', None)
+    if baud is not None and baud < plan.baud:
+        raise ValueError('the backend runs at {} baud, slower than the plan\'s {}'.format(baud, plan.baud))
+
+    if name == 'MCP3911':
+        reg = mcp3911_register.StatusComReg
+        ad.update_reg_config(pre=plan.pre, osr=plan.osr)
+        ad.update_reg_status_com(width=reg.Width.both_ch_24bit if plan.width == 24 else reg.Width.both_ch_16bit)
+    else:
+        reg = mcp3901_register.Config1Reg
+        width = reg.Width.w24 if plan.width == 24 else reg.Width.w16
+        ad.update_reg_config1(prescale=plan.pre, osr=plan.osr, width=width)
+    ad.mclk = plan.mclk
+
+
+def validate(ad, plan: Plan, length: int = 4096, ch=0, tolerance: float = 0.5) -> Validation:
+    """
+    Read length frames as the plan does, channel ch alone or both channels, with timestamps, and
+    check the observed data ready intervals against the plan's period; a gap longer than
+    period * (1 + tolerance) is a missed conversion. Apply the plan first.
+    """
+    if plan.channels == 1:
+        _, timestamps = ad.read_data_array(length, ch, plan.width, timestamps=True)
+    elif _device_name(ad) == 'MCP3911':
+        reg = mcp3911_register.StatusComReg
+        width = reg.Width.both_ch_24bit if plan.width == 24 else reg.Width.both_ch_16bit
+        _, timestamps = ad.read_data_array_both(length, width, timestamps=True)
+    else:
+        _, timestamps = ad.read_data_array_both(length, plan.width, timestamps=True)
+    gaps = find_gaps(timestamps, plan.period * 1e9, tolerance)
+    interval = (timestamps[-1] - timestamps[0]) / (len(timestamps) - 1) / 1e9 if length > 1 else plan.period
+    return Validation(length, gaps.missed, interval, plan.period, gaps.missed == 0)
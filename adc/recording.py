@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+
+"""
+Recording of one channel straight to disk, and memory-mapped readback
+
+A recording file is a 4096-byte header followed by the raw samples, int16 for 16-bit
+data and int32 for 24-bit data in native byte order. The header holds a magic, the sample
+typecode, channel, width, data rate, start times, the number of samples dropped while recording,
+and the device's register map as read when recording started. Samples are written a whole
+capture block at a time, page-aligned, so a multi-hour capture never has to fit in memory, and
+a file cut short by a crash stays readable up to its last complete sample.
+"""
+
+import mmap
+import os
+import struct
+import threading
+
+from . import mcp3901_register, mcp3911_register
+from .backends import backend as _backend
+from .backends.backend import Backend, new_buffer
+
+_MAGIC = b'ADCW'
+_VERSION = 2
+_HEADER = struct.Struct('<4sHcBB16sdqqQH')
+# magic, version, typecode, channel, width, device, data rate, start time (ns since the epoch),
+# start CLOCK_MONOTONIC time (ns), dropped samples, register map length
+_DATA_OFFSET = 4096
+
+_REGISTERS = {'MCP3911': mcp3911_register, 'MCP3901': mcp3901_register}
+"""Register definitions of each device a header may name"""
+
+
+class Recorder(threading.Thread):
+    """
+    Background thread writing the samples of a capture to a recording file block by block.
+    stop() ends the capture, writes the samples still in the ring and completes the header.
+    """
+
+    def __init__(self, backend: Backend, path: str, addr: int, byte_width: int, block_size: int, capacity: int,
+                 header: dict):
+        super().__init__(daemon=True)
+        self.backend = backend
+        self.path = path
+        self.error = None
+        self._block = new_buffer(block_size, byte_width)
+        self._header = header
+        self._file = open(path, 'wb', buffering=0)
+        try:
+            self._write_header(0)
+            self._file.seek(_DATA_OFFSET)
+            backend.start_capture(addr, byte_width, capacity)
+        except BaseException:
+            self._file.close()
+            raise
+
+    def _write_header(self, dropped: int) -> None:
+        h = self._header
+        regs = bytes(h['registers'])
+        data = _HEADER.pack(_MAGIC, _VERSION, self._block.typecode.encode(), h['channel'], h['width'],
+                            h['device'].encode(), h['data_rate'], h['start_ns'], h['start_monotonic_ns'], dropped,
+                            len(regs)) + regs
+        assert len(data) <= _DATA_OFFSET, 'register map does not fit in the header'
+        os.pwrite(self._file.fileno(), data.ljust(_DATA_OFFSET, b'\0'), 0)
+
+    def run(self):
+        block = self._block
+        view = memoryview(block)
+        try:
+            while True:
+                # raises the error the capture stopped on once the samples before it were written
+                n = self.backend.read_capture(block, len(block))
+                if n == 0:
+                    # the capture stopped
+                    break
+                self._file.write(view[:n])
+        except Exception as e:
+            self.error = e
+
+    def stop(self) -> None:
+        """Stop acquisition, flush the remaining samples and close the file"""
+        self.backend.stop_capture()
+        self.join()
+        try:
+            self._write_header(self.backend.capture_dropped())
+        finally:
+            self._file.close()
+        if self.error is not None:
+            raise self.error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+
+class Recording(object):
+    """
+    Read-only, memory-mapped recording file. samples is a zero-copy view of every sample, a numpy
+    array if numpy is available and a memoryview otherwise; slicing it only touches the pages read.
+    Release views of the samples before close().
+    """
+
+    def __init__(self, path: str):
+        with open(path, 'rb') as f:
+            header = f.read(_DATA_OFFSET)
+            if len(header) < _HEADER.size or header[:4] != _MAGIC:
+                raise ValueError('{} is not an ADC recording'.format(path))
+            (_, version, typecode, self.channel, self.width, device, self.data_rate, self.start_ns,
+             self.start_monotonic_ns, self.dropped, regs_len) = _HEADER.unpack_from(header)
+            if version != _VERSION:
+                raise ValueError('{} is a version {} recording'.format(path, version))
+            self.device = device.rstrip(b'\0').decode(errors='replace')
+            if self.device not in _REGISTERS:
+                raise ValueError('{} is a recording of an unknown device {!r}'.format(path, self.device))
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        self.path = path
+        self.typecode = typecode.decode()
+        regs = header[_HEADER.size:_HEADER.size + regs_len]
+        self.registers = _REGISTERS[self.device].RegisterMap.from_bytes(regs)
+        """Register map of the device when recording started"""
+
+        itemsize = struct.calcsize(self.typecode)
+        count = max(len(self._mmap) - _DATA_OFFSET, 0) // itemsize
+        numpy = _backend._load_numpy()
+        if numpy is not None:
+            self.samples = numpy.frombuffer(self._mmap, numpy.dtype(self.typecode), count, _DATA_OFFSET)
+        else:
+            self.samples = memoryview(self._mmap)[_DATA_OFFSET:_DATA_OFFSET + count * itemsize].cast(self.typecode)
+
+    def __len__(self) -> int:
+        return len(self.samples)
+
+    @property
+    def duration(self) -> float:
+        """Seconds covered by the samples at the recorded data rate"""
+        return len(self) / self.data_rate
+
+    def index(self, seconds: float) -> int:
+        """Index of the sample taken the given number of seconds after the start"""
+        return min(max(round(seconds * self.data_rate), 0), len(self))
+
+    def between(self, start: float, stop: float):
+        """Zero-copy view of the samples from start to stop seconds after the start of the recording"""
+        return self.samples[self.index(start):self.index(stop)]
+
+    def close(self) -> None:
+        if self.samples is None:
+            return
+        if isinstance(self.samples, memoryview):
+            self.samples.release()
+        self.samples = None
+        self._mmap.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
@@ -10,11 +10,20 @@ class Register(ctypes.BigEndianStructure):
         s = ""
         for field in self._fields_:
             if field[0][0] != "_":
-                s += "{}: {:b}\n".format(field[0], getattr(self, field[0]))
+                value = getattr(self, field[0])
+                if isinstance(value, Register):
+                    nested = "".join("  " + line + "\n" for line in value.to_string().splitlines())
+                    s += "{}:\n{}".format(field[0], nested)
+                elif isinstance(value, ctypes.Array):
+                    s += "{}: {}\n".format(field[0], bytes(value).hex())
+                else:
+                    s += "{}: {:b}\n".format(field[0], value)
         return s
 
     @classmethod
     def from_bytes(cls, data: bytes):
+        if len(data) == ctypes.sizeof(cls):
+            return cls.from_buffer_copy(data)
         r = cls()
         ctypes.memmove(ctypes.addressof(r), data, len(data))
         return r
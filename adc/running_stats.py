@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+
+"""
+Statistics of samples accumulated as they are acquired, in constant memory
+
+Pass a RunningStats as stats= to read_data_array() or stream() to accumulate every sample read,
+or use measure() to keep nothing but the statistics. With the spi_rpi extension the samples are
+accumulated in its native loop; other backends fold in each block as it is read.
+"""
+
+import math
+
+from .backends import backend as _backend
+
+
+class RunningStats(object):
+    """
+    Welford mean and variance, extremes, RMS and the number of samples at either full-scale code
+    (-2^(bits-1) or 2^(bits-1)-1, so clipped) of every sample fed so far
+    """
+
+    def __init__(self):
+        self._state = None
+        self._reset()
+
+    def _reset(self):
+        self._count = 0
+        self._mean = 0.0
+        self._m2 = 0.0
+        self._min = None
+        self._max = None
+        self._clipped = 0
+
+    def native(self):
+        """spi_rpi.RunningStats holding the accumulators, or None without the extension"""
+        if self._state is None:
+            spi_rpi = _backend._load_spi_rpi()
+            if spi_rpi is None:
+                return None
+            self._state = spi_rpi.RunningStats()
+        return self._state
+
+    def update(self, samples, bits: int = 24) -> None:
+        """Accumulate samples, a buffer of int16 or int32 items of a bits wide ADC"""
+        state = self.native()
+        if state is not None:
+            state.update(samples, bits)
+            return
+        if len(samples) == 0:
+            return
+
+        full_scale = 1 << (bits - 1)
+        numpy = _backend._load_numpy()
+        if numpy is not None:
+            x = numpy.asarray(samples, dtype=numpy.int64)
+            n = len(x)
+            mean = float(x.mean())
+            m2 = float(((x - mean) ** 2).sum())
+            low, high = int(x.min()), int(x.max())
+            clipped = int(numpy.count_nonzero((x <= -full_scale) | (x >= full_scale - 1)))
+        else:
+            n = len(samples)
+            mean = sum(samples) / n
+            m2 = sum((v - mean) ** 2 for v in samples)
+            low, high = min(samples), max(samples)
+            clipped = sum(1 for v in samples if v <= -full_scale or v >= full_scale - 1)
+
+        # Chan et al.'s pairwise combination of the block with what came before
+        count = self._count + n
+        delta = mean - self._mean
+        self._m2 += m2 + delta * delta * self._count * n / count
+        self._mean += delta * n / count
+        self._count = count
+        self._min = low if self._min is None else min(self._min, low)
+        self._max = high if self._max is None else max(self._max, high)
+        self._clipped += clipped
+
+    def reset(self) -> None:
+        """Forget every sample fed so far"""
+        if self._state is not None:
+            self._state.reset()
+        self._reset()
+
+    @property
+    def count(self) -> int:
+        return self._state.count if self._state is not None else self._count
+
+    @property
+    def mean(self) -> float:
+        if self.count == 0:
+            return math.nan
+        return self._state.mean if self._state is not None else self._mean
+
+    @property
+    def variance(self) -> float:
+        """Sample variance, with Bessel's correction as statistics.variance()"""
+        if self.count < 2:
+            return math.nan
+        m2 = self._state.m2 if self._state is not None else self._m2
+        return m2 / (self.count - 1)
+
+    @property
+    def stdev(self) -> float:
+        return math.sqrt(self.variance)
+
+    @property
+    def rms(self) -> float:
+        """Root mean square of the samples, DC included"""
+        if self.count == 0:
+            return math.nan
+        m2 = self._state.m2 if self._state is not None else self._m2
+        return math.sqrt(m2 / self.count + self.mean ** 2)
+
+    @property
+    def min(self) -> int:
+        if self.count == 0:
+            return None
+        return self._state.min if self._state is not None else self._min
+
+    @property
+    def max(self) -> int:
+        if self.count == 0:
+            return None
+        return self._state.max if self._state is not None else self._max
+
+    @property
+    def clipped(self) -> int:
+        """Number of samples at either full-scale code"""
+        return self._state.clipped if self._state is not None else self._clipped
+
+    def __repr__(self):
+        return 'RunningStats(count={}, mean={:.6g}, stdev={:.6g}, min={}, max={}, rms={:.6g}, clipped={})'.format(
+            self.count, self.mean, self.stdev, self.min, self.max, self.rms, self.clipped)
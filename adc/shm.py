@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+
+"""
+Shared-memory sample ring for fanning one acquisition out to several local processes
+
+One producer writes decoded samples into a SharedRing and any number of processes attach to it
+by name, each with its own RingConsumer cursor. The producer never waits for consumers: a
+consumer that falls more than the ring capacity behind skips the overwritten samples and counts
+them in overruns.
+
+Layout: a 64-byte header followed by capacity slots of int16 or int32. The header holds a magic,
+the slot typecode, the capacity, and two uint64 counters in the manner of a seqlock: the total
+number of samples written, stored after the slots of a write, and the total once the write in
+progress completes, stored before its slots. Consumers read the first before copying samples and
+check the second afterwards, so samples overwritten while being copied are detected.
+
+The counters are only ordered with the slots where the spi_rpi extension is built, which accesses
+them atomically between full memory fences. Without it they are plain stores and loads: sound on
+x86, whose stores and loads are not reordered among themselves, but on ARM, a Raspberry Pi among
+them, a consumer may see a counter before the slots it covers and read stale samples undetected.
+"""
+
+import struct
+import threading
+import time
+from multiprocessing import shared_memory
+
+from .backends import backend as _backend
+from .backends.backend import new_buffer
+from .stream import Stream
+
+_MAGIC = b'ADCR'
+_HEADER = struct.Struct('<4sc3xQ')  # magic, typecode, capacity
+_HEADER_SIZE = 64
+_WRITE_INDEX = 2  # header index of the written sample count, as an array of uint64
+_CLAIM_INDEX = 3  # header index of the sample count once the write in progress completes
+
+
+def _load(header: memoryview, index: int) -> int:
+    spi_rpi = _backend._load_spi_rpi()
+    return header[index] if spi_rpi is None else spi_rpi.load_u64(header, index)
+
+
+def _store(header: memoryview, index: int, value: int) -> None:
+    spi_rpi = _backend._load_spi_rpi()
+    if spi_rpi is None:
+        header[index] = value
+    else:
+        spi_rpi.store_u64(header, index, value)
+
+
+def _attach(name: str) -> shared_memory.SharedMemory:
+    try:
+        return shared_memory.SharedMemory(name, track=False)
+    except TypeError:
+        # before Python 3.13 attaching registers the segment, which would be unlinked when
+        # the consumer process exits
+        from multiprocessing import resource_tracker
+        shm = shared_memory.SharedMemory(name)
+        resource_tracker.unregister(shm._name, 'shared_memory')
+        return shm
+
+
+class SharedRing(object):
+    """
+    Single-producer, multi-consumer ring of samples in multiprocessing.shared_memory.
+    Create it in the producer with create() and attach to it from consumers with attach().
+    Consumers on other cores are only guaranteed to see whole writes with the spi_rpi extension
+    built; see the module documentation.
+    """
+
+    def __init__(self, shm: shared_memory.SharedMemory, owner: bool = False):
+        magic, typecode, capacity = _HEADER.unpack_from(shm.buf)
+        if magic != _MAGIC:
+            shm.close()
+            raise ValueError('{} is not an ADC sample ring'.format(shm.name))
+
+        self.shm = shm
+        self.capacity = capacity
+        self.typecode = typecode.decode()
+        self._owner = owner
+        self._header = shm.buf[:_HEADER_SIZE].cast('Q')
+        self.slots = shm.buf[_HEADER_SIZE:].cast(self.typecode)[:capacity]
+        """Typed memoryview of all slots, numpy.asarray() of it is zero-copy"""
+
+    @classmethod
+    def create(cls, name: str = None, capacity: int = 65536, byte_width: int = 3) -> 'SharedRing':
+        """Create a ring of capacity samples of the given data byte width (int16 for 2, int32 otherwise)"""
+        assert capacity > 0, 'capacity must be positive'
+
+        typecode = new_buffer(0, byte_width).typecode
+        size = _HEADER_SIZE + capacity * struct.calcsize(typecode)
+        shm = shared_memory.SharedMemory(name, create=True, size=size)
+        _HEADER.pack_into(shm.buf, 0, _MAGIC, typecode.encode(), capacity)
+        struct.pack_into('<QQ', shm.buf, 8 * _WRITE_INDEX, 0, 0)
+        return cls(shm, owner=True)
+
+    @classmethod
+    def attach(cls, name: str) -> 'SharedRing':
+        return cls(_attach(name))
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    @property
+    def write_index(self) -> int:
+        """Total number of samples written since the ring was created"""
+        return _load(self._header, _WRITE_INDEX)
+
+    def write(self, samples) -> None:
+        """Append samples, a buffer of the ring's typecode; only the producer may call this"""
+        samples = memoryview(samples).cast('B').cast(self.typecode)
+        n = len(samples)
+        if n > self.capacity:
+            samples = samples[n - self.capacity:]
+
+        write = self._header[_WRITE_INDEX]
+        # claimed before the slots change, so consumers copying them notice the overwrite
+        _store(self._header, _CLAIM_INDEX, write + n)
+        start = (write + n - len(samples)) % self.capacity
+        first = min(len(samples), self.capacity - start)
+        self.slots[start:start + first] = samples[:first]
+        self.slots[:len(samples) - first] = samples[first:]
+        _store(self._header, _WRITE_INDEX, write + n)
+
+    def consumer(self, oldest: bool = False) -> 'RingConsumer':
+        """New read cursor at the next sample written, or at the oldest sample still in the ring"""
+        return RingConsumer(self, oldest)
+
+    def close(self) -> None:
+        """Detach from the ring; the producer also removes it. Release views of the slots first."""
+        if self.slots is None:
+            return
+        self.slots.release()
+        self._header.release()
+        self.slots = None
+        self.shm.close()
+        if self._owner:
+            self.shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class RingConsumer(object):
+    """Read cursor of one consumer of a SharedRing"""
+
+    poll_interval = 1e-3
+
+    def __init__(self, ring: SharedRing, oldest: bool = False):
+        self.ring = ring
+        write = ring.write_index
+        self.cursor = max(write - ring.capacity, 0) if oldest else write
+        self.overruns = 0
+        """Number of samples overwritten before this consumer read them"""
+
+    def _skip_overrun(self) -> int:
+        write = self.ring.write_index
+        if write - self.cursor > self.ring.capacity:
+            self.overruns += write - self.ring.capacity - self.cursor
+            self.cursor = write - self.ring.capacity
+        return write
+
+    def available(self) -> int:
+        return self._skip_overrun() - self.cursor
+
+    def peek(self, max_samples: int = None) -> memoryview:
+        """
+        Zero-copy view of the next unread samples, up to the end of the slots, without consuming them.
+        The view may be overwritten by the producer; call consume() afterwards to check it was not.
+        """
+        write = self._skip_overrun()
+        start = self.cursor % self.ring.capacity
+        n = min(write - self.cursor, self.ring.capacity - start)
+        if max_samples is not None:
+            n = min(n, max_samples)
+        return self.ring.slots[start:start + n]
+
+    def consume(self, n: int) -> bool:
+        """Advance the cursor by n samples; returns False if they were overwritten while being read"""
+        start = self.cursor
+        self.cursor += n
+        claim = _load(self.ring._header, _CLAIM_INDEX)
+        if claim - start > self.ring.capacity:
+            self.overruns += min(claim - self.ring.capacity - start, n)
+            return False
+        return True
+
+    def read(self, out, min_samples: int = 0, timeout: float = None) -> int:
+        """
+        Copy unread samples into out, waiting up to timeout seconds (None waits forever) until
+        at least min_samples were copied. Returns the number of samples copied.
+        """
+        out = memoryview(out).cast('B').cast(self.ring.typecode)
+        assert min_samples <= len(out), 'out is smaller than min_samples'
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+        n = 0
+        while n < len(out):
+            view = self.peek(len(out) - n)
+            if len(view) == 0:
+                if n >= min_samples or (deadline is not None and time.monotonic() >= deadline):
+                    break
+                time.sleep(self.poll_interval)
+                continue
+            out[n:n + len(view)] = view
+            if self.consume(len(view)):
+                n += len(view)
+        return n
+
+
+class Publisher(threading.Thread):
+    """Background thread writing the blocks of a Stream into a SharedRing"""
+
+    def __init__(self, stream: Stream, ring: SharedRing):
+        super().__init__(daemon=True)
+        self.stream = stream
+        self.ring = ring
+        self.error = None
+
+    def run(self):
+        try:
+            for block in self.stream:
+                self.ring.write(block)
+        except Exception as e:
+            self.error = e
+
+    def stop(self) -> None:
+        """Stop acquisition and remove the ring"""
+        self.stream.close()
+        self.join()
+        self.ring.close()
+        if self.error is not None:
+            raise self.error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
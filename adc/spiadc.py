@@ -1,20 +1,414 @@
 #!/usr/bin/env python3
 
-from .backends.backend import Backend
+import ctypes
+from abc import ABCMeta, abstractmethod
+from typing import TYPE_CHECKING
+
+from .backends.backend import (Backend, Gaps, Stats, find_gaps, new_buffer, new_float_buffer, new_timestamps,
+                               scale_codes)
+from .calibration import Calibration
+from .running_stats import RunningStats
+from .stream import Stream
+
+if TYPE_CHECKING:
+    from .recording import Recorder
+    from .shm import Publisher
 
 _WR = 0
 _RD = 1
 
 
-class SPIADC(object):
-    """Generic SPI ADC"""
+class SPIADC(object, metaclass=ABCMeta):
+    """
+    Generic SPI ADC
+
+    With cache set, register values are kept in a shadow copy filled by writes and first reads,
+    so reading a register again, or a read-modify-write, does not touch the bus. Data and
+    modulator output registers are never cached, and the data ready status bits of a cached
+    status register are stale. Call invalidate() after anything that changes registers behind
+    the driver's back, such as a reset.
+
+    mclk is the master clock in Hz, from which the data rate and the expected interval between
+    timestamps follow. vref is the reference voltage, the internal one if None, from which samples
+    read with unit='volts' are scaled.
+    """
+
+    _VOLATILE = frozenset()
+    """Byte addresses never served from the cache"""
+
+    _ADDRESSES = 64
 
-    def __init__(self, backend: Backend):
+    _VREF = None
+    """Internal reference voltage"""
+
+    _INPUT_SCALE = None
+    """k of the transfer function, DATA = VIN * PGA gain * k / VREF * 2^23 at 24 bits"""
+
+    def __init__(self, backend: Backend, cache: bool = False, mclk: float = 4e6, vref: float = None):
         self.backend = backend
+        self.cache = cache
+        self.mclk = mclk
+        self.vref = vref or self._VREF
+        self._scales = {}
+        self._shadow = bytearray(self._ADDRESSES)
+        self._valid = bytearray(self._ADDRESSES)
+        self._cacheable = bytearray(a not in self._VOLATILE for a in range(self._ADDRESSES))
+        self._capture_byte_width = None
+        self._capture_timestamps = False
+        self._capture_decimated = False
+        self._capture_correct = None
 
     def read_reg(self, addr: int, length: int = 1) -> bytes:
-        data = self.backend.transfer(bytes([addr << 1 | _RD]) + bytes(length))
-        return data[1:]
+        if self.cache and self._valid.find(0, addr, addr + length) < 0 and addr + length <= self._ADDRESSES:
+            return bytes(self._shadow[addr:addr + length])
+
+        data = self.backend.transfer(bytes([addr << 1 | _RD]) + bytes(length))[1:]
+        self._store(addr, data)
+        return data
 
     def write_reg(self, addr: int, value: bytes) -> None:
         self.backend.transfer(bytes([addr << 1 | _WR]) + value)
+        self._store(addr, value)
+
+    def invalidate(self, addr: int = None, length: int = 1) -> None:
+        """Drop cached register bytes, all of them if addr is None"""
+        if addr is None:
+            self._valid = bytearray(self._ADDRESSES)
+        else:
+            self._valid[addr:addr + length] = bytes(len(self._valid[addr:addr + length]))
+
+    def _store(self, addr: int, data: bytes) -> None:
+        if self.cache:
+            n = min(len(data), self._ADDRESSES - addr)
+            self._shadow[addr:addr + n] = data[:n]
+            self._valid[addr:addr + n] = self._cacheable[addr:addr + n]
+
+    @staticmethod
+    def _update(reg, fields: dict):
+        for name, value in fields.items():
+            assert name in (f[0] for f in reg._fields_ if not f[0].startswith('_')), \
+                '{} has no field {}'.format(type(reg).__name__, name)
+            setattr(reg, name, value)
+        return reg
+
+    @staticmethod
+    def _map_length(map_cls, byte_widths: (int, int)) -> int:
+        """Bytes on the wire of a register map whose channel data registers are byte_widths long"""
+        return ctypes.sizeof(map_cls) - (3 - byte_widths[0]) - (3 - byte_widths[1])
+
+    @staticmethod
+    def _decode_map(map_cls, data: bytes, byte_widths: (int, int)):
+        """Register map from the bytes read from address 0; 16-bit data is padded to 24 bits"""
+        w0, w1 = byte_widths
+        return map_cls.from_bytes(data[:w0] + bytes(3 - w0) + data[w0:w0 + w1] + bytes(3 - w1) + data[w0 + w1:])
+
+    def _read_map(self, map_cls, byte_widths: (int, int)):
+        """
+        Read a register map from address 0 in one transfer. The two channel data registers
+        come first and are byte_widths long on the wire; 16-bit data is padded to 24 bits.
+        """
+        return self._decode_map(map_cls, self.read_reg(0, self._map_length(map_cls, byte_widths)), byte_widths)
+
+    def _restore_map(self, regs, start: int, byte_widths: (int, int), mask_volatile) -> None:
+        """
+        Write regs from byte address start on and read them all back from address 0 for
+        verification, the two frames batched into one backend call
+        """
+        value = bytes(regs)[start:]
+        _, rx = self.backend.transfer_many([bytes([start << 1 | _WR]) + value,
+                                            bytes([_RD]) + bytes(self._map_length(type(regs), byte_widths))])
+        self._store(start, value)
+        self._store(0, rx[1:])
+        readback = self._decode_map(type(regs), rx[1:], byte_widths)
+        mask_volatile(regs, readback)
+
+        expected = bytes(regs)[start:]
+        actual = bytes(readback)[start:]
+        if actual != expected:
+            bad = [start + i for i, (e, a) in enumerate(zip(expected, actual)) if e != a]
+            raise RuntimeError('register readback mismatch at {}'.format(', '.join('0x{:02X}'.format(a) for a in bad)))
+
+    @abstractmethod
+    def data_rate(self) -> float:
+        """Data ready rate in Hz of the current configuration"""
+        pass
+
+    def volts_per_code(self, ch=0, width=None) -> float:
+        """
+        Volts per code of a channel's samples at the current PGA gain, data width and vref.
+        Factors are kept in a table keyed by the gain register and width, so a change of gain costs
+        one computation, and with the register cache enabled a lookup does not touch the bus.
+        """
+        width = width or self.data_width(ch)
+        gain = self.read_reg_gain()
+        key = (bytes(gain), ch, width, self.vref)
+        factor = self._scales.get(key)
+        if factor is None:
+            pga = gain.pga_ch1 if ch else gain.pga_ch0
+            factor = self.vref / (self._INPUT_SCALE * (1 << pga) * (1 << (width - 1)))
+            self._scales[key] = factor
+        return factor
+
+    def _read_volts(self, read, factor: float, out, timestamps, decimate):
+        """
+        Read codes with read(out) and scale them to volts into out, a float32 or float64 buffer, a new
+        float64 array if None; decimated samples, read into out already, are scaled in place.
+        """
+        if decimate is not None:
+            data = read(out)
+            scale_codes(data, factor, data)
+            return data
+        data = read(None)
+        volts = scale_codes(data if timestamps is None else data[0], factor, out)
+        return volts if timestamps is None else (volts, data[1])
+
+    def find_gaps(self, timestamps, tolerance: float = 0.5) -> Gaps:
+        """
+        Find conversions missed between samples from their timestamps, for example because the
+        host was preempted between data ready pulses, at the period of the current data rate.
+        See adc.backends.backend.find_gaps().
+        """
+        return find_gaps(timestamps, 1e9 / self.data_rate(), tolerance)
+
+    def _get_data(self, get, length: int, args: tuple, timestamps):
+        """Call a backend read, passing timestamps only if requested; True allocates them"""
+        if timestamps is None:
+            return get(*args)
+        if timestamps is True:
+            timestamps = new_timestamps(length)
+        return get(*args, timestamps=timestamps), timestamps
+
+    def _corrector(self, ch: int, bits: int, decimate=None):
+        """
+        Function correcting in place the samples of a channel read at bits, or the outputs of decimate
+        over them, where the driver corrects in software; None where samples arrive corrected
+        """
+        return None
+
+    def _get_data_stats(self, addr: int, byte_width: int, length: int, stats: RunningStats, out, correct=None):
+        """
+        Read length samples into stats, and into out unless it is None; correct, see _corrector(),
+        is applied to each block before stats sees it
+        """
+        if correct is None:
+            return self.backend.get_data_stats(addr, byte_width, length, stats, out)
+        block = new_buffer(min(length, 4096), byte_width) if out is None else None
+        for start in range(0, length, 4096):
+            n = min(length - start, 4096)
+            view = memoryview(block)[:n] if out is None else memoryview(out)[start:start + n]
+            self.backend.get_data(addr, byte_width, n, view)
+            correct(view)
+            stats.update(view, 8 * byte_width)
+        return out
+
+    def read_data_array(self, length: int, ch=0, width=None, out=None, timestamps=None, decimate=None,
+                        stats=None, unit='codes'):
+        """
+        Read length samples of a channel.
+        Samples are signed, int16 for 16-bit width and int32 for 24-bit width.
+        Pass out, a writable int32 buffer (or int16 for 16-bit width) such as array.array or numpy,
+        to reuse one allocation across captures; it is filled in place and returned.
+        With timestamps, True or an int64 buffer of length items, (samples, timestamps) is returned
+        with the data ready time of each sample in CLOCK_MONOTONIC nanoseconds; see find_gaps().
+        With decimate, an adc.decimate filter such as CIC(16), length float64 outputs of the filter
+        are returned instead, out being a float64 buffer; see adc.decimate.
+        stats, an adc.running_stats.RunningStats, accumulates the samples as they are read.
+        With unit='volts', samples are returned in volts at the current gain, see volts_per_code(),
+        as float64, or into out, a float32 or float64 buffer (float64 with decimate); stats keeps codes.
+        """
+        assert unit in ('codes', 'volts'), "unit must be 'codes' or 'volts'"
+        addr, byte_width = self.data_address(ch, width or self.data_width(ch))
+        if unit == 'volts':
+            def read(codes_out):
+                return self.read_data_array(length, ch, 8 * byte_width, codes_out, timestamps, decimate, stats)
+            return self._read_volts(read, self.volts_per_code(ch, 8 * byte_width), out, timestamps, decimate)
+        correct = self._corrector(ch, 8 * byte_width, decimate)
+        if stats is not None:
+            assert decimate is None and timestamps is None, 'stats are kept of plain reads only'
+            if out is None:
+                out = new_buffer(length, byte_width)
+            return self._get_data_stats(addr, byte_width, length, stats, out, correct)
+        if decimate is not None:
+            assert timestamps is None, 'timestamps are not kept with decimate'
+            data = self.backend.get_data_decimated(addr, byte_width, length, decimate, out)
+        else:
+            data = self._get_data(self.backend.get_data, length, (addr, byte_width, length, out), timestamps)
+        if correct is not None:
+            correct(data if timestamps is None else data[0])
+        return data
+
+    def measure(self, length: int, ch=0, width=None, stats: RunningStats = None) -> RunningStats:
+        """
+        Read length samples of a channel into stats, a new RunningStats if None, without keeping
+        them, so long noise measurements run in constant memory. Returns stats.
+        """
+        if stats is None:
+            stats = RunningStats()
+        addr, byte_width = self.data_address(ch, width or self.data_width(ch))
+        self._get_data_stats(addr, byte_width, length, stats, None, self._corrector(ch, 8 * byte_width))
+        return stats
+
+    def calibrate(self, ch=0, expected: int = None, length: int = 4096, calibration: Calibration = None,
+                  width=None) -> Calibration:
+        """
+        Measure the correction of a channel into calibration, a new adc.calibration.Calibration if None,
+        from the mean of length samples read with the correction off, and return it.
+        Without expected, the inputs must be shorted and the offset is measured. With expected, the
+        24-bit code a reference applied to the inputs should read, the gain bringing the offset-corrected
+        mean to it is measured; measure the offset first. Load the result with apply_calibration().
+        """
+        if calibration is None:
+            calibration = Calibration()
+        width = width or self.data_width(ch)
+        with self._uncalibrated():
+            mean = self.measure(length, ch, width).mean * (1 << (24 - width))
+
+        if expected is None:
+            calibration.offset[ch] = -round(mean)
+        else:
+            corrected = mean + calibration.offset[ch]
+            if corrected == 0:
+                raise ValueError('the reference reads as the offset; check it is applied to the inputs, '
+                                 'which must not be shorted or disconnected')
+            calibration.gain[ch] = expected / corrected
+        return calibration
+
+    @abstractmethod
+    def apply_calibration(self, calibration: Calibration) -> None:
+        """Correct samples with calibration from now on"""
+        pass
+
+    @abstractmethod
+    def read_calibration(self) -> Calibration:
+        """Correction currently applied to samples"""
+        pass
+
+    @abstractmethod
+    def _uncalibrated(self):
+        """Context manager suspending the correction"""
+        pass
+
+    def record(self, path: str, ch=0, width=None, block_size: int = None, capacity: int = None) -> 'Recorder':
+        """
+        Record a channel to the file path in the background until Recorder.stop(), writing blocks of
+        block_size samples, 64 KiB by default, from a capture ring of capacity samples, 8 blocks by
+        default. The header keeps the register map, read first without changing the address loop
+        setting, and the start time; open the file with adc.recording.Recording.
+        """
+        import mmap
+        import time
+
+        from .recording import Recorder
+
+        addr, byte_width = self.data_address(ch, width or self.data_width(ch))
+        itemsize = new_buffer(0, byte_width).itemsize
+        block_size = block_size or 65536 // itemsize
+        assert block_size * itemsize % mmap.PAGESIZE == 0, 'block_size must fill whole pages'
+
+        status = self.read_reg_status_com()
+        regs = self.snapshot()
+        status.drstatus = regs.status_com.drstatus
+        if bytes(regs.status_com) != bytes(status):
+            self.write_reg_status_com(status)
+            regs.status_com = status
+
+        header = dict(channel=ch, width=8 * byte_width, device=type(self).__name__, registers=regs,
+                      data_rate=self.data_rate(), start_ns=time.time_ns(), start_monotonic_ns=time.monotonic_ns())
+        recorder = Recorder(self.backend, path, addr, byte_width, block_size, capacity or 8 * block_size, header)
+        recorder.start()
+        return recorder
+
+    def start_capture(self, ch=0, width=None, capacity=65536, timestamps=False, decimate=None) -> None:
+        """
+        Start acquiring a channel on a background thread into a ring buffer of capacity samples.
+        Consume samples with read_available() while acquisition continues, then call stop_capture().
+        With timestamps set, read_available() can also return each sample's data ready time.
+        With decimate, the ring holds the float64 outputs of that adc.decimate filter instead.
+        """
+        addr, byte_width = self.data_address(ch, width or self.data_width(ch))
+        if timestamps:
+            assert decimate is None, 'timestamps are not kept with decimate'
+            self.backend.start_capture(addr, byte_width, capacity, timestamps=True)
+        elif decimate is not None:
+            self.backend.start_capture(addr, byte_width, capacity, decimator=decimate)
+        else:
+            self.backend.start_capture(addr, byte_width, capacity)
+        self._capture_byte_width = byte_width
+        self._capture_timestamps = timestamps
+        self._capture_decimated = decimate is not None
+        self._capture_correct = self._corrector(ch, 8 * byte_width, decimate)
+
+    def stream(self, block_size: int, ch=0, width=None, capacity: int = None, timeout: float = None,
+               decimate=None, stats=None, unit='codes') -> Stream:
+        """
+        Acquire a channel continuously as an iterator of blocks of block_size samples.
+        See Stream for buffer reuse and dropped sample reporting; close it to stop acquisition.
+        With decimate, blocks hold the float64 outputs of that adc.decimate filter.
+        stats, an adc.running_stats.RunningStats, accumulates each block as it is returned.
+        With unit='volts', blocks hold float64 volts, scaled by the volts_per_code() of the start.
+        """
+        assert unit in ('codes', 'volts'), "unit must be 'codes' or 'volts'"
+        addr, byte_width = self.data_address(ch, width or self.data_width(ch))
+        factor = self.volts_per_code(ch, 8 * byte_width) if unit == 'volts' else None
+        return Stream(self.backend, addr, byte_width, block_size, capacity, timeout, decimate, stats, factor,
+                      correct=self._corrector(ch, 8 * byte_width, decimate))
+
+    def publish(self, name: str, block_size: int, ch=0, width=None, capacity=65536) -> 'Publisher':
+        """
+        Acquire a channel continuously into a SharedRing of capacity samples named name, from which
+        other processes read with SharedRing.attach(name).consumer(). Stop it with Publisher.stop().
+        """
+        from .shm import Publisher, SharedRing
+
+        addr, byte_width = self.data_address(ch, width or self.data_width(ch))
+        ring = SharedRing.create(name, capacity, byte_width)
+        try:
+            stream = Stream(self.backend, addr, byte_width, block_size, correct=self._corrector(ch, 8 * byte_width))
+        except BaseException:
+            ring.close()
+            raise
+        publisher = Publisher(stream, ring)
+        publisher.start()
+        return publisher
+
+    def read_available(self, out=None, timestamps=None):
+        """
+        Read the samples captured since the last call without waiting.
+        Returns a new buffer, or a memoryview of the filled part of out if given.
+        For a capture started with timestamps, passing timestamps, True or an int64 buffer as long
+        as out, returns (samples, timestamps) instead.
+        """
+        assert self._capture_byte_width is not None, 'no capture was started'
+        assert timestamps is None or self._capture_timestamps, 'the capture was started without timestamps'
+
+        fresh = out is None
+        if fresh:
+            if self._capture_decimated:
+                out = new_float_buffer(self.backend.capture_available())
+            else:
+                out = new_buffer(self.backend.capture_available(), self._capture_byte_width)
+        if timestamps is True:
+            timestamps = new_timestamps(len(out))
+        if timestamps is None:
+            n = self.backend.read_capture(out)
+        else:
+            n = self.backend.read_capture(out, timestamps=timestamps)
+
+        samples = out if fresh else memoryview(out)[:n]
+        if self._capture_correct is not None:
+            self._capture_correct(samples)
+        if timestamps is None:
+            return samples
+        return samples, timestamps if fresh else memoryview(timestamps)[:n]
+
+    def stats(self) -> Stats:
+        """Acquisition counters of the backend, collected while its metrics are enabled"""
+        return self.backend.stats()
+
+    def reset_stats(self) -> None:
+        self.backend.reset_stats()
+
+    def stop_capture(self) -> int:
+        """Stop the background capture and return the number of samples dropped while it ran"""
+        self.backend.stop_capture()
+        return self.backend.capture_dropped()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+
+from .backends.backend import Backend, new_buffer, new_float_buffer, scale_codes
+
+
+class Stream(object):
+    """
+    Continuous acquisition as an iterator of fixed-size sample blocks.
+
+    Samples are captured in the background without gaps between blocks, so block N+1 is
+    being acquired while the consumer processes block N. Blocks alternate between two
+    buffers: a block stays valid until the block after the next one is requested, so copy
+    it to keep it longer. If the consumer falls behind by more than the capture ring,
+    samples are dropped and counted in dropped.
+    When the capture stops, after count samples or on an error, the samples left are returned as a
+    last, shorter block, a memoryview, before StopIteration or the capture's error is raised.
+    """
+
+    def __init__(self, backend: Backend, addr: int, byte_width: int, block_size: int, capacity: int = None,
+                 timeout: float = None, decimate=None, stats=None, scale: float = None, count: int = 0,
+                 correct=None):
+        """
+        capacity is the size of the capture ring in samples, 8 blocks by default, and timeout is
+        the number of seconds to wait for a block before TimeoutError is raised (None waits forever).
+        With decimate, an adc.decimate filter, blocks and the ring hold its float64 outputs.
+        stats, an adc.running_stats.RunningStats, accumulates each block as it is returned.
+        With scale, blocks hold the float64 samples multiplied by it, volts per code for example;
+        stats still sees codes. The capture stops after count samples, or outputs, unless count is 0.
+        correct, a function correcting a block in place, is applied to each block before stats sees it.
+        """
+        assert block_size > 0, 'block_size must be positive'
+        assert stats is None or decimate is None, 'stats are kept of undecimated samples only'
+
+        self.backend = backend
+        self.block_size = block_size
+        self.timeout = timeout
+        self.stats = stats
+        self.scale = scale
+        self.correct = correct
+        self._bits = 8 * byte_width
+        if decimate is None:
+            self._buffers = [new_buffer(block_size, byte_width), new_buffer(block_size, byte_width)]
+        else:
+            self._buffers = [new_float_buffer(block_size), new_float_buffer(block_size)]
+        self._scaled = None
+        if scale is not None and decimate is None:
+            self._scaled = [new_float_buffer(block_size), new_float_buffer(block_size)]
+        self._index = 0
+        self._closed = False
+
+        if decimate is None:
+            backend.start_capture(addr, byte_width, capacity or 8 * block_size, count)
+        else:
+            backend.start_capture(addr, byte_width, capacity or 8 * block_size, count, decimator=decimate)
+
+    @property
+    def dropped(self) -> int:
+        """Number of samples dropped because the consumer fell behind"""
+        return self.backend.capture_dropped()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._closed:
+            raise StopIteration
+
+        block = self._buffers[self._index]
+        # raises the error the capture stopped on once the samples before it were returned
+        n = self.backend.read_capture(block, self.block_size, self.timeout)
+        if n < self.block_size:
+            if self.backend.capture_running():
+                raise TimeoutError('timed out waiting for a block of {} samples'.format(self.block_size))
+            if n == 0:
+                raise StopIteration
+            block = memoryview(block)[:n]
+
+        if self.correct is not None:
+            self.correct(block)
+        if self.stats is not None:
+            self.stats.update(block, self._bits)
+        if self.scale is not None:
+            block = scale_codes(block, self.scale, block if self._scaled is None else self._scaled[self._index])
+            if n < self.block_size:
+                block = memoryview(block)[:n]
+        self._index ^= 1
+        return block
+
+    def close(self) -> None:
+        if not self._closed:
+            self._closed = True
+            self.backend.stop_capture()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+
+import asyncio
+import unittest
+
+from adc.aio import AsyncMCP3901, AsyncMCP3911
+from adc.mcp3911_register import GainReg
+from adc.test_stream import CounterBackend
+
+
+class RecordingBackend(CounterBackend):
+
+    def __init__(self, delay=0.0):
+        super().__init__(delay)
+        self.written = []
+
+    def transfer(self, data: bytes) -> bytes:
+        if data[0] & 1 == 0:
+            self.written.append(bytes(data))
+        return bytes(len(data))
+
+
+class TestAsync(unittest.IsolatedAsyncioTestCase):
+
+    async def test_read_data_array(self):
+        adc = AsyncMCP3911(CounterBackend(0.001))
+        data = await adc.read_data_array(500, timeout=5)
+        self.assertEqual(list(data), list(range(500)))
+        self.assertFalse(adc.backend.capture_available())
+
+    async def test_read_data_mcp3901(self):
+        adc = AsyncMCP3901(CounterBackend())
+        self.assertEqual(await adc.read_data(ch=1, width=16, timeout=5), 0)
+
+    async def test_concurrent_reads(self):
+        adc = AsyncMCP3911(CounterBackend(0.001))
+        a, b = await asyncio.gather(adc.read_data_array(100, timeout=5), adc.read_data_array(100, timeout=5))
+        self.assertEqual(sorted(list(a) + list(b)), list(range(200)))
+
+    async def test_stream(self):
+        adc = AsyncMCP3911(CounterBackend(0.001))
+        expected = 0
+        async with adc.stream(50, capacity=4096, timeout=5) as stream:
+            async for block in stream:
+                self.assertEqual(list(block), list(range(expected, expected + 50)))
+                expected += 50
+                if expected == 500:
+                    break
+            self.assertEqual(stream.dropped, 0)
+
+    async def test_write_waits_for_stream(self):
+        backend = RecordingBackend(0.001)
+        adc = AsyncMCP3911(backend)
+        async with adc.stream(10, timeout=5) as stream:
+            await stream.__anext__()
+            write = asyncio.ensure_future(adc.write_reg_gain(GainReg()))
+            await asyncio.sleep(0.02)
+            self.assertFalse(write.done())
+        await write
+        self.assertEqual(len(backend.written), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
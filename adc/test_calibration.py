@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+
+import os
+import tempfile
+import time
+import unittest
+from array import array
+from unittest import mock
+
+from adc.backends import backend
+from adc.backends.simulated import Constant, SimulatedBackend
+from adc.calibration import Calibration
+from adc.decimate import Boxcar
+from adc.mcp3901 import MCP3901
+from adc.mcp3901_register import Config1Reg
+from adc.mcp3911 import MCP3911
+from adc.mcp3911_register import RegisterMap, StatusComReg
+from adc.running_stats import RunningStats
+
+_CODE = 1.5 / 1.2 * 2 ** 23
+"""MCP3911 code per volt"""
+
+
+class TestCalibration(unittest.TestCase):
+
+    def test_registers(self):
+        cal = Calibration((-1000, 25), (1.25, 0.75))
+        self.assertEqual(cal.gain_word(0), 1 << 21)
+        regs = RegisterMap()
+        regs.offcal_ch0[:], regs.gaincal_ch0[:] = cal.registers()[0:3], cal.registers()[3:6]
+        regs.offcal_ch1[:], regs.gaincal_ch1[:] = cal.registers()[6:9], cal.registers()[9:12]
+        self.assertEqual(Calibration.from_registers(regs), cal)
+        with self.assertRaises(AssertionError):
+            Calibration(gain=(2.0, 1.0)).registers()
+
+    def test_correct(self):
+        cal = Calibration((-256, 0), (2.0, 1.0))
+        samples = array('i', [256, 1000, 2 ** 23 - 1])
+        cal.correct(samples)
+        self.assertEqual(list(samples), [0, 1488, 2 ** 23 - 1])
+
+        samples = array('h', [1, 2, 3, 4])
+        cal.correct(memoryview(samples)[0::2], 0, bits=16)
+        self.assertEqual(list(samples), [0, 2, 4, 4])
+
+        with mock.patch.object(backend, 'numpy', None):
+            samples = array('i', [256, -2 ** 23])
+            cal.correct(samples)
+            self.assertEqual(list(samples), [0, -2 ** 23])
+
+    def test_correct_filtered(self):
+        cal = Calibration((-256, 0), (2.0, 1.0))
+        outputs = array('d', [256.0, 1000.5])
+        cal.correct_filtered(outputs, dc_gain=0.5)
+        self.assertEqual(list(outputs), [256.0, 1745.0])
+        with mock.patch.object(backend, 'numpy', None):
+            outputs = array('d', [1.0])
+            cal.correct_filtered(outputs, 0, bits=16)
+            self.assertEqual(list(outputs), [0.0])
+
+    def test_profile(self):
+        cal = Calibration((-3, 4), (1.001, 0.999))
+        fd, path = tempfile.mkstemp(suffix='.json')
+        os.close(fd)
+        try:
+            cal.save(path)
+            self.assertEqual(Calibration.load(path), cal)
+        finally:
+            os.unlink(path)
+
+    def calibrate(self, ad, code: float):
+        """
+        Offset of 10 mV on channel 0, and a 0.5 V reference reading 0.49 V once the offset is corrected;
+        code is the codes per volt
+        """
+        ad.backend.sources[0] = Constant(0.01)
+        cal = ad.calibrate(0)
+        self.assertEqual(cal.offset, [-round(0.01 * code), 0])
+        ad.backend.sources[0] = Constant(0.5)
+        ad.calibrate(0, round(0.5 * code), calibration=cal)
+        self.assertAlmostEqual(cal.gain[0], 0.5 / 0.49, places=6)
+        ad.apply_calibration(cal)
+        return cal
+
+    def test_mcp3911(self):
+        ad = MCP3911(SimulatedBackend('MCP3911'))
+        cal = self.calibrate(ad, _CODE)
+        status = ad.read_reg_status_com()
+        self.assertEqual((status.en_offcal, status.en_gaincal), (1, 1))
+        self.assertAlmostEqual(ad.read_data(), round(0.5 * _CODE), delta=1)
+        self.assertEqual(ad.read_calibration().offset, cal.offset)
+
+        # calibrating again measures the uncorrected codes and leaves the correction on
+        self.assertAlmostEqual(ad.calibrate(0, round(0.5 * _CODE), calibration=cal).gain[0], 0.5 / 0.49, places=6)
+        self.assertEqual(ad.read_reg_status_com().en_offcal, StatusComReg.EN_OffCal.enabled)
+
+    def test_mcp3901(self):
+        code = 3 / 2.37 * 2 ** 23
+        ad = MCP3901(SimulatedBackend('MCP3901', (None, Constant(0.1))))
+        ad.update_reg_config1(width=Config1Reg.Width.w24)
+        cal = self.calibrate(ad, code)
+        self.assertIs(ad.read_calibration(), cal)
+        for sample in ad.read_data_array(2):
+            self.assertAlmostEqual(sample, round(0.5 * code), delta=1)
+        both = ad.read_data_array_both(2, interleave=True)
+        self.assertAlmostEqual(both[0], round(0.5 * code), delta=1)
+        self.assertEqual(both[1], round(0.1 * code))
+
+        ad.apply_calibration(None)
+        self.assertEqual(ad.read_data(), round(0.5 * code))
+
+    def test_mcp3901_paths(self):
+        code = 3 / 2.37 * 2 ** 23
+        ad = MCP3901(SimulatedBackend('MCP3901'))
+        ad.update_reg_config1(width=Config1Reg.Width.w24)
+        self.calibrate(ad, code)
+        expected = round(0.5 * code)
+
+        self.assertAlmostEqual(ad.measure(8).mean, expected, delta=1)
+        stats = RunningStats()
+        self.assertAlmostEqual(ad.read_data_array(8, stats=stats)[0], expected, delta=1)
+        self.assertAlmostEqual(stats.mean, expected, delta=1)
+        self.assertAlmostEqual(ad.read_data_array(2, decimate=Boxcar(4))[1], expected, delta=1)
+        with ad.stream(16) as stream:
+            self.assertAlmostEqual(next(stream)[0], expected, delta=1)
+        with ad.stream(2, decimate=Boxcar(4)) as stream:
+            self.assertAlmostEqual(next(stream)[1], expected, delta=1)
+        ad.start_capture(capacity=16)
+        try:
+            while ad.backend.capture_available() < 4:
+                time.sleep(1e-3)
+            samples = ad.read_available()
+            self.assertGreaterEqual(len(samples), 4)
+            self.assertAlmostEqual(samples[0], expected, delta=1)
+        finally:
+            ad.stop_capture()
+
+    def test_reference_at_offset(self):
+        ad = MCP3901(SimulatedBackend('MCP3901', (Constant(0.01), None)))
+        cal = ad.calibrate(0)
+        with self.assertRaisesRegex(ValueError, 'shorted or disconnected'):
+            ad.calibrate(0, 1 << 22, calibration=cal)
+
+
+if __name__ == '__main__':
+    unittest.main()
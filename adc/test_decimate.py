@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+
+import unittest
+from array import array
+from unittest import mock
+
+from adc.backends import backend
+from adc.decimate import Boxcar, CIC, Decimator, FIR
+
+
+class TestDecimate(unittest.TestCase):
+
+    def setUp(self):
+        self.samples = array('i', (i * i % 1000 - 500 for i in range(100)))
+
+    def reference(self, decimator, samples):
+        taps = decimator.taps()
+        x = [0] * (len(taps) - 1) + list(samples)
+        return [sum(t * v for t, v in zip(taps, reversed(x[j:j + len(taps)])))
+                for j in range(decimator.factor - 1, len(samples), decimator.factor)]
+
+    def check(self, decimator):
+        expected = self.reference(decimator, self.samples)
+        self.assertEqual(decimator.output_length(len(self.samples)), len(expected))
+        outputs = list(decimator.filter(self.samples[:37])) + list(decimator.filter(self.samples[37:]))
+        self.assertEqual(len(outputs), len(expected))
+        for a, b in zip(outputs, expected):
+            self.assertAlmostEqual(a, b, places=6)
+        decimator.reset()
+        self.assertEqual(decimator.phase, 0)
+
+    def test_filters(self):
+        for make in (lambda: Boxcar(4), lambda: CIC(5, 3), lambda: FIR([0.25, -1, 2.5], 3), lambda: FIR.lowpass(4)):
+            self.check(make())
+            with mock.patch.object(backend, 'spi_rpi', None):
+                self.check(make())
+                with mock.patch.object(backend, 'numpy', None):
+                    self.check(make())
+
+    def test_taps(self):
+        self.assertEqual(CIC(2, 2).taps(), [0.25, 0.5, 0.25])
+        self.assertAlmostEqual(sum(CIC(16, 3).taps()), 1)
+        self.assertAlmostEqual(sum(FIR.lowpass(8).taps()), 1)
+        self.assertEqual(Boxcar(4).filter(array('h', [1, 2, 3, 4, 5, 6, 7])).tolist(), [2.5])
+
+    def test_out(self):
+        out = array('d', bytes(8 * 10))
+        self.assertEqual(list(Boxcar(2).filter(array('i', [1, 3, 5, 7, 9]), out)), [2, 6])
+        self.assertEqual(Boxcar(2).input_length(3), 6)
+        with self.assertRaises(AssertionError):
+            CIC(1 << 14, 3)
+        with self.assertRaises(TypeError):
+            Decimator(2)
+
+
+if __name__ == '__main__':
+    unittest.main()
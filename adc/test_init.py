@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+
+import os
+import subprocess
+import sys
+import unittest
+
+import adc
+import adc.backends
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def loaded_after(code: str) -> set:
+    """Hardware and heavy modules loaded by running code in a fresh interpreter"""
+    check = 'import sys\n{}\nprint(" ".join(m for m in ("pigpio", "numpy", "adc.backends.ext.spi_rpi", ' \
+            '"multiprocessing") if m in sys.modules))'.format(code)
+    output = subprocess.run([sys.executable, '-c', check], cwd=_ROOT, check=True, capture_output=True, text=True)
+    return set(output.stdout.split())
+
+
+class TestLazyImport(unittest.TestCase):
+
+    def test_registers(self):
+        self.assertEqual(loaded_after('import adc\nimport adc.mcp3911_register\nadc.mcp3901_register.GainReg()'),
+                         set())
+
+    def test_driver(self):
+        self.assertEqual(loaded_after('from adc import MCP3911, MCP3901'), set())
+        self.assertEqual(loaded_after('from adc.backends import SimulatedBackend'), set())
+        self.assertEqual(loaded_after('import adc.backends.simulated, adc.backends.replay'), set())
+
+    def test_attributes(self):
+        self.assertIs(adc.MCP3911, adc.mcp3911.MCP3911)
+        self.assertIs(adc.backends.SimulatedBackend, adc.backends.simulated.SimulatedBackend)
+        self.assertIn('SPI_spidev', dir(adc))
+        with self.assertRaises(AttributeError):
+            adc.missing
+        with self.assertRaises(AttributeError):
+            adc.backends.missing
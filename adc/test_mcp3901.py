@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
 
 import unittest
+from array import array
 from unittest.mock import Mock
 
 from adc.mcp3901 import MCP3901
@@ -33,3 +34,40 @@ class TestMCP3901(unittest.TestCase):
         config = Config2Reg(reset=Config2Reg.Reset.ch0)
         self.ad.write_reg_config2(config)
         self.backend.transfer.assert_called_once_with(bytes([Address.CONFIG2 << 1]) + bytes(config))
+
+    def test_read_data_array_out(self):
+        out = array('h', [-1, -32768, 32767])
+        self.backend.get_data.return_value = out
+        data = self.ad.read_data_array(3, ch=1, width=16, out=out)
+        self.backend.get_data.assert_called_once_with(Address.DATA_CH1, 2, 3, out)
+        self.assertIs(data, out)
+        self.assertEqual(list(data), [-1, -32768, 32767])
+
+    def test_read_data_array_both(self):
+        self.ad.read_data_array_both(10, width=16)
+        self.backend.get_data_both.assert_called_once_with(Address.DATA_CH0, (2, 2), 10, None, False)
+
+    def test_start_capture(self):
+        self.ad.start_capture(ch=0, width=24, capacity=100)
+        self.backend.start_capture.assert_called_once_with(Address.DATA_CH0, 3, 100)
+
+    def test_width_from_cache(self):
+        self.backend.transfer.return_value = bytes([0]) + bytes(Config1Reg())
+        ad = MCP3901(self.backend, cache=True)
+        ad.read_data_array(10, ch=1)
+        self.backend.get_data.assert_called_with(Address.DATA_CH1, 2, 10, None)
+        ad.update_reg_config1(width=Config1Reg.Width.w24)
+        ad.read_data_array_both(10)
+        self.backend.get_data_both.assert_called_with(Address.DATA_CH0, (3, 3), 10, None, False)
+        self.assertEqual(self.backend.transfer.call_count, 2)
+
+    def test_snapshot(self):
+        regs = RegisterMap(status_com=StatusComReg(read=StatusComReg.Read.all), config1=Config1Reg(width=1))
+        self.backend.transfer.side_effect = lambda data: bytes(1) + (bytes(regs) * 2)[data[0] >> 1:][:len(data) - 1]
+        self.backend.transfer_many.side_effect = lambda frames: [self.backend.transfer(f) for f in frames]
+        ad = MCP3901(self.backend, cache=True)
+        self.assertEqual(bytes(ad.snapshot()), bytes(regs))
+        ad.restore(regs)
+        self.backend.transfer.assert_any_call(bytes([Address.PHASE << 1]) + bytes(regs)[Address.PHASE:])
+        self.assertEqual(self.backend.transfer.call_count, 5)
+        self.assertEqual(self.backend.transfer_many.call_count, 1)
@@ -34,3 +34,7 @@ class TestMCP3901Register(unittest.TestCase):
             bits += f[2]
         self.assertEqual(bits, 8)
         self.assertEqual(len(bytes(reg.Config2Reg())), 1)
+
+    def test_RegisterMap(self):
+        self.assertEqual(len(bytes(reg.RegisterMap())), reg.Address.CONFIG2 + 1)
+        self.assertEqual(reg.RegisterMap.status_com.offset, reg.Address.STATUS_COM)
@@ -1,11 +1,13 @@
 #!/usr/bin/env python
 
 import unittest
+from array import array
 from unittest.mock import Mock
 
 from adc.mcp3911 import MCP3911
 from adc.mcp3911_register import *
 from adc.backends.backend import Backend
+from adc.backends.simulated import SimulatedBackend
 
 
 class TestMCP3911(unittest.TestCase):
@@ -28,3 +30,147 @@ class TestMCP3911(unittest.TestCase):
         config = ConfigReg(pre=ConfigReg.Pre.pre8)
         self.ad.write_reg_config(config)
         self.backend.transfer.assert_called_once_with(bytes([Address.CONFIG << 1]) + bytes(config))
+
+    def test_read_data_array_out(self):
+        out = array('h', [-1, -32768, 32767])
+        self.backend.get_data.return_value = out
+        data = self.ad.read_data_array(3, ch=1, width=16, out=out)
+        self.backend.get_data.assert_called_once_with(Address.CHANNEL1, 2, 3, out)
+        self.assertIs(data, out)
+        self.assertEqual(list(data), [-1, -32768, 32767])
+
+    def test_read_data_array_both(self):
+        self.ad.read_data_array_both(10, StatusComReg.Width.ch1_24bit_ch0_16bit)
+        self.backend.get_data_both.assert_called_once_with(Address.CHANNEL0, (2, 3), 10, None, False)
+
+        self.backend.get_data_both.reset_mock()
+        self.ad.read_data_array_both(10, interleave=True)
+        self.backend.get_data_both.assert_called_once_with(Address.CHANNEL0, (3, 3), 10, None, True)
+
+    def test_read_data_array_timestamps(self):
+        self.backend.get_data.return_value = out = array('i', bytes(12))
+        data, timestamps = self.ad.read_data_array(3, timestamps=True)
+        self.backend.get_data.assert_called_once_with(Address.CHANNEL0, 3, 3, None, timestamps=timestamps)
+        self.assertIs(data, out)
+        self.assertEqual(timestamps.typecode, 'q')
+        self.assertEqual(len(timestamps), 3)
+
+    def test_find_gaps(self):
+        self.ad.read_reg_config = lambda: ConfigReg(osr=ConfigReg.Osr.osr32)
+        self.assertEqual(self.ad.data_rate(), 31250)
+        gaps = self.ad.find_gaps(array('q', [0, 32000, 96000, 128000]))
+        self.assertEqual((gaps.missed, gaps.indices), (1, [2]))
+
+    def test_capture(self):
+        self.ad.start_capture(ch=1, width=16, capacity=100)
+        self.backend.start_capture.assert_called_once_with(Address.CHANNEL1, 2, 100)
+
+        self.backend.capture_available.return_value = 3
+        self.backend.read_capture.return_value = 3
+        data = self.ad.read_available()
+        self.assertEqual(data.typecode, 'h')
+        self.assertEqual(len(data), 3)
+
+        out = array('h', bytes(20))
+        self.backend.read_capture.return_value = 2
+        self.assertEqual(len(self.ad.read_available(out)), 2)
+        self.backend.read_capture.assert_called_with(out)
+
+        self.backend.capture_dropped.return_value = 5
+        self.assertEqual(self.ad.stop_capture(), 5)
+        self.backend.stop_capture.assert_called_once_with()
+
+    def test_stream(self):
+        stream = self.ad.stream(32, ch=1, width=24)
+        self.backend.start_capture.assert_called_once_with(Address.CHANNEL1, 3, 256, 0)
+        self.backend.read_capture.return_value = 32
+        self.assertEqual(len(next(stream)), 32)
+        stream.close()
+        self.backend.stop_capture.assert_called_once_with()
+
+
+class TestMCP3911Cache(unittest.TestCase):
+
+    def setUp(self):
+        self.backend = unittest.mock.create_autospec(spec=Backend)
+        self.backend.transfer.side_effect = lambda data: bytes([0]) + bytes(StatusComReg())
+        self.ad = MCP3911(self.backend, cache=True)
+
+    def test_read_cached(self):
+        self.assertEqual(bytes(self.ad.read_reg_status_com()), bytes(StatusComReg()))
+        self.assertEqual(bytes(self.ad.read_reg_status_com()), bytes(StatusComReg()))
+        self.backend.transfer.assert_called_once_with(bytes([Address.STATUSCOM << 1 | 1]) + bytes(2))
+
+        self.ad.invalidate()
+        self.ad.read_reg_status_com()
+        self.assertEqual(self.backend.transfer.call_count, 2)
+
+    def test_update(self):
+        config = ConfigReg()
+        self.ad.write_reg_config(config)
+        reg = self.ad.update_reg_config(osr=ConfigReg.Osr.osr4096, shutdown=ConfigReg.Shutdown.both)
+        self.assertEqual(reg.osr, ConfigReg.Osr.osr4096)
+        self.assertEqual(reg.pre, config.pre)
+        self.assertEqual(self.backend.transfer.call_count, 2)
+        self.backend.transfer.assert_called_with(bytes([Address.CONFIG << 1]) + bytes(reg))
+        self.assertEqual(bytes(self.ad.read_reg_config()), bytes(reg))
+        with self.assertRaises(AssertionError):
+            self.ad.update_reg_config(osrr=0)
+
+    def test_width_from_cache(self):
+        self.ad.write_reg_status_com(StatusComReg(width=StatusComReg.Width.ch1_24bit_ch0_16bit))
+        self.ad.read_data_array(10)
+        self.backend.get_data.assert_called_with(Address.CHANNEL0, 2, 10, None)
+        self.ad.read_data_array(10, ch=1)
+        self.backend.get_data.assert_called_with(Address.CHANNEL1, 3, 10, None)
+        self.ad.read_data_array_both(10)
+        self.backend.get_data_both.assert_called_with(Address.CHANNEL0, (2, 3), 10, None, False)
+        self.assertEqual(self.backend.transfer.call_count, 1)
+
+    def test_data_not_cached(self):
+        self.ad.write_reg(Address.CHANNEL0, bytes(6))
+        self.ad.read_reg(Address.CHANNEL0, 3)
+        self.assertEqual(self.backend.transfer.call_count, 2)
+
+
+class TestMCP3911Snapshot(unittest.TestCase):
+
+    def setUp(self):
+        self.backend = SimulatedBackend('MCP3911')
+        self.backend.regs.status_com.read = StatusComReg.Read.all
+        self.backend.transfer = Mock(wraps=self.backend.transfer)
+        self.ad = MCP3911(self.backend, cache=True)
+
+    def test_snapshot(self):
+        self.backend.regs.config.osr = ConfigReg.Osr.osr4096
+        regs = self.ad.snapshot()
+        self.assertEqual(regs.config.osr, ConfigReg.Osr.osr4096)
+        self.assertEqual(regs.status_com.read, StatusComReg.Read.all)
+        self.assertEqual(self.backend.transfer.call_count, 2)
+        self.ad.snapshot()
+        self.assertEqual(self.backend.transfer.call_count, 3)
+
+    def test_restore(self):
+        regs = self.ad.snapshot()
+        regs.gain.pga_ch0 = GainReg.Pga.x32
+        regs.status_com.width = StatusComReg.Width.both_ch_16bit
+        regs.vrefcal = 0x42
+        self.backend.transfer.reset_mock()
+        self.ad.restore(regs)
+        self.assertEqual(self.backend.transfer.call_count, 2)
+        self.assertEqual(bytes(self.backend.regs)[Address.PHASE:], bytes(regs)[Address.PHASE:])
+        self.assertEqual(self.ad.data_width(0), 16)
+
+    def test_restore_read_mode(self):
+        regs = self.ad.snapshot()
+        regs.status_com.read = StatusComReg.Read.groups
+        self.ad.restore(regs)
+        self.assertEqual(self.ad.read_reg_status_com().read, StatusComReg.Read.groups)
+        self.assertEqual(bytes(self.backend.regs.status_com), bytes(regs.status_com))
+
+    def test_restore_mismatch(self):
+        regs = self.ad.snapshot()
+        regs.config.osr = ConfigReg.Osr.osr32
+        self.backend.transfer = Mock(side_effect=lambda data: bytes(len(data)))
+        with self.assertRaises(RuntimeError):
+            self.ad.restore(regs)
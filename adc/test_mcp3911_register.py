@@ -33,3 +33,9 @@ class TestMCP3911Register(unittest.TestCase):
             bits += f[2]
         self.assertEqual(bits, 16)
         self.assertEqual(len(bytes(reg.ConfigReg())), 2)
+
+    def test_RegisterMap(self):
+        self.assertEqual(len(bytes(reg.RegisterMap())), reg.Address.VREFCAL + 1)
+        self.assertEqual(reg.RegisterMap.config.offset, reg.Address.CONFIG)
+        self.assertEqual(reg.RegisterMap.gaincal_ch1.offset, reg.Address.GAINCAL_CH1)
+        self.assertIn('pga_ch0', reg.RegisterMap().to_string())
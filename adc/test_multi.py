@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+
+import time
+import unittest
+
+from adc.backends.simulated import Constant, SimulatedBackend
+from adc.mcp3901 import MCP3901
+from adc.mcp3911 import MCP3911
+from adc.mcp3911_register import *
+from adc.multi import MultiADC
+
+
+class TestMultiADC(unittest.TestCase):
+
+    def setUp(self):
+        self.devices = []
+        for volts in (0.1, 0.2, 0.3):
+            ad = MCP3911(SimulatedBackend('MCP3911', (Constant(volts), Constant(-volts))))
+            ad.write_reg_config(ConfigReg(osr=ConfigReg.Osr.osr32))
+            self.devices.append(ad)
+            # the devices start converting at different times
+            time.sleep(0.003)
+
+    def tearDown(self):
+        for ad in self.devices:
+            ad.backend.close()
+
+    def test_aligned(self):
+        period = 1e9 / self.devices[0].data_rate()
+        with MultiADC(self.devices, ch=[0, 1, 0]) as multi:
+            blocks = multi.read(256, timeout=5)
+            blocks += multi.read(256, timeout=5)
+        self.assertEqual(len(multi.stop()), 3)
+
+        self.assertEqual([b[0][0] for b in blocks[:3]],
+                         [round(v * 1.5 / 1.2 * 2 ** 23) for v in (0.1, -0.2, 0.3)])
+        for samples, timestamps in blocks:
+            self.assertEqual(len(samples), 256)
+        for i, (_, timestamps) in enumerate(blocks[:3]):
+            self.assertLessEqual(abs(timestamps[0] - multi.start_ns), period / 2)
+            # the second block follows on
+            self.assertAlmostEqual(blocks[i + 3][1][0] - timestamps[-1], period, delta=1)
+
+    def test_devices(self):
+        mcp3901 = MCP3901(SimulatedBackend('MCP3901'))
+        with MultiADC([self.devices[0], mcp3901], width=16) as multi:
+            (a, _), (b, _) = multi.read(16, timeout=5)
+        self.assertEqual((a.itemsize, b.itemsize), (2, 2))
+        mcp3901.backend.close()
+
+        with self.assertRaises(AssertionError):
+            MultiADC([self.devices[0], self.devices[0]])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+
+import unittest
+
+from adc import planner
+from adc.backends.simulated import SimulatedBackend
+from adc.mcp3901 import MCP3901
+from adc.mcp3901_register import Config1Reg
+from adc.mcp3911 import MCP3911
+from adc.mcp3911_register import ConfigReg, StatusComReg
+
+
+class TestPlanner(unittest.TestCase):
+
+    def test_plan(self):
+        plans = planner.plan('MCP3911', 4e6, 3906.25)
+        self.assertEqual(len(plans), 4 * len(planner.BAUDS))
+        best = plans[0]
+        self.assertEqual((best.pre, best.osr), (ConfigReg.Pre.pre1, ConfigReg.Osr.osr256))
+        self.assertEqual(best.data_rate, 3906.25)
+        self.assertEqual((best.baud, best.frame_bytes), (1000000, 4))
+        self.assertAlmostEqual(best.headroom, 1 - (32 / 1e6 + 10e-6) * 3906.25)
+
+        # at 125 kHz only the faster clocks leave the headroom for both 24-bit channels
+        plans = planner.plan(MCP3911, 16e6, 125000, channels=2, overhead=0)
+        self.assertEqual(min(p.baud for p in plans), 10000000)
+        self.assertEqual(planner.plan('MCP3911', 16e6, 125000, channels=2), [])
+        self.assertEqual(planner.plan('MCP3901', 4e6, 10000), [])
+
+    def test_apply(self):
+        ad = MCP3911(SimulatedBackend('MCP3911'))
+        plan = planner.plan(ad, 8e6, 1953.125, width=16)[0]
+        planner.apply(ad, plan)
+        self.assertEqual(ad.read_reg_config().osr, ConfigReg.Osr.osr1024)
+        self.assertEqual(ad.read_reg_status_com().width, StatusComReg.Width.both_ch_16bit)
+        self.assertEqual(ad.mclk, 8e6)
+
+        ad.backend.baud = 1000000
+        with self.assertRaises(ValueError):
+            planner.apply(ad, plan._replace(baud=20000000))
+
+        # only the clocks the backend reaches are planned, so the best plan applies
+        ad.backend.baud = 16000000
+        plans = planner.plan(ad, 16e6, 125000, channels=2, overhead=0)
+        self.assertEqual(sorted({p.baud for p in plans}), [10000000, 16000000])
+        self.assertEqual(plans[0].baud, 10000000)
+        planner.apply(ad, plans[0])
+        ad.backend.baud = 8000000
+        self.assertEqual(planner.plan(ad, 16e6, 125000, channels=2, overhead=0), [])
+
+        ad = MCP3901(SimulatedBackend('MCP3901'))
+        planner.apply(ad, planner.plan(ad, 4e6, 15625, channels=2)[0])
+        self.assertEqual(ad.read_reg_config1().width, Config1Reg.Width.w24)
+
+    def test_validate(self):
+        for ad in (MCP3911(SimulatedBackend('MCP3911')), MCP3901(SimulatedBackend('MCP3901'))):
+            plan = planner.plan(ad, 4e6, ad.data_rate(), channels=2)[0]
+            planner.apply(ad, plan)
+            result = planner.validate(ad, plan, 256)
+            self.assertTrue(result.ok)
+            self.assertAlmostEqual(result.interval, plan.period)
+
+            # conversions twice as far apart as planned
+            result = planner.validate(ad, plan._replace(period=plan.period / 2), 256)
+            self.assertEqual((result.ok, result.missed), (False, 255))
+
+
+if __name__ == '__main__':
+    unittest.main()
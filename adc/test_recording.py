@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from adc.backends import backend
+from adc.backends.simulated import Constant, SimulatedBackend, Sine
+from adc.mcp3911 import MCP3911
+from adc.mcp3911_register import *
+from adc.recording import Recording
+
+
+class TestRecording(unittest.TestCase):
+
+    def setUp(self):
+        self.backend = SimulatedBackend('MCP3911', (Constant(0.6), Sine(0.1, 50)))
+        self.backend.realtime = True
+        self.ad = MCP3911(self.backend)
+        self.ad.write_reg_config(ConfigReg(osr=ConfigReg.Osr.osr32))
+        self.ad.write_reg_status_com(StatusComReg(read=StatusComReg.Read.groups,
+                                                  width=StatusComReg.Width.both_ch_16bit))
+        fd, self.path = tempfile.mkstemp(suffix='.adc')
+        os.close(fd)
+
+    def tearDown(self):
+        os.unlink(self.path)
+
+    def record(self):
+        with self.ad.record(self.path, width=16, block_size=2048):
+            time.sleep(0.05)
+        self.assertEqual(self.ad.read_reg_status_com().read, StatusComReg.Read.groups)
+        self.assertGreater(os.path.getsize(self.path), 4096)
+
+    def test_record(self):
+        self.record()
+        with Recording(self.path) as recording:
+            self.assertEqual((recording.device, recording.channel, recording.width), ('MCP3911', 0, 16))
+            self.assertEqual(recording.registers.status_com.read, StatusComReg.Read.groups)
+            self.assertEqual(recording.registers.config.osr, ConfigReg.Osr.osr32)
+            self.assertEqual(recording.data_rate, self.backend.data_rate)
+            self.assertEqual(len(recording), (os.path.getsize(self.path) - 4096) // 2)
+            self.assertEqual(set(recording.samples.tolist()), {round(0.6 * 1.5 / 1.2 * 2 ** 15)})
+            self.assertEqual(len(recording.between(0, 256 / recording.data_rate)), 256)
+            self.assertEqual(recording.dropped, 0)
+
+    def test_without_numpy(self):
+        self.record()
+        with mock.patch.object(backend, 'numpy', None):
+            recording = Recording(self.path)
+            self.assertIsInstance(recording.samples, memoryview)
+            self.assertEqual(recording.between(0, 1e-3)[0], round(0.6 * 1.5 / 1.2 * 2 ** 15))
+            recording.close()
+
+    def test_not_a_recording(self):
+        with open(self.path, 'wb') as f:
+            f.write(bytes(8192))
+        with self.assertRaises(ValueError):
+            Recording(self.path)
+
+    def test_unknown_device(self):
+        self.record()
+        with open(self.path, 'r+b') as f:
+            header = bytearray(f.read(64))
+            start = header.index(b'MCP3911')
+            header[start:start + 16] = b'os'.ljust(16, b'\0')
+            f.seek(0)
+            f.write(header)
+        with self.assertRaisesRegex(ValueError, 'unknown device'):
+            Recording(self.path)
+
+    def test_old_version(self):
+        self.record()
+        with open(self.path, 'r+b') as f:
+            f.seek(4)
+            f.write((1).to_bytes(2, 'little'))
+        with self.assertRaisesRegex(ValueError, 'version 1'):
+            Recording(self.path)
+
+
+if __name__ == '__main__':
+    unittest.main()
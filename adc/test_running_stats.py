@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+
+import math
+import statistics
+import unittest
+from array import array
+from unittest import mock
+
+from adc.backends import backend
+from adc.running_stats import RunningStats
+
+
+class TestRunningStats(unittest.TestCase):
+
+    def setUp(self):
+        self.samples = array('h', [-32768, 32767] + [i * 7919 % 20000 - 10000 for i in range(998)])
+
+    def check(self):
+        stats = RunningStats()
+        self.assertTrue(math.isnan(stats.mean))
+        self.assertIsNone(stats.min)
+        stats.update(self.samples[:333], 16)
+        stats.update(array('i', self.samples[333:]), 16)
+
+        self.assertEqual(stats.count, len(self.samples))
+        self.assertAlmostEqual(stats.mean, statistics.fmean(self.samples), places=9)
+        self.assertAlmostEqual(stats.stdev, statistics.stdev(self.samples), places=6)
+        self.assertAlmostEqual(stats.rms, math.sqrt(statistics.fmean(v * v for v in self.samples)), places=6)
+        self.assertEqual((stats.min, stats.max, stats.clipped), (-32768, 32767, 2))
+
+        stats.update(self.samples[:1], 24)
+        self.assertEqual(stats.clipped, 2)
+        stats.reset()
+        self.assertEqual(stats.count, 0)
+
+    def test_running_stats(self):
+        self.check()
+        with mock.patch.object(backend, 'spi_rpi', None):
+            self.check()
+            with mock.patch.object(backend, 'numpy', None):
+                self.check()
+
+
+if __name__ == '__main__':
+    unittest.main()
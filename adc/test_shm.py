@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+
+import multiprocessing
+import unittest
+from array import array
+from unittest import mock
+
+from adc.backends import backend
+from adc.mcp3911 import MCP3911
+from adc.shm import SharedRing
+from adc.test_stream import CounterBackend
+
+
+def _consume(name, n, queue):
+    with SharedRing.attach(name) as ring:
+        consumer = ring.consumer(oldest=True)
+        out = array('i', bytes(4 * n))
+        queue.put((consumer.read(out, n, timeout=5), list(out), consumer.overruns))
+        del out
+
+
+class TestSharedRing(unittest.TestCase):
+
+    def test_wrap(self):
+        with SharedRing.create(capacity=10, byte_width=3) as ring:
+            consumer = ring.consumer()
+            ring.write(array('i', range(7)))
+            self.assertEqual(list(consumer.peek()), list(range(7)))
+            self.assertTrue(consumer.consume(7))
+            ring.write(array('i', range(7, 12)))
+            self.assertEqual(list(consumer.peek()), [7, 8, 9])
+            out = array('i', bytes(4 * 5))
+            self.assertEqual(consumer.read(out), 5)
+            self.assertEqual(list(out), list(range(7, 12)))
+            self.assertEqual(consumer.overruns, 0)
+
+    def test_overrun(self):
+        with SharedRing.create(capacity=10, byte_width=2) as ring:
+            consumer = ring.consumer()
+            ring.write(array('h', range(25)))
+            self.assertEqual(consumer.available(), 10)
+            self.assertEqual(consumer.overruns, 15)
+            view = consumer.peek()
+            self.assertEqual(list(view), list(range(15, 20)))
+            ring.write(array('h', range(25, 35)))
+            self.assertFalse(consumer.consume(len(view)))
+            self.assertEqual(consumer.overruns, 20)
+            view.release()
+
+    def test_write_in_progress(self):
+        for spi_rpi in (backend._load_spi_rpi(), None):
+            with mock.patch.object(backend, 'spi_rpi', spi_rpi), SharedRing.create(capacity=10, byte_width=3) as ring:
+                consumer = ring.consumer()
+                ring.write(array('i', range(10)))
+                view = consumer.peek()
+                # a write of 4 samples claimed their slots and was preempted before publishing them
+                ring._header[3] = 14
+                self.assertEqual(consumer.available(), 10)
+                self.assertFalse(consumer.consume(len(view)))
+                self.assertEqual(consumer.overruns, 4)
+                view.release()
+
+    def test_attach(self):
+        with SharedRing.create(capacity=100, byte_width=3) as ring:
+            ring.write(array('i', range(50)))
+            queue = multiprocessing.get_context('spawn').Queue()
+            process = multiprocessing.get_context('spawn').Process(target=_consume, args=(ring.name, 50, queue))
+            process.start()
+            self.assertEqual(queue.get(timeout=30), (50, list(range(50)), 0))
+            process.join()
+
+    def test_publish(self):
+        adc = MCP3911(CounterBackend(0.001))
+        publisher = adc.publish(None, 100, capacity=10000)
+        ring = SharedRing.attach(publisher.ring.name)
+        consumer = ring.consumer(oldest=True)
+        out = array('i', bytes(4 * 300))
+        self.assertEqual(consumer.read(out, 300, timeout=5), 300)
+        self.assertEqual(list(out), list(range(300)))
+        ring.close()
+        publisher.stop()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+
+import time
+import unittest
+
+from adc.backends.backend import Backend, new_buffer
+from adc.stream import Stream
+
+
+class CounterBackend(Backend):
+    """Returns consecutive sample values, a fixed delay per get_data() call"""
+
+    def __init__(self, delay=0.0):
+        self.count = 0
+        self.delay = delay
+
+    def transfer(self, data: bytes) -> bytes:
+        return bytes(len(data))
+
+    def get_data(self, addr: int, byte_width: int, sample_len: int, out=None):
+        if out is None:
+            out = new_buffer(sample_len, byte_width)
+        for i in range(sample_len):
+            out[i] = (self.count + i) % 30000
+        self.count += sample_len
+        time.sleep(self.delay)
+        return out
+
+    def close(self):
+        pass
+
+
+class FailingBackend(CounterBackend):
+    """Fails on the first get_data() call past limit samples"""
+
+    def __init__(self, limit: int):
+        super().__init__()
+        self.limit = limit
+
+    def get_data(self, addr: int, byte_width: int, sample_len: int, out=None):
+        if self.count >= self.limit:
+            raise OSError('SPI transfer failed')
+        return super().get_data(addr, byte_width, sample_len, out)
+
+
+class TestStream(unittest.TestCase):
+
+    def test_gapless(self):
+        with Stream(CounterBackend(0.001), 0, 2, 100, timeout=5) as stream:
+            expected = 0
+            for i, block in zip(range(10), stream):
+                self.assertEqual(len(block), 100)
+                self.assertEqual(list(block), list(range(expected, expected + 100)))
+                expected += 100
+            self.assertEqual(stream.dropped, 0)
+        self.assertEqual(list(stream), [])
+
+    def test_double_buffer(self):
+        with Stream(CounterBackend(), 0, 3, 10, timeout=5) as stream:
+            a = next(stream)
+            b = next(stream)
+            c = next(stream)
+            self.assertIsNot(a, b)
+            self.assertIs(a, c)
+
+    def test_dropped(self):
+        with Stream(CounterBackend(), 0, 3, 10, capacity=20, timeout=5) as stream:
+            next(stream)
+            time.sleep(0.05)
+            block = next(stream)
+            next(stream)
+            self.assertGreater(stream.dropped, 0)
+            self.assertEqual(block[0], 10)
+
+    def test_count(self):
+        with Stream(CounterBackend(), 0, 3, 100, timeout=5, count=250) as stream:
+            blocks = [list(block) for block in stream]
+        self.assertEqual([len(block) for block in blocks], [100, 100, 50])
+        self.assertEqual(blocks[2], list(range(200, 250)))
+
+    def test_error(self):
+        # the capture thread reads 256 samples, then fails
+        blocks = []
+        with Stream(FailingBackend(1), 0, 3, 100, timeout=5) as stream:
+            with self.assertRaises(OSError):
+                for block in stream:
+                    blocks.append(list(block))
+        self.assertEqual([len(block) for block in blocks], [100, 100, 56])
+        self.assertEqual(blocks[2], list(range(200, 256)))
+
+
+if __name__ == '__main__':
+    unittest.main()
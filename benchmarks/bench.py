@@ -0,0 +1,360 @@
+#!/usr/bin/env python3
+
+"""
+Benchmarks of the acquisition, decoding and register paths against in-process fake backends
+
+    python3 benchmarks/bench.py                          # print results
+    python3 benchmarks/bench.py --json out.json          # also write them as JSON
+    python3 benchmarks/bench.py --save                   # record benchmarks/baseline.json
+    python3 benchmarks/bench.py --compare                # compare with it
+
+Each benchmark reports the best of several repeats as ns per operation, and samples per second
+for the data paths. With --compare, a benchmark slower than the baseline by more than the
+tolerance is flagged and the exit status is 1. Timings are machine specific, so the baseline is
+not kept in the tree: record it with --save on the machine that runs the comparison, before the
+change being measured.
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from array import array
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_BASELINE = os.path.join(_ROOT, 'benchmarks', 'baseline.json')
+sys.path.insert(0, _ROOT)
+
+from adc.backends import backend as backend_module  # noqa: E402
+from adc.backends.backend import Backend, new_buffer, new_float_buffer, scale_codes, sign_extend  # noqa: E402
+from adc.backends.replay import ReplayBackend  # noqa: E402
+from adc.backends.simulated import Sine, SimulatedBackend  # noqa: E402
+from adc.decimate import CIC  # noqa: E402
+from adc.mcp3911 import MCP3911  # noqa: E402
+from adc.mcp3911_register import ConfigReg, StatusComReg  # noqa: E402
+from adc.running_stats import RunningStats  # noqa: E402
+
+_BENCHMARKS = []
+
+
+def benchmark(name: str, samples: int = 0):
+    """
+    Register a benchmark. The function returns a callable running one operation of samples
+    samples, optionally with a second one to clean up, or None to skip the benchmark.
+    """
+    def register(setup):
+        _BENCHMARKS.append((name, samples, setup))
+        return setup
+    return register
+
+
+class RawBackend(Backend):
+    """Copies pre-encoded raw codes, as the SPI driver reads them, then decodes them in place"""
+
+    def __init__(self, length: int):
+        self.raw = {2: array('H', (i & 0xFFFF for i in range(length))).tobytes(),
+                    3: array('i', (i * 97 & 0xFFFFFF for i in range(length))).tobytes()}
+
+    def transfer(self, data: bytes) -> bytes:
+        return bytes(len(data))
+
+    def get_data(self, addr: int, byte_width: int, sample_len: int, out=None):
+        if out is None:
+            out = new_buffer(sample_len, byte_width)
+        view = memoryview(out).cast('B')
+        view[:] = self.raw[byte_width][:len(view)]
+        sign_extend(out, 8 * byte_width)
+        return out
+
+    def close(self):
+        pass
+
+
+def _read_data_array(width: int, length: int):
+    ad = MCP3911(RawBackend(length))
+    out = new_buffer(length, width // 8)
+    return lambda: ad.read_data_array(length, width=width, out=out)
+
+
+@benchmark('read_data_array.16bit', samples=65536)
+def _():
+    return _read_data_array(16, 65536)
+
+
+@benchmark('read_data_array.24bit', samples=65536)
+def _():
+    return _read_data_array(24, 65536)
+
+
+def _sign_extend(byte_width: int, length: int, native: bool, numpy: bool):
+    data = new_buffer(length, byte_width)
+    saved = backend_module._load_spi_rpi(), backend_module._load_numpy()
+    if saved[0] is None and native or saved[1] is None and numpy:
+        return None
+
+    def run():
+        backend_module.spi_rpi = saved[0] if native else None
+        backend_module.numpy = saved[1] if numpy else None
+        try:
+            sign_extend(data, 8 * byte_width)
+        finally:
+            backend_module.spi_rpi, backend_module.numpy = saved
+    return run
+
+
+@benchmark('sign_extend.native.24bit', samples=65536)
+def _():
+    return _sign_extend(3, 65536, True, False)
+
+
+@benchmark('sign_extend.numpy.24bit', samples=65536)
+def _():
+    return _sign_extend(3, 65536, False, True)
+
+
+@benchmark('sign_extend.python.24bit', samples=4096)
+def _():
+    return _sign_extend(3, 4096, False, False)
+
+
+def _decimate(native: bool):
+    samples = new_buffer(65536, 3)
+    saved = backend_module._load_spi_rpi()
+    if saved is None and native or backend_module._load_numpy() is None and not native:
+        return None
+    backend_module.spi_rpi = saved if native else None
+    try:
+        decimator = CIC(16)
+        decimator.native()
+    finally:
+        backend_module.spi_rpi = saved
+    return lambda: decimator.filter(samples)
+
+
+@benchmark('decimate.cic16.native', samples=65536)
+def _():
+    return _decimate(True)
+
+
+@benchmark('decimate.cic16.numpy', samples=65536)
+def _():
+    return _decimate(False)
+
+
+@benchmark('scale_codes.24bit', samples=65536)
+def _():
+    codes = new_buffer(65536, 3)
+    out = new_float_buffer(65536)
+    return lambda: scale_codes(codes, 1.2 / 1.5 / 2 ** 23, out)
+
+
+@benchmark('running_stats.update.24bit', samples=65536)
+def _():
+    samples = array('i', (i * 7919 % 20000 - 10000 for i in range(65536)))
+    stats = RunningStats()
+    return lambda: stats.update(samples)
+
+
+@benchmark('simulated.read_data_array.24bit', samples=65536)
+def _():
+    ad = MCP3911(SimulatedBackend(sources=(Sine(0.5, 50), None)))
+    out = new_buffer(65536, 3)
+    return lambda: ad.read_data_array(65536, out=out)
+
+
+@benchmark('simulated.read_data_array_both.16bit', samples=65536)
+def _():
+    ad = MCP3911(SimulatedBackend(sources=(Sine(0.5, 50), Sine(0.2, 60))))
+    ad.write_reg_status_com(StatusComReg(width=StatusComReg.Width.both_ch_16bit))
+    out = (new_buffer(65536, 2), new_buffer(65536, 2))
+    return lambda: ad.read_data_array_both(65536, out=out)
+
+
+@benchmark('replay.read_data_array.24bit', samples=65536)
+def _():
+    f = tempfile.NamedTemporaryFile(suffix='.raw')
+    f.write(array('i', (i * 97 & 0x7FFFFF for i in range(1 << 20))).tobytes())
+    f.flush()
+    backend = ReplayBackend(f.name)
+    ad = MCP3911(backend)
+    out = new_buffer(65536, 3)
+
+    def close():
+        backend.close()
+        f.close()
+    return lambda: ad.read_data_array(65536, out=out), close
+
+
+@benchmark('stream.16bit', samples=65536)
+def _():
+    ad = MCP3911(RawBackend(4096))
+    stream = ad.stream(4096, width=16, capacity=1 << 20, timeout=5)
+
+    def run():
+        for _ in range(16):
+            next(stream)
+    return run, stream.close
+
+
+@benchmark('register.from_bytes')
+def _():
+    data = bytes(ConfigReg())
+    return lambda: ConfigReg.from_bytes(data)
+
+
+@benchmark('register.to_string')
+def _():
+    reg = StatusComReg()
+    return reg.to_string
+
+
+@benchmark('spiadc.read_reg')
+def _():
+    ad = MCP3911(RawBackend(0))
+    return ad.read_reg_config
+
+
+@benchmark('spiadc.read_reg.cached')
+def _():
+    ad = MCP3911(RawBackend(0), cache=True)
+    return ad.read_reg_config
+
+
+@benchmark('spiadc.write_reg')
+def _():
+    ad = MCP3911(RawBackend(0))
+    reg = ConfigReg()
+    return lambda: ad.write_reg_config(reg)
+
+
+@benchmark('spiadc.update_reg.cached')
+def _():
+    ad = MCP3911(RawBackend(0), cache=True)
+    return lambda: ad.update_reg_config(osr=ConfigReg.Osr.osr128)
+
+
+def _startup(code: str):
+    """Run code in a fresh interpreter; the time includes interpreter startup, see startup.python"""
+    return lambda: subprocess.run([sys.executable, '-c', code], cwd=_ROOT, check=True)
+
+
+@benchmark('startup.python')
+def _():
+    return _startup('pass')
+
+
+@benchmark('startup.import_adc')
+def _():
+    return _startup('import adc')
+
+
+@benchmark('startup.import_registers')
+def _():
+    return _startup('import adc.mcp3911_register, adc.mcp3901_register')
+
+
+@benchmark('startup.import_mcp3911')
+def _():
+    return _startup('from adc import MCP3911')
+
+
+def measure(run, min_time: float, repeat: int) -> float:
+    """Best time of one call in seconds over repeat rounds of at least min_time seconds each"""
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            run()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            break
+        number *= 2
+
+    best = elapsed / number
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        for _ in range(number):
+            run()
+        best = min(best, (time.perf_counter() - start) / number)
+    return best
+
+
+def run_all(pattern: str = '', min_time: float = 0.05, repeat: int = 5) -> dict:
+    results = {}
+    for name, samples, setup in _BENCHMARKS:
+        if pattern not in name:
+            continue
+        run = setup()
+        if run is None:
+            continue
+        run, close = run if isinstance(run, tuple) else (run, None)
+        try:
+            seconds = measure(run, min_time, repeat)
+        finally:
+            if close is not None:
+                close()
+        result = {'ns_per_op': seconds * 1e9}
+        if samples:
+            result['samples_per_sec'] = samples / seconds
+            result['ns_per_sample'] = seconds * 1e9 / samples
+        results[name] = result
+    return results
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """Names of benchmarks slower than the baseline by more than tolerance, a fraction"""
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is not None and result['ns_per_op'] > base['ns_per_op'] * (1 + tolerance):
+            regressions.append(name)
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('pattern', nargs='?', default='', help='run only benchmarks whose name contains this')
+    parser.add_argument('--json', help='write the results to this file')
+    parser.add_argument('--save', nargs='?', const=_BASELINE, metavar='BASELINE',
+                        help='write the results as the baseline, benchmarks/baseline.json by default')
+    parser.add_argument('--compare', nargs='?', const=_BASELINE, metavar='BASELINE',
+                        help='compare with a baseline written by --save or --json, benchmarks/baseline.json by default')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed slowdown, 0.25 = 25%% (default)')
+    parser.add_argument('--min-time', type=float, default=0.05, help='seconds per round (default 0.05)')
+    parser.add_argument('--repeat', type=int, default=5, help='rounds per benchmark (default 5)')
+    args = parser.parse_args(argv)
+    if args.compare and not os.path.exists(args.compare):
+        parser.error('no baseline at {}; record one on this machine with --save'.format(args.compare))
+
+    results = run_all(args.pattern, args.min_time, args.repeat)
+    baseline = {}
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['results']
+    regressions = compare(results, baseline, args.tolerance)
+
+    for name, result in results.items():
+        line = '{:40} {:14.1f} ns/op'.format(name, result['ns_per_op'])
+        if 'samples_per_sec' in result:
+            line += ' {:14.0f} samples/s'.format(result['samples_per_sec'])
+        if name in baseline:
+            line += ' {:+7.1%}'.format(result['ns_per_op'] / baseline[name]['ns_per_op'] - 1)
+        if name in regressions:
+            line += '  REGRESSION'
+        print(line)
+
+    for path in filter(None, (args.json, args.save)):
+        with open(path, 'w') as f:
+            json.dump({'python': platform.python_version(), 'machine': platform.machine(),
+                       'results': results}, f, indent=2, sort_keys=True)
+            f.write('\n')
+
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,12 +1,11 @@
 #!/usr/bin/env python3
 
-import statistics
 import time
 
 import pigpio
 
 import adc.mcp3911_register as reg
-from adc import MCP3911, SPI_pigpio
+from adc import MCP3911, RunningStats, SPI_pigpio
 
 pi = pigpio.pi()
 SPI_CH = 0
@@ -36,14 +35,15 @@ print(ad.read_reg_config().to_string())
 
 time.sleep(0.1)
 
+stats = RunningStats()
 start = time.time()
-array = ad.read_data_array(15625, ch=0, width=16)
+array = ad.read_data_array(15625, ch=0, width=16, stats=stats)
 elapsed_time = time.time() - start
 
-avg = statistics.mean(array)
-minimum = min(array)
-maximum = max(array)
-st_dev = statistics.stdev(array)
+avg = stats.mean
+minimum = stats.min
+maximum = stats.max
+st_dev = stats.stdev
 st_dev_pct = st_dev / avg * 100
 
 print(array[:10])
@@ -52,6 +52,8 @@ print("min: {}".format(minimum))
 print("max: {}".format(maximum))
 print("standard dev: {}".format(st_dev))
 print("standard dev%: {}".format(st_dev_pct))
+print("rms: {}".format(stats.rms))
+print("clipped: {}".format(stats.clipped))
 print("elapsed: {} sec".format(elapsed_time))
 
 ad.close()
@@ -10,7 +10,8 @@ setup(
     author_email='mst.mizuta@gmail.com',
     url='https://github.com/masatomizuta/py-adc/',
     packages=['adc', 'adc.backends'],
-    ext_modules=[Extension('adc.backends.ext.spi_rpi', ['adc/backends/ext/spi_rpi.c'])],
+    ext_modules=[Extension('adc.backends.ext.spi_rpi', ['adc/backends/ext/spi_rpi.c'],
+                           extra_compile_args=['-pthread'], extra_link_args=['-pthread'])],
     install_requires=[
         'pigpio'
     ],